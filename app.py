@@ -1,17 +1,12 @@
 import streamlit as st
+import io
 import json
-import time
-import pandas as pd
-import gspread
-from google import genai
-from src.auth import get_service_account_creds, SCOPES
-from src.local import list_local_images, read_local_image
-from src.gemini import GeminiExtractor
-from src.sheets import HEADER
+import os
+import secrets
+from src.output import MIME_TYPES, SpoolWriter, UpsertWriter, parquet_available
 from src.config import Config
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
-import io
+from src.jobs import DONE, FAILED, STOPPED, STOPPING, JobRegistry
+from src.workqueue import WorkQueue
 
 st.set_page_config(
     page_title="Business Card Extractor",
@@ -50,8 +45,9 @@ with st.sidebar:
     gemini_key = st.text_input(
         "Gemini API Key",
         type="password",
-        value=Config.GEMINI_API_KEY or "",
-        help="Get from aistudio.google.com/app/apikey"
+        value=Config.GEMINI_API_KEYS or "",
+        help="Get from aistudio.google.com/app/apikey. "
+             "Separate several keys with commas to use them in parallel."
     )
 
     st.divider()
@@ -86,32 +82,141 @@ with st.sidebar:
             value=Config.DRIVE_FOLDER_ID or "",
             help="The ID from your folder URL"
         )
+        only_changes = st.checkbox(
+            "Only new or changed images",
+            value=False,
+            help="Read the folder's Drive change feed instead of listing "
+                 "every file. The first run lists the whole folder."
+        )
+        sync_sheet = st.checkbox(
+            "Update existing rows (sync)",
+            value=False,
+            help="Re-check every image and update its row in place when the "
+                 "data changed, instead of skipping or appending duplicates"
+        )
         local_folder_path = None
+        existing_csv_path = None
+        watch_folder = False
+        include_subfolders = False
     else:
-        st.info("📥 Output: Downloadable CSV")
+        st.info("📥 Output: Downloadable CSV, JSONL or Parquet")
         local_folder_path = st.text_input(
             "Local Folder Path",
             placeholder="/home/user/cards/",
             help="Absolute path to folder with images"
         )
+        include_subfolders = st.checkbox(
+            "Include subfolders",
+            value=Config.LOCAL_RECURSIVE,
+            help="Also extract images in subfolders, named by relative "
+                 "path (e.g. scans/card.jpg)"
+        )
+        existing_csv_path = st.text_input(
+            "Existing Output CSV (optional)",
+            placeholder="/home/user/extracted_business_cards.csv",
+            help="When resuming, images already in this CSV are skipped"
+        )
+        only_changes = st.checkbox(
+            "Only new or changed images",
+            value=False,
+            help="Skip images extracted by an earlier run (same size, "
+                 "modification time and content)"
+        )
+        watch_folder = st.checkbox(
+            "Watch folder for new cards",
+            value=False,
+            help="Keep running and extract each new image within seconds "
+                 "of it landing in the folder, until you press Stop"
+        )
         drive_folder_id = None
         uploaded_sa = None
         sheet_title = None
+        sync_sheet = False
+
+    retry_failures = st.checkbox(
+        "Retry failed images only",
+        value=False,
+        help="Skip listing the source: re-process only images that failed in "
+             "earlier runs to the same output, with increasing delays, until "
+             f"they succeed or have failed {Config.FAILURE_MAX_ATTEMPTS} times"
+    )
 
-# --- Main Content ---
-col1, col2 = st.columns([2, 1])
+    st.divider()
 
-with col1:
-    st.subheader("📊 Extraction Progress")
-    progress_container = st.empty()
-    log_container = st.empty()
+    # Throughput
+    st.subheader("⚡ Performance")
+    max_workers = st.number_input(
+        "Parallel workers",
+        min_value=1, max_value=32,
+        value=Config.MAX_WORKERS,
+        help="Number of cards processed at the same time"
+    )
+    # Several keys: their KEY_RPM budgets add up
+    key_count = len({key.strip() for key in gemini_key.replace("\n", ",").split(",")
+                     if key.strip()})
+    requests_per_minute = st.number_input(
+        "Requests per minute",
+        min_value=1, max_value=4000,
+        value=(Config.KEY_RPM * key_count if key_count > 1
+               else Config.REQUESTS_PER_MINUTE),
+        help="Gemini requests allowed per minute for your API key. With "
+             "several keys, the overall limit (at most KEY_RPM per key)"
+    )
+    batch_size = st.number_input(
+        "Cards per request",
+        min_value=1, max_value=16,
+        value=Config.BATCH_SIZE,
+        help="Pack several cards into one Gemini request (saves RPM quota)"
+    )
+    adaptive_rate = st.checkbox(
+        "Adaptive rate control",
+        value=True,
+        help="On 429 errors, slow down and retry instead of stopping the run"
+    )
+    use_cache = st.checkbox(
+        "Reuse cached results",
+        value=True,
+        help="Skip Gemini for images already extracted with the same model and prompt"
+    )
+    downscale_images = st.checkbox(
+        "Downscale images before upload",
+        value=True,
+        help=f"Fix rotation, shrink to {Config.PREPROCESS_MAX_EDGE}px and "
+             f"re-encode as {Config.PREPROCESS_FORMAT} to save bandwidth"
+    )
+    resume_run = st.checkbox(
+        "Resume (skip already extracted images)",
+        value=True,
+        help="Skip images already in the target sheet / existing CSV"
+    )
 
-with col2:
-    st.subheader("📈 Stats")
-    stats_container = st.empty()
+    skip_duplicates = st.checkbox(
+        "Skip near-duplicate photos",
+        value=False,
+        help="Reuse the first result for repeated photos of the same card. "
+             "Very similar templated cards may be treated as duplicates."
+    )
+    cascade = st.checkbox(
+        "Escalate doubtful cards",
+        value=Config.CASCADE,
+        help=f"Re-run cards with missing or malformed fields on "
+             f"{Config.ESCALATION_MODEL} (slower, more accurate)"
+    )
+    context_cache = st.checkbox(
+        "Cache the prompt on Gemini",
+        value=Config.CONTEXT_CACHE,
+        help="Send the extraction instructions, with a detailed field guide "
+             "and examples, once as cached content instead of with every "
+             "request"
+    )
+
+@st.cache_resource
+def job_registry():
+    """Shared by all sessions, so jobs outlive reruns and page refreshes."""
+    return JobRegistry(keep_finished=Config.KEEP_FINISHED_JOBS)
 
-# Download placeholder
-download_container = st.empty()
+
+registry = job_registry()
 
 # --- Start Button ---
 if st.button("🚀 Start Extraction", type="primary", use_container_width=True):
@@ -130,129 +235,321 @@ if st.button("🚀 Start Extraction", type="primary", use_container_width=True):
         st.stop()
 
     try:
-        # Initialize Gemini with user-provided API key
-        gemini = GeminiExtractor(api_key=gemini_key)
-
-        # Storage for extracted data (used for Local mode CSV)
-        extracted_rows = []
-
-        # --- DRIVE MODE: Use Google Sheets ---
-        if source_mode == "Google Drive":
-            # Parse Service Account
-            credentials_dict = None
-            if uploaded_sa:
-                credentials_dict = json.load(uploaded_sa)
-
-            creds = get_service_account_creds(credentials_dict)
-
-            # Initialize Sheet
-            client = gspread.authorize(creds)
-            sheet = client.open(sheet_title).sheet1
-
-            # Ensure headers
-            first_row = sheet.row_values(1)
-            if first_row != HEADER:
-                sheet.insert_row(HEADER, 1)
-
-            # Get images from Drive
-            drive_service = build('drive', 'v3', credentials=creds)
-            query = f"'{drive_folder_id}' in parents and (mimeType contains 'image/')"
-            results = drive_service.files().list(q=query, pageSize=1000,
-                                                 fields="files(id, name)").execute()
-            images = results.get('files', [])
-
-        # --- LOCAL MODE: Collect for CSV ---
-        else:
-            images = list_local_images(local_folder_path)
-
-        total = len(images)
-        processed = 0
-        errors = 0
-
-        progress_bar = progress_container.progress(0, text="Starting...")
-        log_area = log_container.empty()
-        logs = []
-
-        for i, img in enumerate(images):
-            file_name = img['name']
-            file_id = img['id']
-
-            try:
-                # Download/Read image
-                if source_mode == "Google Drive":
-                    request = drive_service.files().get_media(fileId=file_id)
-                    file_io = io.BytesIO()
-                    downloader = MediaIoBaseDownload(file_io, request)
-                    done = False
-                    while not done:
-                        status, done = downloader.next_chunk()
-                    image_bytes = file_io.getvalue()
-                else:
-                    image_bytes = read_local_image(file_id)
-
-                # Extract with Gemini
-                data = gemini.extract_data(image_bytes, file_name)
-
-                if data:
-                    row = [
-                        data.get("fileName", ""),
-                        data.get("fullName", ""),
-                        data.get("jobTitle", ""),
-                        data.get("companyName", ""),
-                        data.get("primaryEmail", ""),
-                        data.get("contactPhone", ""),
-                        data.get("websiteURL", ""),
-                        data.get("physicalAddress", "")
-                    ]
-
-                    if source_mode == "Google Drive":
-                        sheet.append_row(row)
-                    else:
-                        extracted_rows.append(row)
-
-                    processed += 1
-                    logs.append(f"✅ {file_name}")
-                else:
-                    errors += 1
-                    logs.append(f"⚠️ {file_name} - No data extracted")
-
-                # Rate limit protection
-                time.sleep(2)
-
-            except ResourceWarning:
-                st.error("Quota exceeded! Stopping to preserve data.")
-                break
-            except Exception as e:
-                errors += 1
-                logs.append(f"❌ {file_name}: {str(e)[:50]}")
-
-            # Update UI
-            progress = (i + 1) / total
-            progress_bar.progress(
-                progress, text=f"Processing {i+1}/{total}...")
-            log_area.text_area("Log", "\n".join(logs[-10:]), height=200)
-            stats_container.metric(
-                "Processed", f"{processed}/{total}", delta=f"{errors} errors")
-
-        st.success(f"✅ Completed! Processed {processed}/{total} images.")
-
-        # --- LOCAL MODE: Show Download Button ---
-        if source_mode == "Local Folder" and extracted_rows:
-            df = pd.DataFrame(extracted_rows, columns=HEADER)
-            # Quote ALL fields to prevent commas from breaking columns
-            csv = df.to_csv(index=False, quoting=1).encode(
-                'utf-8')  # 1 = csv.QUOTE_ALL
-
-            download_container.download_button(
-                label="📥 Download CSV",
-                data=csv,
-                file_name="extracted_business_cards.csv",
+        # Imported on first use: loads the Gemini SDK (and Google APIs for
+        # Drive/Sheets runs) only once an extraction actually starts
+        from src.runner import build_job
+
+        # Parse Service Account
+        credentials_dict = None
+        if uploaded_sa:
+            credentials_dict = json.load(uploaded_sa)
+
+        # Drive mode writes to Google Sheets; Local mode keeps rows for CSV
+        job = build_job(
+            gemini_key,
+            local_folder=local_folder_path,
+            drive_folder_id=drive_folder_id,
+            credentials_dict=credentials_dict,
+            sheet_title=sheet_title,
+            existing_csv=existing_csv_path,
+            workers=max_workers,
+            rpm=requests_per_minute,
+            batch_size=batch_size,
+            use_cache=use_cache,
+            downscale=downscale_images,
+            resume=resume_run,
+            adaptive=adaptive_rate,
+            dedupe=skip_duplicates,
+            sync=sync_sheet,
+            incremental=only_changes,
+            watch=watch_folder,
+            context_cache=context_cache,
+            cascade=cascade,
+            retry_failures=retry_failures,
+            recursive=include_subfolders
+        )
+    except Exception as e:
+        st.error(f"Error: {e}")
+        st.stop()
+
+    # The job runs on its own thread; this page only polls its status
+    background = registry.start(
+        job, label=drive_folder_id or local_folder_path,
+        log_lines=Config.JOB_LOG_LINES)
+    st.session_state["job_id"] = background.id
+    st.query_params["job"] = background.id
+
+# --- Shared Work Queue (filled and processed by worker.py) ---
+@st.cache_resource
+def work_queue(path):
+    return WorkQueue(path, lease_seconds=Config.QUEUE_LEASE_SECONDS,
+                     max_attempts=Config.QUEUE_MAX_ATTEMPTS)
+
+
+@st.fragment(run_every=Config.UI_REFRESH_SECONDS)
+def show_queue(path):
+    # Progress comes from the queue, so it covers every worker process
+    queue = work_queue(path)
+    counts = queue.counts()
+    total = sum(counts.values())
+    finished = counts["done"] + counts["failed"]
+    st.progress(finished / max(total, 1),
+                text=f"{finished}/{total} finished across all workers")
+    cols = st.columns(4)
+    for col, (state, count) in zip(cols, counts.items()):
+        col.metric(state.title(), count)
+    workers = queue.workers()
+    if workers:
+        st.caption("Active workers: " + ", ".join(
+            f"{worker} ({leased} leased)" for worker, leased in sorted(workers.items())))
+    failures = queue.failures(10)
+    if failures:
+        st.caption("Recent failures: " + "; ".join(
+            f"{name}: {error}" for name, _, error in failures))
+
+
+if st.toggle("Watch a shared work queue", value=False,
+             help="Follow a folder split between several worker.py processes"):
+    queue_path = st.text_input("Queue file", value=Config.QUEUE_PATH)
+    if os.path.exists(queue_path):
+        show_queue(queue_path)
+    else:
+        st.caption("No queue there yet. Fill one with "
+                   "`python worker.py fill --local FOLDER`.")
+
+# --- Job Selection (survives reruns; ?job=<id> survives refreshes) ---
+jobs = registry.list()
+if not jobs:
+    st.stop()
+
+job_ids = [j.id for j in jobs]
+current_id = st.session_state.get("job_id") or st.query_params.get("job")
+job_id = st.selectbox(
+    "Job",
+    job_ids,
+    index=job_ids.index(current_id) if current_id in job_ids else 0,
+    # Label must not change while the job runs, or the selection resets
+    format_func=lambda i: f"{i} · {registry.get(i).label}"
+)
+st.session_state["job_id"] = job_id
+st.query_params["job"] = job_id
+background = registry.get(job_id)
+
+
+def show_stats(snapshot):
+    import pandas as pd
+    st.metric("Processed", f"{snapshot['processed']}/{snapshot['total_label']}",
+              delta=f"{snapshot['errors']} errors")
+    if snapshot["duplicates"]:
+        st.metric("Duplicates skipped", snapshot["duplicates"])
+    if "cache" in snapshot:
+        st.metric("Cache hits / misses",
+                  f"{snapshot['cache']['hits']} / {snapshot['cache']['misses']}")
+    if "bytes_saved" in snapshot:
+        st.metric("Upload saved", f"{snapshot['bytes_saved'] / 1048576:.1f} MB")
+    if "rate" in snapshot:
+        rate = snapshot["rate"]
+        st.metric("Current rate", f"{rate['rpm']:.0f} RPM",
+                  delta=f"{rate['retries']} retries",
+                  delta_color="inverse")
+        st.caption(f"Throttled {rate['throttle_seconds']:.0f}s · "
+                   f"{rate['concurrency']} concurrent")
+    if "keys" in snapshot:
+        st.caption("API keys: " + " · ".join(
+            f"{k['id']} {k['status']} ({k['day_calls']} today)"
+            for k in snapshot["keys"]))
+    if "sync" in snapshot:
+        sync = snapshot["sync"]
+        st.caption(f"Sheet: {sync['appended']} appended · {sync['updated']} "
+                   f"updated · {sync['unchanged']} unchanged")
+    failures = snapshot.get("failures")
+    if failures and (failures["retrying"] or failures["dead"]):
+        st.caption(f"Failed images: {failures['retrying']} to retry · "
+                   f"{failures['dead']} given up")
+    tokens = snapshot["tokens"]
+    if tokens["total"]:
+        cached = f" ({tokens['cached']:,} cached)" if tokens["cached"] else ""
+        st.metric("Tokens used", f"{tokens['total']:,}",
+                  delta=f"{tokens['prompt']:,} in{cached} / {tokens['output']:,} out",
+                  delta_color="off")
+    if snapshot["stages"]:
+        st.dataframe(pd.DataFrame(snapshot["stages"]).set_index("stage"),
+                     use_container_width=True)
+    if snapshot["tiers"]:
+        st.dataframe(pd.DataFrame(snapshot["tiers"]).set_index("model"),
+                     use_container_width=True)
+
+
+# Spool exports are served by Streamlit's static file route (see
+# .streamlit/config.toml), which streams them from disk, so a large
+# download is never held in memory
+EXPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          "static", "exports")
+MAX_STATIC_FILE_BYTES = 200 * 1024 * 1024  # Larger static files get a 404
+
+
+@st.cache_resource
+def spool_exports():
+    """(job id, format) -> exported file name, shared by all sessions."""
+    return {}
+
+
+def export_spool(spool, fmt, job_id):
+    """
+    Exports a job's spool into EXPORT_DIR under an unguessable name and
+    returns the name. Exports of jobs that left the registry are removed.
+    """
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    exports = spool_exports()
+    for key, old in list(exports.items()):
+        if key == (job_id, fmt) or registry.get(key[0]) is None:
+            path = os.path.join(EXPORT_DIR, old)
+            if os.path.exists(path):
+                os.remove(path)
+            del exports[key]
+    name = f"{secrets.token_urlsafe(16)}.{fmt}"
+    spool.export(os.path.join(EXPORT_DIR, name), fmt)
+    exports[(job_id, fmt)] = name
+    return name
+
+
+def show_export_link(name, fmt):
+    path = os.path.join(EXPORT_DIR, name)
+    if (not st.get_option("server.enableStaticServing")
+            or os.path.getsize(path) > MAX_STATIC_FILE_BYTES):
+        st.info(f"📁 Exported to {path}")
+        return
+    st.markdown(
+        f'<a href="app/static/exports/{name}" '
+        f'download="extracted_business_cards.{fmt}" type="{MIME_TYPES[fmt]}">'
+        f'📥 Download {fmt.upper()}</a>',
+        unsafe_allow_html=True)
+
+
+def show_results(background, snapshot):
+    """Final messages and downloads of a finished job."""
+    job = background.job
+
+    # Final flush failed: never lose buffered rows
+    if snapshot["unsaved_path"]:
+        st.warning(
+            f"Could not write all rows to the sheet ({snapshot['write_error']}). "
+            f"Saved them to {snapshot['unsaved_path']}.")
+        with open(snapshot["unsaved_path"], "rb") as f:
+            st.download_button(
+                label="📥 Download Unsaved Rows",
+                data=f.read(),
+                file_name="unsaved_rows.csv",
                 mime="text/csv",
-                type="primary",
                 use_container_width=True
             )
 
+    if snapshot["state"] == FAILED:
+        st.error(f"Error: {snapshot['error']}")
+    elif snapshot["state"] == STOPPED:
+        st.info(f"⏹️ Stopped after {snapshot['processed']} images.")
+    else:
+        st.success(
+            f"✅ Completed! Processed {snapshot['processed']}/"
+            f"{snapshot['total_label']} images.")
+
+    # --- LOCAL MODE: Download from the on-disk spool ---
+    spool = job.writer
+    if isinstance(spool, UpsertWriter):
+        spool = spool.writer
+    if isinstance(spool, SpoolWriter) and os.path.exists(spool.path):
+        formats = ["csv", "jsonl"] + (["parquet"] if parquet_available() else [])
+        fmt = st.radio("Download format", formats, horizontal=True,
+                       format_func=str.upper, key=f"format-{background.id}")
+        st.caption(f"Rows are saved to {spool.path} as they complete.")
+
+        # Exported from the spool only when asked for
+        name = spool_exports().get((background.id, fmt))
+        if not (name and os.path.exists(os.path.join(EXPORT_DIR, name))):
+            name = None
+            if st.button(f"📦 Prepare {fmt.upper()} Download", type="primary",
+                         use_container_width=True,
+                         key=f"export-{background.id}-{fmt}"):
+                name = export_spool(spool, fmt, background.id)
+        if name:
+            show_export_link(name, fmt)
+
+    # Images that failed every attempt, for a manual look
+    failures = snapshot.get("failures")
+    if failures and failures["dead"]:
+        def dead_letter_csv():
+            buffer = io.StringIO()
+            job.failures.write(buffer)
+            return buffer.getvalue()
+
+        st.download_button(
+            label=f"📥 Download {failures['dead']} Failed Images",
+            data=dead_letter_csv,
+            file_name="failed_images.csv",
+            mime="text/csv",
+            use_container_width=True,
+            key=f"failures-{background.id}"
+        )
+
+    celebrated = st.session_state.setdefault("celebrated", set())
+    if snapshot["state"] == DONE and background.id not in celebrated:
+        celebrated.add(background.id)
         st.balloons()
 
-    except Exception as e:
-        st.error(f"Error: {e}")
+
+# Only this fragment reruns while the job is going, at a fixed rate,
+# however fast results arrive
+@st.fragment(run_every=Config.UI_REFRESH_SECONDS if background.running else None)
+def show_job():
+    snapshot = background.snapshot()
+
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        st.subheader("📊 Extraction Progress")
+        if snapshot["skipped"]:
+            st.info(f"⏭️ Resuming: skipped {snapshot['skipped']} already "
+                    f"extracted images.")
+        if snapshot["quota_exceeded"]:
+            # Daily quota (or retries) exhausted: in-flight cards still
+            # finish; no new ones are started
+            st.error("Quota exceeded! Stopping to preserve data.")
+        st.progress(min(snapshot["progress"], 1.0),
+                    text=f"Processing {snapshot['completed']}/"
+                         f"{snapshot['total_label']}... ({snapshot['state']})")
+        st.text_area("Log", "\n".join(reversed(snapshot["logs"])), height=200)
+        if background.running:
+            if st.button("⏹️ Stop", disabled=snapshot["state"] == STOPPING):
+                background.stop()
+
+    with col2:
+        st.subheader("📈 Stats")
+        show_stats(snapshot)
+
+    if background.running:
+        return
+    if st.session_state.get("polling") == background.id:
+        # Just finished: rerun the page once so polling stops
+        st.session_state["polling"] = None
+        st.rerun()
+
+    with col2:
+        import pandas as pd
+        # Where the time went: per-stage latency histograms + export
+        metrics = background.job.metrics
+        histograms = metrics.stage_histograms()
+        if histograms:
+            st.caption("Calls per latency bucket")
+            st.bar_chart(pd.DataFrame(histograms).fillna(0), sort=False)
+        st.download_button("📥 Metrics (Prometheus)", metrics.to_prometheus(),
+                           file_name="metrics.prom", mime="text/plain",
+                           use_container_width=True)
+        st.download_button("📥 Metrics (JSON)", metrics.to_json(),
+                           file_name="metrics.json",
+                           mime="application/json",
+                           use_container_width=True)
+    show_results(background, snapshot)
+
+
+if background.running:
+    st.session_state["polling"] = background.id
+show_job()
@@ -0,0 +1,258 @@
+"""
+Offline throughput benchmark for the extraction loop.
+
+Runs the real pipeline (Drive listing and downloads, preprocessing, rate
+control, batched sheet writes) against the in-process fakes in
+src/fakes.py, over a grid of folder sizes and worker counts, and writes
+cards per minute, p50/p95 card latency and peak memory to a JSON file.
+Compare against an earlier run with --baseline to catch regressions.
+
+Examples:
+    python benchmark.py
+    python benchmark.py --sizes 100 500 --workers 4 8 16 --latency 0.5
+    python benchmark.py --error-rate 0.05 --output after.json --baseline before.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from PIL import Image, ImageDraw
+
+from src.drive import download_file, iter_folder_images
+from src.contextcache import ContextCache
+from src.fakes import FakeDriveService, FakeGenaiClient, FakeWorksheet
+from src.gemini import GeminiExtractor
+from src.pipeline import ExtractionPipeline, STATUS_OK
+from src.preprocess import ImagePreprocessor
+from src.ratecontrol import AdaptiveRateController
+from src.runner import ExtractionJob
+from src.sheets import BufferedSheetWriter
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the extraction loop against local fakes.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 200],
+                        help="Folder sizes (number of cards)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4, 8],
+                        help="Worker counts")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="Cards per Gemini request")
+    parser.add_argument("--rpm", type=int, default=6000,
+                        help="Starting requests per minute")
+    parser.add_argument("--latency", type=float, default=0.2,
+                        help="Gemini call latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.1,
+                        help="Extra random latency per Gemini call, in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Fraction of Gemini calls answered with a 429")
+    parser.add_argument("--retry-after", type=float, default=0.2,
+                        help="Retry delay suggested by injected 429s (also "
+                             "used as the first backoff delay)")
+    parser.add_argument("--drive-latency", type=float, default=0.02,
+                        help="Latency per Drive list/download request")
+    parser.add_argument("--sheet-latency", type=float, default=0.1,
+                        help="Latency per sheet write")
+    parser.add_argument("--page-size", type=int, default=100,
+                        help="Largest Drive listing page")
+    parser.add_argument("--image-size", type=int, nargs=2, default=[2000, 1200],
+                        metavar=("WIDTH", "HEIGHT"),
+                        help="Synthetic card image size in pixels")
+    parser.add_argument("--no-downscale", action="store_true",
+                        help="Skip image preprocessing")
+    parser.add_argument("--context-cache", action="store_true",
+                        help="Send the system instruction as cached content")
+    parser.add_argument("--hard-rate", type=float, default=0.0,
+                        help="Share of cards the fast model gets wrong")
+    parser.add_argument("--escalation-model", metavar="MODEL",
+                        help="Re-run cards failing validation on this model")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="benchmark.json",
+                        help="JSON file for the results")
+    parser.add_argument("--baseline", metavar="JSON",
+                        help="Earlier results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="Allowed cards/min drop vs. baseline (0.1 = 10%%)")
+    return parser.parse_args(argv)
+
+
+def make_card_images(count, size, seed=1):
+    """Returns {file name: JPEG bytes} of distinct synthetic cards."""
+    rng = random.Random(seed)
+    width, height = size
+    images = {}
+    for i in range(count):
+        img = Image.new("RGB", size, (rng.randrange(200, 256),) * 3)
+        draw = ImageDraw.Draw(img)
+        for _ in range(40):
+            x, y = rng.randrange(width), rng.randrange(height)
+            color = tuple(rng.randrange(256) for _ in range(3))
+            draw.rectangle([x, y, x + rng.randrange(20, 300),
+                            y + rng.randrange(5, 60)], fill=color)
+        draw.text((width // 10, height // 2), f"Card {i}", fill="black")
+        buffer = io.BytesIO()
+        img.save(buffer, "JPEG", quality=90)
+        images[f"card_{i:05d}.jpg"] = buffer.getvalue()
+    return images
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, round(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def run_case(args, images, workers):
+    """Runs one folder through the pipeline; returns its measurements."""
+    drive = FakeDriveService(images, page_size=args.page_size,
+                             latency=args.drive_latency, seed=args.seed)
+    client = FakeGenaiClient(latency=args.latency, jitter=args.jitter,
+                             error_rate=args.error_rate,
+                             retry_after=args.retry_after, seed=args.seed,
+                             hard_rate=args.hard_rate)
+    sheet = FakeWorksheet(latency=args.sheet_latency, seed=args.seed)
+
+    started = {}
+
+    def load_image(image):
+        started[image['name']] = time.perf_counter()
+        return download_file(drive, image['id'])
+
+    preprocessor = None if args.no_downscale else ImagePreprocessor()
+    pipeline = ExtractionPipeline(
+        GeminiExtractor(
+            client=client,
+            context_cache=ContextCache() if args.context_cache else None,
+            escalation_model=args.escalation_model),
+        load_image,
+        workers=workers,
+        prefetch=workers * 2,
+        preprocess=preprocessor,
+        batch_size=args.batch_size,
+        rate_control=AdaptiveRateController(
+            rpm=args.rpm, concurrency=workers, base_delay=args.retry_after)
+    )
+    job = ExtractionJob(pipeline,
+                        iter_folder_images(drive, drive.folder_id),
+                        BufferedSheetWriter(sheet))
+
+    latencies = []
+    tracemalloc.start()
+    start = time.perf_counter()
+    for result in job.run():
+        if result.status == STATUS_OK:
+            latencies.append(time.perf_counter() - started[result.file_name])
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    rate = pipeline.rate.stats()
+    return {
+        "cards": len(images),
+        "workers": workers,
+        "batch_size": args.batch_size,
+        "processed": job.processed,
+        "errors": job.errors,
+        "seconds": round(seconds, 3),
+        "cards_per_minute": round(job.processed / seconds * 60, 1),
+        "latency_p50": round(percentile(latencies, 50), 3),
+        "latency_p95": round(percentile(latencies, 95), 3),
+        "peak_memory_mb": round(peak / 1048576, 1),
+        "model_calls": client.models.calls,
+        "throttled": client.models.throttled,
+        "retries": rate["retries"],
+        "sheet_writes": sheet.writes,
+        "sheet_rows": len(sheet.rows),
+        "tokens": pipeline.metrics.tokens["total"],
+        "prompt_tokens": pipeline.metrics.tokens["prompt"],
+        "cached_tokens": pipeline.metrics.tokens["cached"],
+        "tiers": {row["model"]: {"cards": row["cards"], "valid": row["valid"],
+                                 "p50": row["p50 (s)"], "p95": row["p95 (s)"]}
+                  for row in pipeline.metrics.tier_rows()},
+        "stages": {row["stage"]: {"p50": row["p50 (s)"], "p95": row["p95 (s)"],
+                                  "total": row["total (s)"]}
+                   for row in pipeline.metrics.stage_rows()},
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+            text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, baseline_path, tolerance):
+    """Prints cards/min vs. a baseline; returns the number of regressions."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    previous = {(r["cards"], r["workers"], r["batch_size"]): r
+                for r in baseline.get("results", [])}
+
+    regressions = 0
+    for result in results:
+        key = (result["cards"], result["workers"], result["batch_size"])
+        old = previous.get(key)
+        if not old or not old["cards_per_minute"]:
+            continue
+        change = result["cards_per_minute"] / old["cards_per_minute"] - 1
+        flag = ""
+        if change < -tolerance:
+            regressions += 1
+            flag = "  <-- REGRESSION"
+        print(f"{key[0]:>6} cards, {key[1]:>2} workers: "
+              f"{old['cards_per_minute']:>8.1f} -> {result['cards_per_minute']:>8.1f} "
+              f"cards/min ({change:+.0%}){flag}")
+    return regressions
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    all_images = make_card_images(max(args.sizes), args.image_size, args.seed)
+
+    results = []
+    for size in args.sizes:
+        images = dict(list(all_images.items())[:size])
+        for workers in args.workers:
+            result = run_case(args, images, workers)
+            results.append(result)
+            print(f"{size:>6} cards, {workers:>2} workers: "
+                  f"{result['cards_per_minute']:>8.1f} cards/min, "
+                  f"p50 {result['latency_p50']:.2f}s, "
+                  f"p95 {result['latency_p95']:.2f}s, "
+                  f"peak {result['peak_memory_mb']:.1f} MB, "
+                  f"{result['errors']} errors")
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "settings": {k: v for k, v in vars(args).items()
+                     if k not in ("output", "baseline", "tolerance")},
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        return 1 if compare(results, args.baseline, args.tolerance) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
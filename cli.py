@@ -0,0 +1,277 @@
+"""
+Headless batch runner: extract a local or Drive folder without a browser.
+
+Examples:
+    python cli.py --local /home/user/cards --output cards.jsonl
+    python cli.py --drive FOLDER_ID --output cards.csv --workers 8 --rpm 60
+    python cli.py --drive FOLDER_ID --sheet "Business Card Data Extractor"
+    python cli.py --local /home/user/cards --output cards.csv --bulk
+    python cli.py --local /srv/scanner --output cards.csv --watch
+"""
+import argparse
+import json
+import os
+import sys
+from src.config import Config
+from src.metrics import Metrics
+from src.output import load_output_file_names, open_writer
+from src.pipeline import (STATUS_DUPLICATE, STATUS_EMPTY, STATUS_ERROR, STATUS_OK,
+                          STATUS_QUOTA)
+from src.resume import filter_pending
+from src.runner import build_job, create_extractor, open_source
+from src.preprocess import ImagePreprocessor
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Extract business card data from a folder of images.")
+
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--local", metavar="FOLDER",
+                        help="Local folder with card images")
+    source.add_argument("--drive", metavar="FOLDER_ID",
+                        help="Google Drive folder ID")
+
+    output = parser.add_mutually_exclusive_group(required=True)
+    output.add_argument("--output", metavar="PATH",
+                        help="Output file (.csv, .jsonl or .parquet), appended "
+                             "to as rows complete")
+    output.add_argument("--sheet", metavar="TITLE",
+                        help="Google Sheet title to append rows to")
+
+    parser.add_argument("--format", choices=["csv", "jsonl", "parquet"],
+                        help="Output format (default: from --output extension)")
+    parser.add_argument("--recursive", action="store_true",
+                        default=Config.LOCAL_RECURSIVE,
+                        help="With --local: include images in subfolders "
+                             "(default: LOCAL_RECURSIVE)")
+    parser.add_argument("--api-key", default=Config.GEMINI_API_KEYS,
+                        help="Gemini API key, or several comma-separated keys "
+                             "to use as a pool (default: GEMINI_API_KEYS / GEMINI_API_KEY)")
+    parser.add_argument("--service-account", metavar="JSON",
+                        help="Service account JSON file (default: SERVICE_ACCOUNT_FILE)")
+    parser.add_argument("--workers", type=int, default=Config.MAX_WORKERS)
+    parser.add_argument("--rpm", type=int,
+                        help="Gemini requests per minute (default: "
+                             "REQUESTS_PER_MINUTE, or KEY_RPM per key with "
+                             "several keys, which it can lower but not raise)")
+    parser.add_argument("--batch-size", type=int, default=Config.BATCH_SIZE,
+                        help="Cards per Gemini request")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Do not reuse cached extraction results")
+    parser.add_argument("--no-downscale", action="store_true",
+                        help="Send original images without preprocessing")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="Process images already present in the output")
+    parser.add_argument("--no-adaptive", action="store_true",
+                        help="Stop on the first 429 instead of backing off")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only process images added or changed since the "
+                             "last run to the same output (Drive Changes feed, "
+                             "or a file index for --local)")
+    parser.add_argument("--watch", action="store_true",
+                        help="With --local: keep running and extract new images "
+                             "as they land in the folder (Ctrl+C to stop)")
+    parser.add_argument("--retry-failures", action="store_true",
+                        help="Only re-process images that failed in earlier runs "
+                             "to the same output, with backoff (Ctrl+C to stop)")
+    parser.add_argument("--export-failures", metavar="PATH",
+                        help="After the run, write images that failed every "
+                             "attempt to a CSV (or .jsonl) file")
+    parser.add_argument("--sync", action="store_true",
+                        help="With --sheet: update rows by fileName instead of "
+                             "skipping or appending (re-checks every image)")
+    parser.add_argument("--dedupe", action="store_true",
+                        help="Reuse the first result for near-duplicate photos")
+    parser.add_argument("--context-cache", action="store_true",
+                        default=Config.CONTEXT_CACHE,
+                        help="Send the extraction instructions, with a detailed "
+                             "field guide and examples, as Gemini cached content "
+                             "instead of with every request (default: CONTEXT_CACHE)")
+    parser.add_argument("--cascade", action="store_true", default=Config.CASCADE,
+                        help="Re-run cards whose result fails validation on "
+                             "ESCALATION_MODEL (default: CASCADE)")
+    parser.add_argument("--bulk", action="store_true",
+                        help="Use an offline Gemini batch job (cheaper, slower)")
+    parser.add_argument("--poll-interval", type=int, default=60,
+                        help="Seconds between batch job status checks (--bulk)")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="Write stage timings and token usage at the end "
+                             "(.json, otherwise Prometheus text format)")
+    parser.add_argument("--quiet", action="store_true",
+                        help="Only print the final summary")
+    return parser.parse_args(argv)
+
+
+def load_credentials_dict(path):
+    if not path:
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def run_bulk(args):
+    """Runs the whole folder as one Gemini batch job."""
+    if not args.output:
+        print("--bulk requires --output", file=sys.stderr)
+        return 1
+
+    if args.incremental or args.watch or args.retry_failures:
+        print("--bulk cannot be combined with --incremental, --watch or "
+              "--retry-failures", file=sys.stderr)
+        return 1
+
+    images, load_image, _ = open_source(
+        args.local, args.drive, load_credentials_dict(args.service_account),
+        args.recursive)
+    images = list(images)
+    if not args.no_resume:
+        images, skipped = filter_pending(
+            images, load_output_file_names(args.output, args.format))
+        if skipped:
+            print(f"Resuming: skipped {skipped} already extracted images.")
+    if not images:
+        print(f"Nothing to extract -> {args.output}")
+        return 0
+
+    preprocessor = None if args.no_downscale else ImagePreprocessor(
+        max_edge=Config.PREPROCESS_MAX_EDGE,
+        fmt=Config.PREPROCESS_FORMAT,
+        quality=Config.PREPROCESS_QUALITY
+    )
+    request_path = os.path.splitext(args.output)[0] + ".requests.jsonl"
+    metrics = Metrics()
+    gemini = create_extractor(args.api_key, metrics)
+    try:
+        results = gemini.extract_bulk(
+            images, load_image, request_path,
+            poll_interval=args.poll_interval, preprocess=preprocessor)
+    finally:
+        if preprocessor:
+            preprocessor.close()
+
+    writer = open_writer(args.output, args.format)
+    errors = 0
+    try:
+        for file_name, row in results:
+            if row:
+                writer.add(row)
+                metrics.record_result(STATUS_OK)
+            else:
+                errors += 1
+                metrics.record_result(STATUS_ERROR)
+    finally:
+        writer.close()
+
+    print(f"Done: {len(results) - errors}/{len(results)} extracted, "
+          f"{errors} errors -> {args.output}")
+    if args.metrics:
+        print(f"Metrics written to {metrics.write(args.metrics)}")
+    return 0
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.api_key:
+        print("A Gemini API key is required (--api-key or GEMINI_API_KEY)",
+              file=sys.stderr)
+        return 1
+
+    if args.bulk:
+        return run_bulk(args)
+
+    job = build_job(
+        args.api_key,
+        local_folder=args.local,
+        drive_folder_id=args.drive,
+        credentials_dict=load_credentials_dict(args.service_account),
+        sheet_title=args.sheet,
+        output_path=args.output,
+        output_format=args.format,
+        workers=args.workers,
+        rpm=args.rpm,
+        batch_size=args.batch_size,
+        use_cache=not args.no_cache,
+        downscale=not args.no_downscale,
+        resume=not args.no_resume,
+        adaptive=not args.no_adaptive,
+        dedupe=args.dedupe,
+        sync=args.sync,
+        incremental=args.incremental,
+        watch=args.watch,
+        context_cache=args.context_cache,
+        cascade=args.cascade,
+        retry_failures=args.retry_failures,
+        recursive=args.recursive
+    )
+    if job.skipped:
+        print(f"Resuming: skipped {job.skipped} already extracted images.")
+
+    results = job.run()
+    try:
+        for result in results:
+            if args.quiet:
+                continue
+            prefix = f"[{job.completed}/{job.total_label}]"
+            if result.status == STATUS_OK:
+                suffix = " (cached)" if result.cached else ""
+                print(f"{prefix} OK {result.file_name}{suffix}")
+            elif result.status == STATUS_DUPLICATE:
+                print(f"{prefix} DUPLICATE {result.file_name} of {result.duplicate_of}")
+            elif result.status == STATUS_EMPTY:
+                print(f"{prefix} EMPTY {result.file_name}")
+            elif result.status == STATUS_QUOTA:
+                print(f"{prefix} QUOTA {result.file_name} - stopping")
+            else:
+                print(f"{prefix} ERROR {result.file_name}: {result.error}")
+    except KeyboardInterrupt:
+        if not (args.watch or args.retry_failures):
+            raise
+        # Closing the run flushes the rows written so far
+        results.close()
+        print("Stopped.")
+
+    print(f"Done: {job.processed}/{job.known_total} extracted, {job.errors} errors.")
+    if job.duplicates:
+        print(f"Near-duplicates reused: {job.duplicates}")
+    failures = job.failures.counts()
+    if failures["retrying"] or failures["dead"]:
+        print(f"Failed images: {failures['retrying']} to retry "
+              f"(--retry-failures), {failures['dead']} given up")
+    if args.export_failures:
+        count = job.failures.export(args.export_failures)
+        print(f"Wrote {count} failed images to {args.export_failures}")
+    if hasattr(job.writer, "rows_updated"):
+        print(f"Sheet sync: {job.writer.rows_appended} appended, "
+              f"{job.writer.rows_updated} updated, "
+              f"{job.writer.rows_unchanged} unchanged")
+    print("Stage timings: " + ", ".join(
+        f"{row['stage']} p50 {row['p50 (s)']}s / p95 {row['p95 (s)']}s"
+        for row in job.metrics.stage_rows()))
+    tiers = job.metrics.tier_rows()
+    if tiers:
+        print("Model tiers: " + ", ".join(
+            f"{row['model']} {row['valid']}/{row['cards']} valid "
+            f"(p50 {row['p50 (s)']}s / p95 {row['p95 (s)']}s)"
+            for row in tiers))
+    tokens = job.metrics.tokens
+    if tokens["total"]:
+        cached = f", {tokens['cached']} cached" if tokens["cached"] else ""
+        print(f"Tokens: {tokens['total']} ({tokens['prompt']} in, "
+              f"{tokens['output']} out{cached})")
+    if args.metrics:
+        print(f"Metrics written to {job.metrics.write(args.metrics)}")
+    if job.rate_control:
+        stats = job.rate_control.stats()
+        print(f"Rate control: {stats['retries']} retries, "
+              f"{stats['throttle_seconds']:.0f}s throttled, "
+              f"final rate {stats['rpm']:.0f} RPM")
+    if job.unsaved_path:
+        print(f"Could not write all rows ({job.write_error}); "
+              f"saved them to {job.unsaved_path}", file=sys.stderr)
+        return 1
+    return 2 if job.quota_exceeded else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
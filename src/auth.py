@@ -1,6 +1,6 @@
+import hashlib
+import json
 import os
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
 from src.config import Config
 
 SCOPES = [
@@ -8,6 +8,19 @@ SCOPES = [
     'https://www.googleapis.com/auth/spreadsheets'
 ]
 
+def credentials_fingerprint(credentials_dict=None):
+    """
+    Identifies a set of service account credentials without exposing them:
+    a hash of the uploaded JSON, or of the key file's path and mtime.
+    """
+    if credentials_dict:
+        payload = json.dumps(credentials_dict, sort_keys=True)
+    else:
+        path = Config.SERVICE_ACCOUNT_FILE or ""
+        mtime = os.path.getmtime(path) if path and os.path.exists(path) else 0
+        payload = f"{path}:{mtime}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
 def get_service_account_creds(credentials_dict=None):
     """
     Authenticates using Service Account credentials.
@@ -15,6 +28,9 @@ def get_service_account_creds(credentials_dict=None):
     Args:
         credentials_dict: Optional dict from uploaded JSON. If None, falls back to file.
     """
+    # Imported here so local-folder runs never load the Google auth stack
+    from google.oauth2 import service_account
+
     try:
         if credentials_dict:
             # Use uploaded credentials (from Streamlit file uploader)
@@ -31,10 +47,19 @@ def get_service_account_creds(credentials_dict=None):
         print(f"Error loading service account credentials: {e}")
         raise
 
+def build_service(name, version, creds):
+    """
+    Builds a Google API service from the discovery document bundled with
+    google-api-python-client, instead of fetching it over the network.
+    """
+    from googleapiclient.discovery import build
+    return build(name, version, credentials=creds,
+                 static_discovery=True, cache_discovery=False)
+
 def get_drive_service():
     """Returns an authenticated Google Drive service instance."""
     creds = get_service_account_creds()
-    return build('drive', 'v3', credentials=creds)
+    return build_service('drive', 'v3', creds)
 
 def get_sheets_service():
     """Returns an authenticated Google Sheets service instance."""
@@ -42,4 +67,4 @@ def get_sheets_service():
     # For this project, gspread handles auth internally via credentials object, 
     # so we might just expose the credentials for gspread to use.
     creds = get_service_account_creds()
-    return build('sheets', 'v4', credentials=creds)
+    return build_service('sheets', 'v4', creds)
@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+def hash_bytes(data):
+    """Returns the SHA-256 hex digest of a bytes object."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class ExtractionCache:
+    """
+    Persistent, content-addressed cache of extraction results (SQLite).
+
+    Entries are keyed by the SHA-256 of the image bytes plus the extractor
+    fingerprint (model name, system instruction and schema), so changing
+    the prompt or model never returns stale data.
+
+    Args:
+        cache_dir: Directory holding the cache database.
+        max_entries: Maximum number of entries kept (None = unlimited).
+        max_bytes: Maximum total size of stored results (None = unlimited).
+        max_age: Maximum entry age in seconds (None = never expires).
+    """
+
+    EVICT_EVERY = 100  # Run eviction every N writes
+
+    def __init__(self, cache_dir, max_entries=None, max_bytes=None, max_age=None):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, "extractions.sqlite3")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS extractions (
+                key TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+        self.evict()
+
+    @staticmethod
+    def make_key(image_bytes, fingerprint):
+        """Builds the cache key for an image and extractor fingerprint."""
+        return f"{hash_bytes(image_bytes)}:{fingerprint}"
+
+    def get(self, key):
+        """Returns the cached data dict for `key`, or None on a miss."""
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT data, created FROM extractions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.max_age and now - row[1] > self.max_age):
+                self.misses += 1
+                return None
+            self.conn.execute(
+                "UPDATE extractions SET accessed = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, data):
+        """Stores an extraction result."""
+        payload = json.dumps(data)
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO extractions VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload), now, now)
+            )
+            self.conn.commit()
+            self._writes += 1
+            evict = self._writes % self.EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    def evict(self):
+        """Removes expired entries, then the least recently used ones."""
+        with self.lock:
+            if self.max_age:
+                self.conn.execute(
+                    "DELETE FROM extractions WHERE created < ?",
+                    (time.time() - self.max_age,)
+                )
+            if self.max_entries:
+                self.conn.execute("""
+                    DELETE FROM extractions WHERE key IN (
+                        SELECT key FROM extractions
+                        ORDER BY accessed DESC LIMIT -1 OFFSET ?
+                    )
+                """, (self.max_entries,))
+            if self.max_bytes:
+                total = self.conn.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM extractions"
+                ).fetchone()[0]
+                if total > self.max_bytes:
+                    rows = self.conn.execute(
+                        "SELECT key, size FROM extractions ORDER BY accessed ASC"
+                    ).fetchall()
+                    stale = []
+                    for key, size in rows:
+                        if total <= self.max_bytes:
+                            break
+                        stale.append((key,))
+                        total -= size
+                    self.conn.executemany(
+                        "DELETE FROM extractions WHERE key = ?", stale)
+            self.conn.commit()
+
+    def stats(self):
+        """Returns hit/miss counters and current size."""
+        with self.lock:
+            entries, size = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM extractions"
+            ).fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": entries,
+            "bytes": size,
+        }
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
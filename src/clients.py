@@ -0,0 +1,76 @@
+"""
+Process-wide cache of API clients, so repeated runs (and Streamlit
+reruns) reuse authenticated clients instead of rebuilding them. Entries
+are keyed by a fingerprint of the credentials, never the secrets
+themselves. Google libraries are imported on first use only.
+"""
+import hashlib
+import threading
+
+from src.auth import credentials_fingerprint, get_service_account_creds
+
+_clients = {}
+_lock = threading.RLock()  # Factories may fetch other cached clients
+
+
+def _cached(key, factory):
+    with _lock:
+        if key not in _clients:
+            _clients[key] = factory()
+        return _clients[key]
+
+
+def clear():
+    """Drops all cached clients (e.g. after credentials were rotated)."""
+    with _lock:
+        _clients.clear()
+
+
+def service_account_creds(credentials_dict=None):
+    """Service account credentials for an uploaded JSON or the key file."""
+    fingerprint = credentials_fingerprint(credentials_dict)
+    return _cached(("creds", fingerprint),
+                   lambda: get_service_account_creds(credentials_dict))
+
+
+def gspread_client(credentials_dict=None):
+    """Authorized gspread client for a service account."""
+    import gspread
+    fingerprint = credentials_fingerprint(credentials_dict)
+    return _cached(("gspread", fingerprint),
+                   lambda: gspread.authorize(service_account_creds(credentials_dict)))
+
+
+def spreadsheet(credentials_dict, title):
+    """Spreadsheet opened by title (a Drive search, so worth caching)."""
+    fingerprint = credentials_fingerprint(credentials_dict)
+    return _cached(("spreadsheet", fingerprint, title),
+                   lambda: gspread_client(credentials_dict).open(title))
+
+
+def drive_downloader(credentials_dict=None):
+    """DriveDownloader whose pool of Drive services is kept between runs."""
+    from src.drive import DriveDownloader
+    fingerprint = credentials_fingerprint(credentials_dict)
+    return _cached(("drive", fingerprint),
+                   lambda: DriveDownloader(service_account_creds(credentials_dict)))
+
+
+def gemini_client(api_key):
+    """genai.Client for an API key."""
+    from google import genai
+    key_hash = hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+    return _cached(("gemini", key_hash), lambda: genai.Client(api_key=api_key))
+
+
+def context_cache():
+    """
+    ContextCache shared by all runs, so they reuse each key's cached
+    instruction instead of creating a new one per run.
+    """
+    from src.config import Config
+    from src.contextcache import ContextCache
+    return _cached(("context_cache",),
+                   lambda: ContextCache(Config.CONTEXT_CACHE_TTL,
+                                        Config.CONTEXT_CACHE_REFRESH,
+                                        Config.CONTEXT_CACHE_MIN_TOKENS))
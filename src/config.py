@@ -12,10 +12,94 @@ class Config:
     This class exists only for backward compatibility.
     """
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+    # Optional comma-separated list of keys used together as a pool
+    GEMINI_API_KEYS = os.getenv("GEMINI_API_KEYS") or GEMINI_API_KEY
     SERVICE_ACCOUNT_FILE = os.getenv("SERVICE_ACCOUNT_FILE")
     DRIVE_FOLDER_ID = os.getenv("DRIVE_FOLDER_ID")
     SHEET_TITLE = os.getenv("SHEET_TITLE", "Business Card Data Extractor")
 
+    # Extraction throughput
+    MAX_WORKERS = int(os.getenv("MAX_WORKERS", "4"))
+    REQUESTS_PER_MINUTE = int(os.getenv("REQUESTS_PER_MINUTE", "15"))
+    BATCH_SIZE = int(os.getenv("BATCH_SIZE", "1"))
+
+    # Adaptive rate control (back off on 429s instead of stopping)
+    MAX_REQUESTS_PER_MINUTE = int(os.getenv("MAX_REQUESTS_PER_MINUTE", "0")) or None
+    MAX_RETRIES = int(os.getenv("MAX_RETRIES", "6"))
+
+    # Per-key quota budgets when several API keys are pooled
+    KEY_RPM = int(os.getenv("KEY_RPM", "15"))
+    KEY_RPD = int(os.getenv("KEY_RPD", "1000"))
+
+    # Extraction result cache
+    CACHE_DIR = os.getenv("CACHE_DIR", ".cache")
+    CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "100000"))
+    CACHE_MAX_MB = int(os.getenv("CACHE_MAX_MB", "200"))
+    CACHE_MAX_AGE_DAYS = int(os.getenv("CACHE_MAX_AGE_DAYS", "90"))
+
+    # Image preprocessing before upload
+    PREPROCESS_MAX_EDGE = int(os.getenv("PREPROCESS_MAX_EDGE", "1600"))
+    PREPROCESS_FORMAT = os.getenv("PREPROCESS_FORMAT", "JPEG")
+    PREPROCESS_QUALITY = int(os.getenv("PREPROCESS_QUALITY", "85"))
+
+    # Resume checkpoints
+    CHECKPOINT_DIR = os.getenv(
+        "CHECKPOINT_DIR", os.path.join(CACHE_DIR, "checkpoints"))
+
+    # Background jobs in the web UI
+    UI_REFRESH_SECONDS = float(os.getenv("UI_REFRESH_SECONDS", "1.0"))
+    JOB_LOG_LINES = int(os.getenv("JOB_LOG_LINES", "200"))
+    KEEP_FINISHED_JOBS = int(os.getenv("KEEP_FINISHED_JOBS", "5"))
+
+    # Context caching of the system instruction (Gemini cached content)
+    CONTEXT_CACHE = os.getenv("CONTEXT_CACHE", "false").lower() in ("1", "true", "yes")
+    CONTEXT_CACHE_TTL = int(os.getenv("CONTEXT_CACHE_TTL", "3600"))
+    CONTEXT_CACHE_REFRESH = int(os.getenv("CONTEXT_CACHE_REFRESH", "300"))
+    # Gemini's minimum cacheable size (tokens) for the models in use
+    CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("CONTEXT_CACHE_MIN_TOKENS", "1024"))
+
+    # Model cascade: re-run cards that fail validation on a stronger model
+    CASCADE = os.getenv("CASCADE", "false").lower() in ("1", "true", "yes")
+    ESCALATION_MODEL = os.getenv("ESCALATION_MODEL", "gemini-2.5-flash")
+
+    # Near-duplicate detection: max differing bits of the 256-bit dHash
+    DEDUPE_RADIUS = int(os.getenv("DEDUPE_RADIUS", "10"))
+
+    # Saved Drive Changes feed positions for incremental runs
+    DRIVE_SYNC_DIR = os.getenv(
+        "DRIVE_SYNC_DIR", os.path.join(CACHE_DIR, "drive_sync"))
+
+    # Include subfolders of local folders (files are named by relative path)
+    LOCAL_RECURSIVE = os.getenv("LOCAL_RECURSIVE", "false").lower() in ("1", "true", "yes")
+
+    # Index of extracted local files (incremental scans and watch mode)
+    LOCAL_INDEX_PATH = os.getenv(
+        "LOCAL_INDEX_PATH", os.path.join(CACHE_DIR, "local_index.sqlite3"))
+    WATCH_POLL_SECONDS = float(os.getenv("WATCH_POLL_SECONDS", "2.0"))
+    # Known images checked per poll for in-place overwrites (0 = off)
+    WATCH_SWEEP_FILES = int(os.getenv("WATCH_SWEEP_FILES", "200"))
+
+    # Ledger of failed images, for retry-failures-only runs
+    FAILURE_LEDGER_PATH = os.getenv(
+        "FAILURE_LEDGER_PATH", os.path.join(CACHE_DIR, "failures.sqlite3"))
+    FAILURE_MAX_ATTEMPTS = int(os.getenv("FAILURE_MAX_ATTEMPTS", "3"))
+    FAILURE_RETRY_SECONDS = float(os.getenv("FAILURE_RETRY_SECONDS", "30"))
+    FAILURE_RETRY_MAX_SECONDS = float(os.getenv("FAILURE_RETRY_MAX_SECONDS", "3600"))
+
+    # On-disk spool for local-mode results
+    SPOOL_DIR = os.getenv("SPOOL_DIR", os.path.join(CACHE_DIR, "spool"))
+
+    # Shared work queue for several worker processes (worker.py)
+    QUEUE_PATH = os.getenv("QUEUE_PATH", os.path.join(CACHE_DIR, "queue.sqlite3"))
+    QUEUE_LEASE_SECONDS = int(os.getenv("QUEUE_LEASE_SECONDS", "300"))
+    QUEUE_MAX_ATTEMPTS = int(os.getenv("QUEUE_MAX_ATTEMPTS", "3"))
+    # Seconds a worker waits for another worker's lock on the queue file
+    QUEUE_BUSY_TIMEOUT = float(os.getenv("QUEUE_BUSY_TIMEOUT", "60"))
+
+    # Persisted per-key usage for the API key pool
+    KEY_USAGE_FILE = os.getenv(
+        "KEY_USAGE_FILE", os.path.join(CACHE_DIR, "key_usage.json"))
+
     @staticmethod
     def validate():
         """
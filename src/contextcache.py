@@ -0,0 +1,146 @@
+import threading
+import time
+
+# Rough characters per token for English prompt text
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    """Approximate token count of a prompt, without an API call."""
+    return len(text) // CHARS_PER_TOKEN
+
+
+class ContextCache:
+    """
+    Keeps the extractor's system instruction in Gemini cached content,
+    so requests reference it by name instead of resending it. Cached
+    content belongs to an API key's project, so there is one entry per
+    client. Entries are created on first use; their TTL is extended once
+    they are within `refresh_margin` seconds of expiring, and they are
+    recreated if the server no longer has them.
+
+    Gemini only caches content above a model-specific minimum (1024
+    tokens for the 2.5 Flash models). GeminiExtractor adds its extraction
+    guide to the instruction it caches, which takes it past that. A
+    shorter instruction is not sent for caching: caching is switched off
+    once, with a log line, and requests carry the instruction inline. If
+    creating an entry fails for another reason, caching is switched off
+    the same way. The response schema is a per-request setting and
+    is always sent with the request.
+
+    Creating and extending entries are API calls; they run outside the
+    lock, so other requests are not held up. Requests that arrive while
+    an entry is being created send the instruction inline.
+
+    Args:
+        ttl_seconds: Lifetime requested for each cache entry.
+        refresh_margin: Extend entries this long before they expire.
+        min_tokens: Smallest instruction (estimated tokens) worth caching.
+    """
+
+    def __init__(self, ttl_seconds=3600, refresh_margin=300, min_tokens=0):
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin = min(refresh_margin, ttl_seconds / 2)
+        self.min_tokens = min_tokens
+        self.entries = {}  # (id(client), fingerprint) -> (name, expires_at)
+        self.busy = set()  # Keys being created or extended
+        self.lock = threading.Lock()
+        self.disabled = None  # Why caching was switched off, if it was
+        self.created = 0
+        self.refreshed = 0
+        self.fallbacks = 0
+
+    def _disable(self, reason):
+        with self.lock:
+            if self.disabled:
+                return
+            self.disabled = reason
+        print(f"Context caching disabled, sending the prompt inline: {reason}")
+
+    def name_for(self, client, model, system_instruction, fingerprint):
+        """
+        Returns the cached content name to use with `client`, creating or
+        extending the entry as needed; None when caching is off or the
+        entry is not ready yet.
+        """
+        if self.disabled:
+            return None
+        tokens = estimate_tokens(system_instruction)
+        if tokens < self.min_tokens:
+            self._disable(f"the instruction is about {tokens} tokens, below "
+                          f"the {self.min_tokens} tokens Gemini needs to cache it")
+            return None
+
+        key = (id(client), fingerprint)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[1] - now > self.refresh_margin:
+                return entry[0]
+            if key in self.busy:
+                # Another request is creating or extending it
+                return entry[0] if entry and entry[1] > now else None
+            self.busy.add(key)
+        try:
+            return self._refresh(client, model, system_instruction,
+                                 fingerprint, key, entry)
+        finally:
+            with self.lock:
+                self.busy.discard(key)
+
+    def _refresh(self, client, model, system_instruction, fingerprint, key,
+                 entry):
+        """Extends `entry`, or creates a new one. Called without the lock."""
+        from google.genai import types
+        from src.gemini import is_quota_error
+
+        now = time.time()
+        try:
+            if entry:
+                try:
+                    client.caches.update(
+                        name=entry[0],
+                        config=types.UpdateCachedContentConfig(
+                            ttl=f"{self.ttl_seconds}s"))
+                    with self.lock:
+                        self.entries[key] = (entry[0], now + self.ttl_seconds)
+                        self.refreshed += 1
+                    return entry[0]
+                except Exception as e:
+                    if is_quota_error(str(e)):
+                        raise
+                    # Expired or deleted: create a new one below
+                    print(f"Could not extend cached content {entry[0]}: {e}")
+            cached = client.caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    display_name=f"business-card-extractor-{fingerprint}",
+                    system_instruction=system_instruction,
+                    ttl=f"{self.ttl_seconds}s"))
+        except Exception as e:
+            if is_quota_error(str(e)):
+                # Try again on a later request
+                with self.lock:
+                    self.fallbacks += 1
+                return None
+            self._disable(str(e))
+            return None
+        with self.lock:
+            self.entries[key] = (cached.name, now + self.ttl_seconds)
+            self.created += 1
+        return cached.name
+
+    def invalidate(self, client, fingerprint):
+        """Forgets an entry the server rejected, so it is recreated."""
+        with self.lock:
+            self.entries.pop((id(client), fingerprint), None)
+            self.fallbacks += 1
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "created": self.created,
+            "refreshed": self.refreshed,
+            "fallbacks": self.fallbacks,
+            "disabled": self.disabled,
+        }
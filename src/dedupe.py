@@ -0,0 +1,129 @@
+import io
+import threading
+from PIL import Image, ImageOps
+
+
+def dhash(image_bytes, hash_size=16):
+    """
+    Difference hash of an image as an int of hash_size * hash_size bits.
+    Robust to re-encoding, resizing and small lighting changes, so two
+    photos/uploads of the same card get nearby hashes.
+    """
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        # Let JPEG decode at reduced size; we only need a thumbnail
+        img.draft("L", (hash_size * 4, hash_size * 4))
+        img = ImageOps.exif_transpose(img).convert("L")
+        img = img.resize((hash_size + 1, hash_size), Image.LANCZOS)
+        pixels = img.tobytes()
+
+    value = 0
+    width = hash_size + 1
+    for row in range(hash_size):
+        offset = row * width
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming(a, b):
+    """Number of differing bits between two hashes."""
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over Hamming distance. Radius queries only visit
+    subtrees that can contain matches, instead of comparing every pair.
+    """
+
+    def __init__(self):
+        self.root = None  # (hash, value, {distance: child})
+        self.size = 0
+
+    def add(self, hash_value, value):
+        node = (hash_value, value, {})
+        self.size += 1
+        if self.root is None:
+            self.root = node
+            return
+        current = self.root
+        while True:
+            distance = hamming(hash_value, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, hash_value, radius):
+        """Returns [(distance, value)] within `radius`, closest first."""
+        if self.root is None:
+            return []
+        matches = []
+        stack = [self.root]
+        while stack:
+            node_hash, value, children = stack.pop()
+            distance = hamming(hash_value, node_hash)
+            if distance <= radius:
+                matches.append((distance, value))
+            # Triangle inequality: only these children can be in range
+            for child_distance, child in children.items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+        return sorted(matches, key=lambda m: m[0])
+
+
+class NearDuplicateIndex:
+    """
+    Finds images whose perceptual hash is within `radius` bits of an
+    image seen earlier in the run, and keeps the first copy's extracted
+    row so duplicates can reuse it.
+    """
+
+    def __init__(self, radius=10, hash_size=16):
+        self.radius = radius
+        self.hash_size = hash_size
+        self.tree = BKTree()
+        self.names = {}  # original index -> file name
+        self.rows = {}  # original index -> extracted row
+        self.quota_skipped = set()  # originals not extracted for quota
+        self.duplicates = 0
+        self.lock = threading.Lock()
+
+    def hash(self, image_bytes):
+        return dhash(image_bytes, self.hash_size)
+
+    def match(self, hash_value, index, file_name):
+        """
+        Returns the index of an earlier near-identical image, or None after
+        registering this image as an original.
+        """
+        with self.lock:
+            matches = self.tree.search(hash_value, self.radius)
+            if matches:
+                self.duplicates += 1
+                return matches[0][1]
+            self.tree.add(hash_value, index)
+            self.names[index] = file_name
+            return None
+
+    def set_row(self, index, row):
+        """Stores the extracted row of an original image."""
+        with self.lock:
+            if index in self.names:
+                self.rows[index] = row
+
+    def set_quota_skipped(self, index):
+        """Records an original that was not extracted because of the quota."""
+        with self.lock:
+            if index in self.names:
+                self.quota_skipped.add(index)
+
+    def is_quota_skipped(self, index):
+        with self.lock:
+            return index in self.quota_skipped
+
+    def original(self, index):
+        """Returns (file_name, row) of an original; row is None if it failed."""
+        with self.lock:
+            return self.names.get(index), self.rows.get(index)
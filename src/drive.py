@@ -1,26 +1,258 @@
+from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaIoBaseDownload
-from src.auth import get_drive_service
+from src.auth import build_service, get_drive_service
 from src.config import Config
+import hashlib
 import io
+import json
+import os
+import queue
+
+IMAGE_QUERY = "'{folder_id}' in parents and (mimeType contains 'image/')"
+
+CHANGE_FIELDS = ("nextPageToken, newStartPageToken, changes(fileId, removed, "
+                 "file(id, name, mimeType, parents, trashed))")
+
+# Statuses Drive answers a page token it no longer accepts with
+EXPIRED_TOKEN_STATUSES = (400, 404, 410)
+
+def iter_folder_images(service, folder_id, page_size=1000):
+    """
+    Yields image files in a Drive folder, following nextPageToken so
+    folders of any size are listed completely. Files from the first page
+    are available before later pages are fetched.
+    Yields dicts: {'id': file_id, 'name': file_name, 'mimeType': ...}
+    """
+    page_token = None
+    while True:
+        results = service.files().list(
+            q=IMAGE_QUERY.format(folder_id=folder_id),
+            pageSize=page_size,
+            pageToken=page_token,
+            fields="nextPageToken, files(id, name, mimeType)"
+        ).execute()
+        yield from results.get('files', [])
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return
+
+def get_start_page_token(service):
+    """Returns the Changes feed position for changes made from now on."""
+    return service.changes().getStartPageToken().execute()['startPageToken']
+
+def iter_changed_images(service, folder_id, page_token, state, page_size=1000):
+    """
+    Yields image files in a Drive folder that were added, modified or
+    moved in since `page_token`, following the Changes feed page by
+    page. Removed and trashed files are skipped. When the feed is
+    exhausted, state['start_page_token'] holds the token for next time.
+    """
+    seen = set()
+    while page_token:
+        results = service.changes().list(
+            pageToken=page_token,
+            pageSize=page_size,
+            spaces='drive',
+            fields=CHANGE_FIELDS
+        ).execute()
+        for change in results.get('changes', []):
+            file = change.get('file')
+            if change.get('removed') or not file or file.get('trashed'):
+                continue
+            if folder_id not in file.get('parents', []):
+                continue
+            if not file.get('mimeType', '').startswith('image/'):
+                continue
+            if file['id'] in seen:
+                continue
+            seen.add(file['id'])
+            yield {'id': file['id'], 'name': file['name'],
+                   'mimeType': file['mimeType']}
+        page_token = results.get('nextPageToken')
+        if 'newStartPageToken' in results:
+            state['start_page_token'] = results['newStartPageToken']
+
+def download_file(service, file_id):
+    """
+    Downloads a Drive file's content as bytes.
+    Note: Drive service objects are not thread-safe, use one per thread.
+    """
+    request = service.files().get_media(fileId=file_id)
+    file_io = io.BytesIO()
+    downloader = MediaIoBaseDownload(file_io, request)
+
+    done = False
+    while done is False:
+        status, done = downloader.next_chunk()
+
+    return file_io.getvalue()
+
+class DriveDownloader:
+    """
+    Callable that downloads an image dict's bytes, safe to use from many
+    threads. Drive services are not thread-safe, so each download borrows
+    a service from a pool and returns it afterwards; services are built
+    on demand and reused across runs when the downloader is cached.
+    """
+
+    def __init__(self, creds):
+        self.creds = creds
+        self.services = queue.SimpleQueue()
+
+    def acquire(self):
+        """Borrows an idle Drive service, building one if none is free."""
+        try:
+            return self.services.get_nowait()
+        except queue.Empty:
+            return build_service('drive', 'v3', self.creds)
+
+    def release(self, service):
+        self.services.put(service)
+
+    def __call__(self, image):
+        service = self.acquire()
+        try:
+            return download_file(service, image['id'])
+        finally:
+            self.release(service)
+
+    def iter_folder_images(self, folder_id):
+        """Lists a folder with a borrowed service, returned when done."""
+        service = self.acquire()
+        try:
+            yield from iter_folder_images(service, folder_id)
+        finally:
+            self.release(service)
+
+    def folder_changes(self, folder_id, state_path):
+        """FolderChanges listing of a folder, borrowing this pool's services."""
+        return FolderChanges(self, folder_id, state_path)
+
+class FolderChanges:
+    """
+    Iterable listing only the images added or modified in a Drive folder
+    since the last completed run, read from the Changes feed instead of
+    listing the whole folder.
+
+    The feed position (startPageToken) is kept in a small JSON file at
+    `state_path`. Iterating does not move it; call commit() once the
+    listed images have been processed and their rows written, so an
+    interrupted run lists the same delta again (images that failed are
+    retried from the failure ledger, not by holding the position back).
+    Without a saved token, or when Drive no longer accepts it, the whole
+    folder is listed (full_listing is then True).
+
+    Args:
+        drive: A DriveDownloader (its service pool is borrowed).
+        folder_id: Drive folder to watch.
+        state_path: JSON file holding the saved token.
+    """
+
+    def __init__(self, drive, folder_id, state_path):
+        self.drive = drive
+        self.folder_id = folder_id
+        self.state_path = state_path
+        self.saved_token = None
+        if os.path.exists(state_path):
+            with open(state_path) as f:
+                self.saved_token = json.load(f).get('start_page_token')
+        self.state = {}
+        self.full_listing = self.saved_token is None
+
+    @staticmethod
+    def state_path_for(state_dir, folder_id, target, credentials_key=""):
+        """
+        State file for a (folder, output target) pair. Change feeds are
+        per account, so the credentials fingerprint is part of the key.
+        """
+        os.makedirs(state_dir, exist_ok=True)
+        key = hashlib.sha1(
+            f"{folder_id}|{target}|{credentials_key}".encode("utf-8")).hexdigest()[:16]
+        return os.path.join(state_dir, f"{key}.json")
+
+    def __iter__(self):
+        service = self.drive.acquire()
+        try:
+            if not self.full_listing:
+                changed = iter_changed_images(
+                    service, self.folder_id, self.saved_token, self.state)
+                try:
+                    first = next(changed, None)
+                except HttpError as e:
+                    # A rejected token fails before the first image. Later
+                    # errors are raised: falling back then would list
+                    # images that were already handed out a second time
+                    if e.resp.status not in EXPIRED_TOKEN_STATUSES:
+                        raise
+                    print(f"Saved Drive change token rejected ({e.resp.status}); "
+                          f"listing the whole folder.")
+                    self.full_listing = True
+                else:
+                    if first is not None:
+                        yield first
+                        yield from changed
+                    return
+            # Take the token before listing, so nothing added during the
+            # listing is missed next time
+            self.state['start_page_token'] = get_start_page_token(service)
+            yield from iter_folder_images(service, self.folder_id)
+        finally:
+            self.drive.release(service)
+
+    def pending(self, done_names):
+        """
+        Iterates the listing, skipping images whose name is in
+        `done_names` only when the whole folder is listed. Images from
+        the Changes feed were added or modified since the last run, so
+        they are extracted again even if the output has an older row.
+        """
+        for image in self:
+            if self.full_listing and image['name'] in done_names:
+                continue
+            yield image
+
+    def commit(self):
+        """Saves the feed position reached by a completed listing."""
+        token = self.state.get('start_page_token')
+        if not token:
+            return
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({'folder_id': self.folder_id, 'start_page_token': token}, f)
+        os.replace(tmp_path, self.state_path)
+        self.saved_token = token
 
 class DriveManager:
     def __init__(self):
         self.service = get_drive_service()
         self.folder_id = Config.DRIVE_FOLDER_ID
 
+    def iter_images(self):
+        """
+        Yields image files in the configured Drive folder, page by page.
+        """
+        return iter_folder_images(self.service, self.folder_id)
+
+    def iter_new_images(self, state_path):
+        """
+        Returns a FolderChanges listing of the images added or modified
+        since its last commit(); the whole folder on first use.
+        """
+        return FolderChanges(self, self.folder_id, state_path)
+
+    def acquire(self):
+        return self.service
+
+    def release(self, service):
+        pass
+
     def list_images(self):
         """
         Lists all image files in the configured Drive folder.
         Returns a list of dicts: {'id': file_id, 'name': file_name}
         """
-        query = f"'{self.folder_id}' in parents and (mimeType contains 'image/')"
         try:
-            results = self.service.files().list(
-                q=query,
-                pageSize=1000, 
-                fields="nextPageToken, files(id, name, mimeType)"
-            ).execute()
-            items = results.get('files', [])
+            items = list(self.iter_images())
             print(f"Found {len(items)} image files.")
             return items
         except Exception as e:
@@ -32,16 +264,7 @@ class DriveManager:
         Downloads an image file as bytes.
         """
         try:
-            request = self.service.files().get_media(fileId=file_id)
-            file_io = io.BytesIO()
-            downloader = MediaIoBaseDownload(file_io, request)
-            
-            done = False
-            while done is False:
-                status, done = downloader.next_chunk()
-                # print(f"Download {int(status.progress() * 100)}% for {file_name}.")
-            
-            return file_io.getvalue()
+            return download_file(self.service, file_id)
         except Exception as e:
             print(f"Error downloading {file_name}: {e}")
             raise
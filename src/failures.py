@@ -0,0 +1,197 @@
+import csv
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from src.pipeline import STATUS_DUPLICATE, STATUS_EMPTY, STATUS_ERROR, STATUS_OK
+
+RETRYING = "retrying"
+DEAD = "dead"
+
+# Columns of the dead-letter export
+EXPORT_FIELDS = ["fileName", "fileId", "errorClass", "attempts", "lastError",
+                 "firstFailed", "lastFailed"]
+
+MAX_ERROR_LENGTH = 2000
+
+
+def error_class(result):
+    """Short error type for a failed PipelineResult."""
+    if result.error is not None:
+        return type(result.error).__name__
+    return "NoData" if result.status == STATUS_EMPTY else result.status
+
+
+def format_time(timestamp):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp))
+
+
+class FailureLedger:
+    """
+    Persistent record (SQLite) of images that failed to extract: file id,
+    error class, attempts and the last error, kept per `scope` (source
+    and output), like LocalIndex.
+
+    A failed image is retried no earlier than `base_delay` seconds after
+    its first failure, doubling with each further failure up to
+    `max_delay`. After `max_attempts` failures it is dead: retry runs
+    leave it alone, and export() writes it out for a manual look. An
+    image that later extracts fine is removed from the ledger. After
+    close(), the read methods still work, each on a short-lived
+    connection, so a finished job can still report and export.
+
+    Args:
+        path: Ledger database file (created if missing).
+        scope: Key separating runs with different sources or outputs.
+        max_attempts: Failures before an image is given up on.
+        base_delay: Seconds before the first retry.
+        max_delay: Cap on the delay between retries.
+    """
+
+    def __init__(self, path, scope="", max_attempts=3, base_delay=30.0,
+                 max_delay=3600.0):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.scope = scope
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS failures (
+                scope TEXT NOT NULL,
+                id TEXT NOT NULL,
+                name TEXT NOT NULL,
+                image TEXT NOT NULL,
+                state TEXT NOT NULL,
+                error_class TEXT NOT NULL,
+                error TEXT,
+                attempts INTEGER NOT NULL,
+                first_failed REAL NOT NULL,
+                last_failed REAL NOT NULL,
+                next_retry REAL NOT NULL,
+                PRIMARY KEY (scope, id)
+            )
+        """)
+        self.conn.commit()
+
+    def delay(self, attempts):
+        """Seconds to wait after the `attempts`-th failure."""
+        return min(self.base_delay * 2 ** (attempts - 1), self.max_delay)
+
+    def record(self, result):
+        """
+        Updates the ledger from a PipelineResult: failures are added or
+        counted, successes removed. Quota stops are not the image's
+        fault and are ignored.
+        """
+        image = result.image
+        if result.status in (STATUS_OK, STATUS_DUPLICATE):
+            with self.lock:
+                self.conn.execute(
+                    "DELETE FROM failures WHERE scope = ? AND id = ?",
+                    (self.scope, image['id']))
+                self.conn.commit()
+            return
+        if result.status not in (STATUS_ERROR, STATUS_EMPTY):
+            return
+
+        now = time.time()
+        error = str(result.error)[:MAX_ERROR_LENGTH] if result.error else None
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT attempts, first_failed FROM failures "
+                "WHERE scope = ? AND id = ?", (self.scope, image['id'])).fetchone()
+            attempts, first_failed = (row[0] + 1, row[1]) if row else (1, now)
+            state = DEAD if attempts >= self.max_attempts else RETRYING
+            self.conn.execute(
+                "INSERT OR REPLACE INTO failures VALUES "
+                "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.scope, image['id'], image['name'],
+                 json.dumps(image, default=str), state, error_class(result),
+                 error, attempts, first_failed, now,
+                 now + self.delay(attempts)))
+            self.conn.commit()
+
+    def _read(self, query, params):
+        """Runs a SELECT and returns all rows."""
+        with self.lock:
+            if self.conn is not None:
+                return self.conn.execute(query, params).fetchall()
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            return conn.execute(query, params).fetchall()
+        finally:
+            conn.close()
+
+    def due(self, now=None):
+        """Image dicts of failures whose retry time has come, oldest first."""
+        rows = self._read(
+            "SELECT image FROM failures WHERE scope = ? AND state = ? "
+            "AND next_retry <= ? ORDER BY next_retry",
+            (self.scope, RETRYING, now or time.time()))
+        return [json.loads(row[0]) for row in rows]
+
+    def next_retry(self):
+        """When the next failure becomes due, or None if none are waiting."""
+        rows = self._read(
+            "SELECT MIN(next_retry) FROM failures WHERE scope = ? AND state = ?",
+            (self.scope, RETRYING))
+        return rows[0][0]
+
+    def counts(self):
+        """{'retrying': n, 'dead': n}"""
+        counts = {RETRYING: 0, DEAD: 0}
+        for state, count in self._read(
+                "SELECT state, COUNT(*) FROM failures WHERE scope = ? "
+                "GROUP BY state", (self.scope,)):
+            counts[state] = count
+        return counts
+
+    def entries(self, state=None):
+        """Ledger entries as dicts (EXPORT_FIELDS plus state), by name."""
+        query = ("SELECT name, id, error_class, attempts, error, first_failed, "
+                 "last_failed, state FROM failures WHERE scope = ?")
+        params = [self.scope]
+        if state:
+            query += " AND state = ?"
+            params.append(state)
+        rows = self._read(query + " ORDER BY name", params)
+        return [dict(zip(EXPORT_FIELDS + ["state"], row)) for row in rows]
+
+    def write(self, f, state=DEAD, fmt="csv"):
+        """
+        Writes the dead (or all, with state=None) entries to an open text
+        file as CSV or JSONL. Returns the number of entries written.
+        """
+        entries = self.entries(state)
+        for entry in entries:
+            entry["firstFailed"] = format_time(entry["firstFailed"])
+            entry["lastFailed"] = format_time(entry["lastFailed"])
+        if fmt == "jsonl":
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        else:
+            writer = csv.DictWriter(f, fieldnames=EXPORT_FIELDS + ["state"],
+                                    quoting=csv.QUOTE_ALL)
+            writer.writeheader()
+            writer.writerows(entries)
+        return len(entries)
+
+    def export(self, path, state=DEAD):
+        """Dead-letter export: write() to a CSV, or JSONL for .jsonl paths."""
+        fmt = "jsonl" if path.lower().endswith(".jsonl") else "csv"
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            return self.write(f, state, fmt)
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
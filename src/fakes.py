@@ -0,0 +1,635 @@
+"""
+In-process stand-ins for the Gemini client, the Drive v3 service and a
+gspread worksheet, for offline benchmarks and local experiments.
+
+Each fake takes a latency (plus random jitter) and an error_rate at which
+it fails the way the real service does on a 429, so rate control, retries
+and failover can be exercised without network access or quota.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import threading
+import time
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+BATCH_NAME_PREFIX = "Image file name: "
+
+
+class FakeService:
+    """Shared latency, 429 injection and call counting."""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.throttled = 0
+
+    def _next_call(self):
+        """Counts a call; returns (delay, throttle) for it."""
+        with self.lock:
+            self.calls += 1
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            throttle = self.random.random() < self.error_rate
+            if throttle:
+                self.throttled += 1
+        return delay, throttle
+
+    def _call(self):
+        """Sleeps for the call's latency; True if it should fail with 429."""
+        delay, throttle = self._next_call()
+        if delay:
+            time.sleep(delay)
+        return throttle
+
+
+# --- Gemini -----------------------------------------------------------------
+
+# Roughly what Gemini bills per image, per extracted card and for a
+# request without a system instruction
+PROMPT_TOKENS_PER_IMAGE = 258
+OUTPUT_TOKENS_PER_CARD = 80
+INSTRUCTION_TOKENS = 150
+
+
+def instruction_tokens(text):
+    """Rough token count of a system instruction (4 characters a token)."""
+    return len(text) // 4 if text else INSTRUCTION_TOKENS
+
+
+class FakeUsage:
+    def __init__(self, images, instruction=INSTRUCTION_TOKENS, cached=False):
+        # As with Gemini, cached tokens are part of the prompt count
+        self.prompt_token_count = PROMPT_TOKENS_PER_IMAGE * images + instruction
+        self.candidates_token_count = OUTPUT_TOKENS_PER_CARD * max(1, images)
+        self.cached_content_token_count = instruction if cached else None
+        self.thoughts_token_count = None
+        self.total_token_count = self.prompt_token_count + self.candidates_token_count
+
+
+class FakeResponse:
+    def __init__(self, text, images=1, instruction=INSTRUCTION_TOKENS,
+                 cached=False):
+        self.text = text
+        self.usage_metadata = FakeUsage(images, instruction, cached)
+
+
+def is_hard_card(image_bytes, hard_rate):
+    """Deterministically picks about `hard_rate` of all images."""
+    digest = hashlib.sha1(image_bytes).digest()
+    return int.from_bytes(digest[-4:], "big") / 2 ** 32 < hard_rate
+
+
+def fake_card_data(image_bytes):
+    """Deterministic extraction result for an image."""
+    digest = hashlib.sha1(image_bytes).hexdigest()[:8]
+    return {
+        "fullName": f"Person {digest}",
+        "jobTitle": "Engineer",
+        "companyName": f"Company {digest[:4]}",
+        "primaryEmail": f"{digest}@example.com",
+        "contactPhone": "+1 555 0100",
+        "websiteURL": f"https://{digest}.example.com",
+        "physicalAddress": "1 Example Street",
+    }
+
+
+class FakeModels(FakeService):
+    """
+    Answers generate_content like Gemini does for this app's requests:
+    one JSON object per image, or a list with fileName for multi-card
+    requests. Injected 429s raise with a RESOURCE_EXHAUSTED message and a
+    retry delay, like the SDK's ClientError. About `hard_rate` of the
+    cards come back without contact details from `weak_model`; any other
+    model reads them fine.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, retry_after=1.0,
+                 seed=None, caches=None, hard_rate=0.0,
+                 weak_model="gemini-2.5-flash-lite"):
+        super().__init__(latency, jitter, error_rate, seed)
+        self.retry_after = retry_after
+        self.caches = caches
+        self.hard_rate = hard_rate
+        self.weak_model = weak_model
+        self.calls_by_model = {}
+
+    def _quota_error(self):
+        return Exception(
+            "429 RESOURCE_EXHAUSTED. {'error': {'code': 429, 'message': "
+            "'Resource has been exhausted (e.g. check quota).', "
+            f"'status': 'RESOURCE_EXHAUSTED', 'retryDelay': '{self.retry_after}s'}}}}")
+
+    def _check_config(self, config):
+        """
+        Rejects cached_content the way the API does. Returns (instruction
+        tokens, whether they came from cached content).
+        """
+        name = getattr(config, "cached_content", None)
+        if not name:
+            return (instruction_tokens(getattr(config, "system_instruction", None)),
+                    False)
+        if config.system_instruction:
+            raise Exception(
+                "400 INVALID_ARGUMENT. CachedContent can not be used with "
+                "GenerateContent request setting system_instruction, tools "
+                "or tool_config.")
+        if not self.caches or not self.caches.valid(name):
+            raise Exception(
+                f"403 PERMISSION_DENIED. CachedContent not found "
+                f"(or permission denied): {name}")
+        return self.caches.get(name).tokens, True
+
+    def _respond(self, contents, usage=(INSTRUCTION_TOKENS, False), model=None):
+        with self.lock:
+            self.calls_by_model[model] = self.calls_by_model.get(model, 0) + 1
+        names = []
+        results = []
+        for part in contents:
+            if isinstance(part, str):
+                if part.startswith(BATCH_NAME_PREFIX):
+                    names.append(part[len(BATCH_NAME_PREFIX):])
+                continue
+            inline = getattr(part, "inline_data", None)
+            if inline is not None:
+                data = fake_card_data(inline.data)
+                if model == self.weak_model and is_hard_card(
+                        inline.data, self.hard_rate):
+                    data.update(primaryEmail="", contactPhone="", websiteURL="")
+                results.append(data)
+
+        if not names:
+            return FakeResponse(json.dumps(results[0] if results else {}),
+                                len(results), *usage)
+        for name, data in zip(names, results):
+            data["fileName"] = name
+        return FakeResponse(json.dumps(results), len(results), *usage)
+
+    def generate_content(self, model=None, contents=None, config=None):
+        usage = self._check_config(config)
+        if self._call():
+            raise self._quota_error()
+        return self._respond(contents, usage, model)
+
+
+class FakeAsyncModels:
+    def __init__(self, models):
+        self.models = models
+
+    async def generate_content(self, model=None, contents=None, config=None):
+        usage = self.models._check_config(config)
+        delay, throttle = self.models._next_call()
+        if delay:
+            await asyncio.sleep(delay)
+        if throttle:
+            raise self.models._quota_error()
+        return self.models._respond(contents, usage, model)
+
+
+class FakeCachedContent:
+    def __init__(self, name, model, expires_at, tokens):
+        self.name = name
+        self.model = model
+        self.expires_at = expires_at
+        self.tokens = tokens
+
+
+class FakeCaches:
+    """
+    client.caches with create/update/get/delete. Content shorter than
+    `min_tokens` is rejected like an instruction below the model's minimum
+    cacheable size.
+    """
+
+    def __init__(self, min_tokens=0):
+        self.min_tokens = min_tokens
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.created = 0
+        self.updated = 0
+
+    @staticmethod
+    def _ttl(config):
+        return float(str(config.ttl).rstrip("s"))
+
+    def valid(self, name):
+        with self.lock:
+            entry = self.entries.get(name)
+            return entry is not None and entry.expires_at > time.time()
+
+    def create(self, model=None, config=None):
+        tokens = instruction_tokens(config.system_instruction)
+        if tokens < self.min_tokens:
+            raise Exception(
+                f"400 INVALID_ARGUMENT. Cached content is too small. "
+                f"total_token_count={tokens}, "
+                f"min_total_token_count={self.min_tokens}")
+        with self.lock:
+            self.created += 1
+            name = f"cachedContents/fake-{self.created}"
+            self.entries[name] = FakeCachedContent(
+                name, model, time.time() + self._ttl(config), tokens)
+            return self.entries[name]
+
+    def update(self, name=None, config=None):
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is None or entry.expires_at <= time.time():
+                raise Exception(
+                    f"403 PERMISSION_DENIED. CachedContent not found "
+                    f"(or permission denied): {name}")
+            entry.expires_at = time.time() + self._ttl(config)
+            self.updated += 1
+            return entry
+
+    def get(self, name=None, config=None):
+        with self.lock:
+            return self.entries[name]
+
+    def delete(self, name=None, config=None):
+        with self.lock:
+            self.entries.pop(name, None)
+
+    def expire(self):
+        """Drops every entry, as if their TTLs had run out."""
+        with self.lock:
+            self.entries.clear()
+
+
+class FakeAio:
+    def __init__(self, models):
+        self.models = FakeAsyncModels(models)
+
+
+class FakeUploadedFile:
+    def __init__(self, name, display_name=None):
+        self.name = name
+        self.display_name = display_name
+
+
+class FakeGenaiFiles:
+    """client.files: upload() keeps a file's bytes, download() returns them."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.contents = {}
+
+    def add(self, content, display_name=None):
+        with self.lock:
+            name = f"files/fake-{len(self.contents) + 1}"
+            self.contents[name] = content
+        return FakeUploadedFile(name, display_name)
+
+    def upload(self, file=None, config=None):
+        with open(file, "rb") as f:
+            content = f.read()
+        return self.add(content, getattr(config, "display_name", None))
+
+    def download(self, file=None, config=None):
+        with self.lock:
+            return self.contents[file]
+
+
+class FakeInlineData:
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeInlinePart:
+    def __init__(self, data):
+        self.inline_data = FakeInlineData(data)
+
+
+class FakeBatchDestination:
+    def __init__(self, file_name):
+        self.file_name = file_name
+
+
+class FakeBatchJob:
+    def __init__(self, name, model, src):
+        self.name = name
+        self.model = model
+        self.src = src
+        self.state = "JOB_STATE_PENDING"
+        self.dest = None
+        self.error = None
+
+
+class FakeBatches:
+    """
+    client.batches for file-based jobs. A job reports itself running for
+    `polls` get() calls, then answers every request in its input file
+    through `models` (so hard cards and call counts behave as online) and
+    succeeds. Requests whose image data cannot be decoded get an error
+    line, like the real service.
+    """
+
+    def __init__(self, files, models, polls=1):
+        self.files = files
+        self.models = models
+        self.polls = polls
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.polls_left = {}
+
+    def create(self, model=None, src=None, config=None):
+        with self.lock:
+            name = f"batches/fake-{len(self.jobs) + 1}"
+            self.jobs[name] = FakeBatchJob(name, model, src)
+            self.polls_left[name] = self.polls
+            return self.jobs[name]
+
+    def _run(self, job):
+        lines = []
+        content = self.files.download(file=job.src)
+        for line in content.decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            try:
+                parts = entry["request"]["contents"][0]["parts"]
+                data = base64.b64decode(parts[0]["inline_data"]["data"])
+            except (KeyError, IndexError, ValueError) as e:
+                lines.append({"key": entry.get("key"),
+                              "error": {"code": 400, "message": str(e)}})
+                continue
+            response = self.models._respond([FakeInlinePart(data)],
+                                            model=job.model)
+            usage = response.usage_metadata
+            lines.append({"key": entry["key"], "response": {
+                "candidates": [{"content": {"role": "model",
+                                            "parts": [{"text": response.text}]}}],
+                "usageMetadata": {
+                    "promptTokenCount": usage.prompt_token_count,
+                    "candidatesTokenCount": usage.candidates_token_count,
+                    "totalTokenCount": usage.total_token_count,
+                },
+            }})
+        result = "".join(json.dumps(line) + "\n" for line in lines)
+        job.dest = FakeBatchDestination(self.files.add(result.encode("utf-8")).name)
+        job.state = "JOB_STATE_SUCCEEDED"
+
+    def get(self, name=None, config=None):
+        with self.lock:
+            job = self.jobs[name]
+            if job.dest is None:
+                if self.polls_left[name] > 0:
+                    self.polls_left[name] -= 1
+                    job.state = "JOB_STATE_RUNNING"
+                else:
+                    self._run(job)
+            return job
+
+
+class FakeGenaiClient:
+    """
+    Stand-in for genai.Client, enough for GeminiExtractor's sync and async
+    extraction paths, its context caching and file-based batch jobs. Pass
+    it as GeminiExtractor(client=...).
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, retry_after=1.0,
+                 seed=None, cache_min_tokens=0, hard_rate=0.0, batch_polls=1):
+        self.caches = FakeCaches(cache_min_tokens)
+        self.models = FakeModels(latency, jitter, error_rate, retry_after, seed,
+                                 self.caches, hard_rate)
+        self.aio = FakeAio(self.models)
+        self.files = FakeGenaiFiles()
+        self.batches = FakeBatches(self.files, self.models, batch_polls)
+
+
+# --- Drive ------------------------------------------------------------------
+
+class FakeMediaHttp:
+    """Serves a file's bytes to MediaIoBaseDownload, honouring Range."""
+
+    def __init__(self, drive, content):
+        self.drive = drive
+        self.content = content
+
+    def request(self, uri, method="GET", headers=None, **kwargs):
+        if self.drive._call():
+            return httplib2.Response({"status": 429}), b"Rate Limit Exceeded"
+        start, end = 0, len(self.content) - 1
+        byte_range = (headers or {}).get("range")
+        if byte_range:
+            first, last = byte_range.split("=", 1)[1].split("-")
+            start, end = int(first), min(int(last), end)
+        chunk = self.content[start:end + 1]
+        response = httplib2.Response({
+            "status": 206,
+            "content-range": f"bytes {start}-{end}/{len(self.content)}",
+        })
+        return response, chunk
+
+
+class FakeMediaRequest:
+    def __init__(self, drive, file_id):
+        self.uri = f"fake://drive/{file_id}"
+        self.headers = {}
+        self.http = FakeMediaHttp(drive, drive.contents[file_id])
+
+
+class FakeListRequest:
+    def __init__(self, drive, page_size, page_token):
+        self.drive = drive
+        self.page_size = page_size
+        self.page_token = page_token
+
+    def execute(self):
+        drive = self.drive
+        if drive._call():
+            raise HttpError(httplib2.Response({"status": 429}),
+                            b"Rate Limit Exceeded", uri="fake://drive/files")
+        size = min(self.page_size or drive.page_size, drive.page_size)
+        start = int(self.page_token or 0)
+        page = {"files": [dict(f) for f in drive.listing[start:start + size]]}
+        if start + size < len(drive.listing):
+            page["nextPageToken"] = str(start + size)
+        return page
+
+
+class FakeChangesRequest:
+    def __init__(self, drive, page_size, page_token):
+        self.drive = drive
+        self.page_size = page_size
+        self.page_token = page_token
+
+    def execute(self):
+        drive = self.drive
+        if drive._call():
+            raise HttpError(httplib2.Response({"status": 429}),
+                            b"Rate Limit Exceeded", uri="fake://drive/changes")
+        start = int(self.page_token)
+        if start < drive.oldest_token:
+            raise HttpError(httplib2.Response({"status": 400}),
+                            b"Invalid Value", uri="fake://drive/changes")
+        size = min(self.page_size or drive.page_size, drive.page_size)
+        end = min(start + size, len(drive.changes_log))
+        page = {"changes": [dict(c) for c in drive.changes_log[start:end]]}
+        if end < len(drive.changes_log):
+            page["nextPageToken"] = str(end)
+        else:
+            page["newStartPageToken"] = str(end)
+        return page
+
+
+class FakeStartTokenRequest:
+    def __init__(self, drive):
+        self.drive = drive
+
+    def execute(self):
+        self.drive._call()
+        return {"startPageToken": str(len(self.drive.changes_log))}
+
+
+class FakeChanges:
+    def __init__(self, drive):
+        self.drive = drive
+
+    def getStartPageToken(self, **kwargs):
+        return FakeStartTokenRequest(self.drive)
+
+    def list(self, pageToken=None, pageSize=None, **kwargs):
+        return FakeChangesRequest(self.drive, pageSize, pageToken)
+
+
+class FakeFiles:
+    def __init__(self, drive):
+        self.drive = drive
+
+    def list(self, q=None, pageSize=None, pageToken=None, fields=None, **kwargs):
+        return FakeListRequest(self.drive, pageSize, pageToken)
+
+    def get_media(self, fileId=None, **kwargs):
+        return FakeMediaRequest(self.drive, fileId)
+
+
+class FakeDriveService(FakeService):
+    """
+    Stand-in for a Drive v3 service holding one folder. Listing is paged
+    at most `page_size` files at a time (the real API caps pages too);
+    downloads go through the real MediaIoBaseDownload, so
+    iter_folder_images and download_file run unchanged. put_file() and
+    remove_file() record changes for the Changes feed; expire_changes()
+    makes earlier page tokens invalid.
+
+    Args:
+        files: Dict of file name -> bytes.
+        folder_id: ID the folder is listed under.
+        page_size: Largest page the fake will return.
+    """
+
+    def __init__(self, files, folder_id="fake-folder", page_size=100,
+                 latency=0.0, jitter=0.0, error_rate=0.0, seed=None):
+        super().__init__(latency, jitter, error_rate, seed)
+        self.folder_id = folder_id
+        self.page_size = page_size
+        self.listing = []
+        self.contents = {}
+        self.changes_log = []
+        self.oldest_token = 0
+        for name, content in files.items():
+            self.put_file(name, content)
+
+    def put_file(self, name, content):
+        """Adds a file, or replaces the content of the file with that name."""
+        entry = next((f for f in self.listing if f["name"] == name), None)
+        if entry is None:
+            entry = {"id": f"file-{len(self.contents)}", "name": name,
+                     "mimeType": "image/jpeg"}
+            self.listing.append(entry)
+        self.contents[entry["id"]] = content
+        self.changes_log.append({"fileId": entry["id"], "removed": False, "file": dict(
+            entry, parents=[self.folder_id], trashed=False)})
+        return entry["id"]
+
+    def remove_file(self, name):
+        entry = next(f for f in self.listing if f["name"] == name)
+        self.listing.remove(entry)
+        self.changes_log.append({"fileId": entry["id"], "removed": True})
+
+    def expire_changes(self):
+        """Invalidates all page tokens issued so far."""
+        self.oldest_token = len(self.changes_log)
+
+    def files(self):
+        return FakeFiles(self)
+
+    def changes(self):
+        return FakeChanges(self)
+
+
+# --- Sheets -----------------------------------------------------------------
+
+class FakeWorksheet(FakeService):
+    """
+    Stand-in for a gspread Worksheet keeping rows in memory. Injected
+    429s raise like gspread's APIError does on a quota error.
+    """
+
+    def __init__(self, rows=None, latency=0.0, jitter=0.0, error_rate=0.0,
+                 seed=None):
+        super().__init__(latency, jitter, error_rate, seed)
+        self.rows = [list(row) for row in rows or []]
+        self.writes = 0
+
+    def _check(self):
+        if self._call():
+            raise Exception("APIError: [429]: Quota exceeded for quota metric "
+                            "'Write requests' (RESOURCE_EXHAUSTED)")
+
+    def row_values(self, row):
+        self._check()
+        with self.lock:
+            return list(self.rows[row - 1]) if row <= len(self.rows) else []
+
+    def col_values(self, col):
+        self._check()
+        with self.lock:
+            return [row[col - 1] if len(row) >= col else "" for row in self.rows]
+
+    def get_all_values(self):
+        self._check()
+        with self.lock:
+            return [list(row) for row in self.rows]
+
+    def insert_row(self, values, index=1, **kwargs):
+        self._check()
+        with self.lock:
+            self.rows.insert(index - 1, list(values))
+            self.writes += 1
+
+    def append_row(self, values, **kwargs):
+        self.append_rows([values])
+
+    def append_rows(self, values, **kwargs):
+        self._check()
+        with self.lock:
+            first = len(self.rows) + 1
+            self.rows.extend(list(row) for row in values)
+            self.writes += 1
+            return {"updates": {
+                "updatedRange": f"'Sheet1'!A{first}:H{len(self.rows)}",
+                "updatedRows": len(values)}}
+
+    def batch_update(self, data, **kwargs):
+        """Writes A1 ranges like "A5:H5" (whole rows only)."""
+        self._check()
+        with self.lock:
+            for entry in data:
+                start = entry["range"].split(":")[0]
+                number = int(start.lstrip("ABCDEFGHIJKLMNOPQRSTUVWXYZ"))
+                for offset, row in enumerate(entry["values"]):
+                    while len(self.rows) < number + offset:
+                        self.rows.append([])
+                    self.rows[number + offset - 1] = list(row)
+            self.writes += 1
+            return {"totalUpdatedRows": sum(len(e["values"]) for e in data)}
@@ -1,16 +1,211 @@
-from google import genai
 from google.genai import types
+from src.clients import gemini_client
 from src.config import Config
-import time
+from src.metrics import Metrics
+from src.preprocess import detect_mime_type
+from src.sheets import row_from_data
+from src.validation import card_problems
+import asyncio
+import base64
+import hashlib
 import json
+import re
+import threading
+import time
+
+# Batch job states after which polling stops
+BULK_DONE_STATES = {
+    "JOB_STATE_SUCCEEDED", "JOB_STATE_PARTIALLY_SUCCEEDED",
+    "JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"
+}
+BULK_OK_STATES = {"JOB_STATE_SUCCEEDED", "JOB_STATE_PARTIALLY_SUCCEEDED"}
+
+# Server-suggested wait, e.g. 'retryDelay': '23s' or "Please retry in 23.5s"
+RETRY_DELAY_PATTERN = re.compile(
+    r"(?:retryDelay['\"]?\s*:\s*['\"]|retry in\s+)(\d+(?:\.\d+)?)\s*(ms|s)",
+    re.IGNORECASE
+)
+
+# Static reference added to the system instruction when it is sent as
+# Gemini cached content (see GeminiExtractor.instruction). It is paid for
+# once per key and cache lifetime, and takes the instruction past the
+# minimum size Gemini caches. {schema} is replaced with the JSON schema.
+EXTRACTION_GUIDE = """
+RESPONSE SCHEMA:
+Every response is a JSON object with exactly these keys, all strings:
+{schema}
+When several cards are sent in one request, the response is a JSON array
+with one such object per image, in the order the images were given, and
+each object also carries the "fileName" given before its image.
+
+DETAILED FIELD RULES:
+- fullName: Copy the name as printed, including middle names and initials,
+  in the order shown on the card. Drop honorifics and post-nominals that
+  are not part of the name itself ("Mr.", "Mrs.", "Dr.", "Er.", "CA",
+  "PhD", "MBA") unless nothing else identifies the person. If the card
+  shows only a company and no person, leave fullName empty. If two people
+  are printed with equal weight, use the one listed first.
+- jobTitle: The role of the person in fullName, as printed ("Proprietor",
+  "Partner", "Head - Procurement"). Do not invent a title from the
+  company's line of business. A department on its own line belongs in the
+  title ("Sales Manager, Export Division").
+- companyName: The trading name of the business, usually the largest or
+  logo text. Include the legal suffix when printed ("Sharma Textiles Pvt.
+  Ltd.", "Acme Corp., LLC"). Do not include taglines, slogans, product
+  lists or "An ISO 9001:2015 certified company" lines. A person's name is
+  only the company name when the card says so (e.g. "John Smith &
+  Associates").
+- primaryEmail: One address, lower-cased. Prefer the person's own address
+  over generic ones (info@, sales@, contact@, office@) when both appear.
+  Fix obvious OCR slips only when certain (a space inside the address, a
+  comma instead of a dot before the domain ending). Never make up an
+  address from the person's name and the website.
+- contactPhone: Every phone, mobile, landline, WhatsApp and toll-free
+  number on the card, in the order printed, separated by ", ". Keep the
+  country code and extension as printed ("+91 98765 43210", "+1 (415)
+  555-0100 ext. 204"). Leave out fax numbers unless they are the only
+  number. Do not merge two numbers that share a prefix into one.
+- websiteURL: The company website as printed, without a trailing slash
+  ("www.example.com", "https://example.co.uk"). Social media handles and
+  profile links are not websites unless no website is printed.
+- physicalAddress: The postal address in one line, parts separated by ", "
+  in the order printed: building, street, area, city, postal code, state
+  or region, country. If the card lists several offices, use the one
+  marked as head office or registered office, else the first one. Do not
+  include phone numbers or email addresses that are printed on the same
+  line as the address.
+
+READING THE CARD:
+- Read every side and orientation in the image; text may be rotated or
+  printed vertically along an edge.
+- Text in other scripts (Devanagari, Chinese, Arabic, Cyrillic) is copied
+  as printed. When the same detail is printed in two scripts, use the
+  Latin one.
+- Ignore QR codes, logos without text, handwriting added after printing,
+  and stamps, unless they are the only source of a field.
+- If a detail is unreadable, leave the field empty rather than guessing.
+
+WORKED EXAMPLES:
+
+Card text:
+  RAJESH K. MEHTA | Managing Director
+  MEHTA PACKAGING INDUSTRIES PVT. LTD.
+  Plot 14, GIDC Estate, Vatva, Ahmedabad - 382445, Gujarat, India
+  M: +91 98250 11223 | T: 079 2583 4411 | F: 079 2583 4412
+  rajesh@mehtapack.in | sales@mehtapack.in | www.mehtapack.in
+Result:
+  {"fullName": "Rajesh K. Mehta", "jobTitle": "Managing Director",
+   "companyName": "Mehta Packaging Industries Pvt. Ltd.",
+   "primaryEmail": "rajesh@mehtapack.in",
+   "contactPhone": "+91 98250 11223, 079 2583 4411",
+   "websiteURL": "www.mehtapack.in",
+   "physicalAddress": "Plot 14, GIDC Estate, Vatva, Ahmedabad - 382445, Gujarat, India"}
+
+Card text:
+  Northwind Traders
+  Quality coffee since 1998
+  info@northwindtraders.com
+  +1 (206) 555-0142
+  northwindtraders.com
+Result:
+  {"fullName": "", "jobTitle": "", "companyName": "Northwind Traders",
+   "primaryEmail": "info@northwindtraders.com",
+   "contactPhone": "+1 (206) 555-0142",
+   "websiteURL": "northwindtraders.com", "physicalAddress": ""}
+
+Card text:
+  Dr. Anna Lindqvist, PhD
+  Senior Research Scientist, Materials Lab
+  Fabrikam Instruments AB
+  Kungsgatan 8, 111 43 Stockholm, Sweden
+  anna.lindqvist@fabrikam.se
+  Tel +46 8 123 456 70 ext. 12 / Mobile +46 70 555 12 34
+Result:
+  {"fullName": "Anna Lindqvist",
+   "jobTitle": "Senior Research Scientist, Materials Lab",
+   "companyName": "Fabrikam Instruments AB",
+   "primaryEmail": "anna.lindqvist@fabrikam.se",
+   "contactPhone": "+46 8 123 456 70 ext. 12, +46 70 555 12 34",
+   "websiteURL": "",
+   "physicalAddress": "Kungsgatan 8, 111 43 Stockholm, Sweden"}
+
+Card text:
+  SUNRISE AUTO SPARES
+  Prop. Imran Shaikh
+  Dealers in: Bearings, Belts, Filters, Lubricants
+  Shop No. 3, Main Road, Near Bus Stand, Nashik 422001
+  Cell: 98220 45678, 98220 45679  WhatsApp: 98220 45678
+Result:
+  {"fullName": "Imran Shaikh", "jobTitle": "Proprietor",
+   "companyName": "Sunrise Auto Spares", "primaryEmail": "",
+   "contactPhone": "98220 45678, 98220 45679",
+   "websiteURL": "",
+   "physicalAddress": "Shop No. 3, Main Road, Near Bus Stand, Nashik 422001"}
+"""
+
+
+def is_quota_error(error_str):
+    """True for rate limit / quota errors."""
+    return ("429" in error_str or "RESOURCE_EXHAUSTED" in error_str
+            or "ResourceExhausted" in error_str)
+
+
+class QuotaExceeded(ResourceWarning):
+    """
+    Raised on 429 / RESOURCE_EXHAUSTED errors.
+
+    Attributes:
+        retry_after: Seconds the server asked us to wait, if given.
+        daily: True when a per-day quota is exhausted (retrying today
+            will not help).
+    """
+
+    def __init__(self, message="Quota exceeded", retry_after=None, daily=False):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.daily = daily
+
+    @classmethod
+    def from_error(cls, error_str):
+        """Builds a QuotaExceeded from the text of an API error."""
+        retry_after = None
+        match = RETRY_DELAY_PATTERN.search(error_str)
+        if match:
+            retry_after = float(match.group(1))
+            if match.group(2).lower() == "ms":
+                retry_after /= 1000
+        daily = "PerDay" in error_str or "per day" in error_str.lower()
+        return cls("Quota exceeded", retry_after=retry_after, daily=daily)
+
+
+def is_cache_error(error_str):
+    """True when a request was rejected because of its cached content."""
+    return not is_quota_error(error_str) and "cached" in error_str.lower()
 
 
 class GeminiExtractor:
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, client=None, key_pool=None, metrics=None,
+                 context_cache=None, escalation_model=None):
         # Only initialize client if api_key is provided
         # Otherwise, client must be set manually before calling extract_data
-        self.client = genai.Client(api_key=api_key) if api_key else None
+        # (an existing or fake client can also be injected directly)
+        self.client = client or (
+            gemini_client(api_key) if api_key else None)
+        # With a KeyPool, each request goes to the key with most budget left
+        self.key_pool = key_pool
+        if key_pool and self.client is None:
+            self.client = key_pool.client(key_pool.states[0].key)
+        # Model call / parse timings and token usage
+        self.metrics = metrics or Metrics()
+        # Optional ContextCache: the system instruction is sent once per
+        # key as cached content instead of with every request
+        self.context_cache = context_cache
         self.model_name = "gemini-2.5-flash-lite"
+        # Model cascade: cards whose result fails validation (see
+        # src/validation.py) are extracted again with this stronger model
+        self.escalation_model = escalation_model
+        # Error behind the last None from extract_data, per thread
+        self.local = threading.local()
 
         self.system_instruction = """
         You are an expert business card data extractor. Extract structured data from business cards.
@@ -47,52 +242,611 @@ class GeminiExtractor:
                          "contactPhone", "websiteURL", "physicalAddress"]
         }
 
-    def extract_data(self, image_bytes, file_name):
+    def batch_schema(self):
         """
-        Extracts data from an image byte stream using Gemini.
-        Returns a dictionary with the extracted fields + fileName.
+        Response schema for multi-card requests: one object per image,
+        identified by the file name given in the prompt.
+        """
+        item = {
+            "type": "OBJECT",
+            "properties": {"fileName": {"type": "STRING"},
+                           **self.schema["properties"]},
+            "required": ["fileName"] + self.schema["required"]
+        }
+        return {"type": "ARRAY", "items": item}
+
+    def instruction(self):
+        """
+        System instruction for extraction requests. With context caching,
+        EXTRACTION_GUIDE (schema, field rules, worked examples) is added:
+        it is sent once per key as cached content rather than with every
+        request, and makes the instruction large enough to be cached.
+        """
+        if not self.context_cache:
+            return self.system_instruction
+        schema = json.dumps(self.schema["properties"], indent=2)
+        return self.system_instruction + EXTRACTION_GUIDE.replace("{schema}", schema)
+
+    def fingerprint(self):
+        """
+        Returns a short hash of the model(s), system instruction and
+        schema. Used to key cached results so prompt changes invalidate them.
+        """
+        parts = [self.model_name, self.instruction(), self.schema]
+        if self.escalation_model:
+            parts.append(self.escalation_model)
+        payload = json.dumps(parts, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+    def _config(self, client, schema, model):
         """
+        Generation config for a request to `client`: references the
+        cached instruction when context caching is on, else inlines it.
+        """
+        cached_content = None
+        if self.context_cache:
+            # Cached content belongs to one model
+            cached_content = self.context_cache.name_for(
+                client, model, self.instruction(),
+                f"{self.fingerprint()}-{model}")
+        if cached_content:
+            return types.GenerateContentConfig(
+                cached_content=cached_content,
+                response_mime_type="application/json",
+                response_schema=schema
+            )
+        return types.GenerateContentConfig(
+            system_instruction=self.instruction(),
+            response_mime_type="application/json",
+            response_schema=schema
+        )
+
+    def _request(self, image_bytes, mime_type=None):
+        """Builds the contents and response schema for a single-card request."""
         prompt = "Extract data from this business card."
 
         # Prepare the parts: text prompt + image bytes
         # Using types.Part.from_bytes based on google-genai SDK
         image_part = types.Part.from_bytes(
-            data=image_bytes, mime_type="image/jpeg")
-        # Note: We assume JPEG/PNG. The SDK handles basic types.
+            data=image_bytes,
+            mime_type=mime_type or detect_mime_type(image_bytes))
+        return [image_part, prompt], self.schema
 
+    def last_error(self):
+        """
+        The error behind the last None returned by extract_data in this
+        thread (None if nothing went wrong, or the card was just empty).
+        """
+        return getattr(self.local, "error", None)
+
+    def _parse_response(self, response, file_name):
+        """Parses the JSON response text and injects fileName."""
         try:
-            response = self.client.models.generate_content(
-                model=self.model_name,
-                contents=[image_part, prompt],
-                config=types.GenerateContentConfig(
-                    system_instruction=self.system_instruction,
-                    response_mime_type="application/json",
-                    response_schema=self.schema
-                )
-            )
+            data = json.loads(response.text)
+            data["fileName"] = file_name
+            return data
+        except json.JSONDecodeError as e:
+            print(
+                f"Error decoding JSON for {file_name}. Raw response: {response.text}")
+            self.local.error = e
+            return None
 
-            # Parse JSON
+    def _batch_request(self, items):
+        """Builds the contents and response schema for a multi-card request."""
+        contents = []
+        for image_bytes, file_name, mime_type in items:
+            contents.append(f"Image file name: {file_name}")
+            contents.append(types.Part.from_bytes(
+                data=image_bytes,
+                mime_type=mime_type or detect_mime_type(image_bytes)))
+        contents.append(
+            "Extract data from each business card above. Return one object "
+            "per image, with fileName set to the file name given before it.")
+        return contents, self.batch_schema()
+
+    def _parse_batch_response(self, response, file_names):
+        """
+        Maps a multi-card response back to file names. Entries that are
+        missing, malformed or ambiguous are returned as None.
+        """
+        results = {name: None for name in file_names}
+        try:
+            entries = json.loads(response.text)
+        except (json.JSONDecodeError, TypeError):
+            print(f"Error decoding batch JSON. Raw response: {response.text}")
+            return results
+        if not isinstance(entries, list):
+            return results
+
+        seen = set()
+        for entry in entries:
+            if not isinstance(entry, dict):
+                continue
+            name = entry.get("fileName")
+            if name not in results:
+                continue
+            if name in seen:
+                # Same name returned twice: cannot tell which is right
+                results[name] = None
+                continue
+            seen.add(name)
+            results[name] = entry
+        return results
+
+    def extract_batch(self, items, escalate=True):
+        """
+        Extracts several cards with a single generate_content call.
+
+        Args:
+            items: List of (image_bytes, file_name, mime_type) tuples.
+                File names must be unique within the batch.
+            escalate: Escalate cards failing validation here. Callers
+                that rate-limit model calls pass False and call
+                escalate() themselves (see escalation_problems()).
+
+        Returns a dict of file_name -> data. Cards the model did not
+        return (or returned malformed) map to None; callers should retry
+        those with extract_data. Raises ResourceWarning on quota errors.
+        """
+        file_names = [file_name for _, file_name, _ in items]
+        contents, schema = self._batch_request(items)
+
+        start = time.perf_counter()
+        try:
+            response = self._generate(contents, schema)
+        except Exception as e:
+            self._handle_error(e, ", ".join(file_names))
+            return {name: None for name in file_names}
+
+        with self.metrics.time("parse"):
+            results = self._parse_batch_response(response, file_names)
+        if not self.escalation_model:
+            return results
+
+        # Missing cards are retried by the caller through extract_data;
+        # cards that came back but fail validation are escalated here
+        problems = {name: card_problems(data)
+                    for name, data in results.items() if data is not None}
+        self.metrics.record_tier(
+            self.model_name, time.perf_counter() - start, cards=len(items),
+            valid=sum(not p for p in problems.values()))
+        if not escalate:
+            return results
+        for image_bytes, file_name, mime_type in items:
+            if problems.get(file_name):
+                results[file_name] = self._escalate_or_keep(
+                    image_bytes, file_name, mime_type,
+                    results[file_name], problems[file_name])
+        return results
+
+    def _handle_error(self, e, file_name):
+        """
+        Raises QuotaExceeded (a ResourceWarning) for quota errors,
+        otherwise logs and returns None.
+        """
+        # Print full error details for debugging
+        error_str = str(e)
+        error_type = type(e).__name__
+        print(f"[DEBUG] Error Type: {error_type}")
+        print(f"[DEBUG] Full Error: {error_str}")
+
+        # Check for rate limit / quota errors
+        if isinstance(e, QuotaExceeded) or is_quota_error(error_str):
+            print("Quota exceeded (ResourceExhausted).")
+            if isinstance(e, QuotaExceeded):
+                raise e
+            raise QuotaExceeded.from_error(error_str)
+        else:
+            print(f"Error processing {file_name}: {e}")
+            self.local.error = e
+            return None
+
+    def _call_model(self, client, contents, schema, model):
+        """
+        One timed generate_content call; records token usage. If the
+        cached instruction was rejected (e.g. it expired early), the
+        request is repeated once with the instruction inline.
+        """
+        config = self._config(client, schema, model)
+        try:
+            with self.metrics.time("model"):
+                response = client.models.generate_content(
+                    model=model, contents=contents, config=config)
+        except Exception as e:
+            if not (config.cached_content and is_cache_error(str(e))):
+                raise
+            self.context_cache.invalidate(client, f"{self.fingerprint()}-{model}")
+            config = self._config(client, schema, model)
+            with self.metrics.time("model"):
+                response = client.models.generate_content(
+                    model=model, contents=contents, config=config)
+        self.metrics.add_usage(getattr(response, "usage_metadata", None))
+        return response
+
+    async def _call_model_async(self, client, contents, schema, model):
+        """Async version of _call_model."""
+        # Creating or extending the cache entry is a blocking call
+        config = await asyncio.to_thread(self._config, client, schema, model)
+        try:
+            with self.metrics.time("model"):
+                response = await client.aio.models.generate_content(
+                    model=model, contents=contents, config=config)
+        except Exception as e:
+            if not (config.cached_content and is_cache_error(str(e))):
+                raise
+            self.context_cache.invalidate(client, f"{self.fingerprint()}-{model}")
+            config = await asyncio.to_thread(self._config, client, schema, model)
+            with self.metrics.time("model"):
+                response = await client.aio.models.generate_content(
+                    model=model, contents=contents, config=config)
+        self.metrics.add_usage(getattr(response, "usage_metadata", None))
+        return response
+
+    def _generate(self, contents, schema, model=None):
+        """
+        Calls generate_content (on the default model unless `model` is
+        given), failing over across the key pool (if any) when a key hits
+        its quota.
+        """
+        model = model or self.model_name
+        if not self.key_pool:
+            return self._call_model(self.client, contents, schema, model)
+
+        error = None
+        for _ in range(len(self.key_pool)):
+            key = self.key_pool.acquire()
             try:
-                data = json.loads(response.text)
-                data["fileName"] = file_name
-                return data
-            except json.JSONDecodeError:
-                print(
-                    f"Error decoding JSON for {file_name}. Raw response: {response.text}")
-                return None
+                return self._call_model(
+                    self.key_pool.client(key), contents, schema, model)
+            except Exception as e:
+                if not is_quota_error(str(e)):
+                    raise
+                error = QuotaExceeded.from_error(str(e))
+                self.key_pool.report_quota_error(key, error)
+        raise error
+
+    async def _generate_async(self, contents, schema, model=None):
+        """Async version of _generate."""
+        model = model or self.model_name
+        if not self.key_pool:
+            return await self._call_model_async(
+                self.client, contents, schema, model)
+
+        error = None
+        for _ in range(len(self.key_pool)):
+            # acquire() may block briefly; keep it off the event loop
+            key = await asyncio.to_thread(self.key_pool.acquire)
+            try:
+                return await self._call_model_async(
+                    self.key_pool.client(key), contents, schema, model)
+            except Exception as e:
+                if not is_quota_error(str(e)):
+                    raise
+                error = QuotaExceeded.from_error(str(e))
+                self.key_pool.report_quota_error(key, error)
+        raise error
+
+    def _extract_with(self, model, image_bytes, file_name, mime_type):
+        """One single-card request to `model`; returns the data or None."""
+        contents, schema = self._request(image_bytes, mime_type)
 
+        try:
+            response = self._generate(contents, schema, model)
+        except Exception as e:
+            return self._handle_error(e, file_name)
+
+        with self.metrics.time("parse"):
+            return self._parse_response(response, file_name)
+
+    async def _extract_with_async(self, model, image_bytes, file_name, mime_type):
+        """Async version of _extract_with."""
+        contents, schema = self._request(image_bytes, mime_type)
+
+        try:
+            response = await self._generate_async(contents, schema, model)
         except Exception as e:
-            # Print full error details for debugging
-            error_str = str(e)
-            error_type = type(e).__name__
-            print(f"[DEBUG] Error Type: {error_type}")
-            print(f"[DEBUG] Full Error: {error_str}")
-
-            # Check for rate limit / quota errors
-            if "429" in error_str or "RESOURCE_EXHAUSTED" in error_str or "ResourceExhausted" in error_str:
-                print(
-                    "Quota exceeded (ResourceExhausted). Stopping execution to preserve data.")
-                raise ResourceWarning("Quota exceeded")
+            return self._handle_error(e, file_name)
+
+        with self.metrics.time("parse"):
+            return self._parse_response(response, file_name)
+
+    def _pick(self, file_name, data, problems, escalated, escalated_problems):
+        """Keeps the escalated result unless it is missing or worse."""
+        if escalated is None or (
+                data is not None and len(escalated_problems) > len(problems)):
+            print(f"Kept {self.model_name} result for {file_name}")
+            return data
+        return escalated
+
+    def escalation_problems(self, data):
+        """
+        Validation problems that call for re-running a result on the
+        escalation model; empty when it is fine or there is no cascade.
+        """
+        if not self.escalation_model:
+            return []
+        return card_problems(data)
+
+    def escalate(self, image_bytes, file_name, mime_type, data, problems):
+        """
+        Re-runs a card that failed validation on the escalation model and
+        returns the better of the two results. This is a model call of its
+        own: it raises ResourceWarning on quota errors, like extract_data.
+        """
+        print(f"Escalating {file_name} to {self.escalation_model}: "
+              + "; ".join(problems))
+        start = time.perf_counter()
+        escalated = self._extract_with(
+            self.escalation_model, image_bytes, file_name, mime_type)
+        escalated_problems = card_problems(escalated)
+        self.metrics.record_tier(self.escalation_model,
+                                 time.perf_counter() - start,
+                                 valid=int(not escalated_problems))
+        return self._pick(file_name, data, problems, escalated,
+                          escalated_problems)
+
+    def _escalate_or_keep(self, image_bytes, file_name, mime_type, data,
+                          problems):
+        """escalate(), keeping the first result if the quota is hit."""
+        try:
+            return self.escalate(image_bytes, file_name, mime_type, data,
+                                 problems)
+        except ResourceWarning:
+            print(f"Quota exceeded escalating {file_name}; "
+                  f"kept {self.model_name} result")
+            return data
+
+    async def _escalate_async(self, image_bytes, file_name, mime_type, data,
+                              problems):
+        """Async version of _escalate_or_keep."""
+        print(f"Escalating {file_name} to {self.escalation_model}: "
+              + "; ".join(problems))
+        start = time.perf_counter()
+        try:
+            escalated = await self._extract_with_async(
+                self.escalation_model, image_bytes, file_name, mime_type)
+        except ResourceWarning:
+            print(f"Quota exceeded escalating {file_name}; "
+                  f"kept {self.model_name} result")
+            return data
+        escalated_problems = card_problems(escalated)
+        self.metrics.record_tier(self.escalation_model,
+                                 time.perf_counter() - start,
+                                 valid=int(not escalated_problems))
+        return self._pick(file_name, data, problems, escalated,
+                          escalated_problems)
+
+    def extract_data(self, image_bytes, file_name, mime_type=None,
+                     escalate=True):
+        """
+        Extracts data from an image byte stream using Gemini.
+        Returns a dictionary with the extracted fields + fileName.
+        mime_type is detected from the bytes when not given.
+        With an escalation model, results that fail validation (or could
+        not be parsed) are retried on it, unless `escalate` is False (see
+        extract_batch); if that hits the quota, the first result is kept.
+        When None is returned because of an error, last_error() has it.
+        """
+        self.local.error = None
+        if not self.escalation_model:
+            return self._extract_with(
+                self.model_name, image_bytes, file_name, mime_type)
+
+        start = time.perf_counter()
+        data = self._extract_with(
+            self.model_name, image_bytes, file_name, mime_type)
+        problems = card_problems(data)
+        self.metrics.record_tier(self.model_name, time.perf_counter() - start,
+                                 valid=int(not problems))
+        if not problems or not escalate:
+            return data
+        return self._escalate_or_keep(image_bytes, file_name, mime_type, data,
+                                      problems)
+
+    async def extract_data_async(self, image_bytes, file_name, mime_type=None):
+        """
+        Async version of extract_data using the google-genai async client.
+        Requests share the event loop's thread, so last_error() is only
+        meaningful right after the call returns.
+        """
+        self.local.error = None
+        if not self.escalation_model:
+            return await self._extract_with_async(
+                self.model_name, image_bytes, file_name, mime_type)
+
+        start = time.perf_counter()
+        data = await self._extract_with_async(
+            self.model_name, image_bytes, file_name, mime_type)
+        problems = card_problems(data)
+        self.metrics.record_tier(self.model_name, time.perf_counter() - start,
+                                 valid=int(not problems))
+        if not problems:
+            return data
+        return await self._escalate_async(
+            image_bytes, file_name, mime_type, data, problems)
+
+    async def extract_many(self, images, concurrency=8):
+        """
+        Extracts many images on one event loop with at most `concurrency`
+        requests in flight.
+
+        Args:
+            images: Iterable of (image_bytes, file_name) pairs. Consumed
+                lazily, so it may be a generator over a large folder.
+            concurrency: Maximum number of concurrent requests.
+
+        Yields (file_name, data) pairs in completion order; data is None
+        when nothing could be extracted. Raises ResourceWarning on quota
+        errors after cancelling the remaining requests.
+        """
+        items = iter(images)
+        in_flight = {}
+
+        def fill():
+            while len(in_flight) < concurrency:
+                try:
+                    image_bytes, file_name = next(items)
+                except StopIteration:
+                    return
+                task = asyncio.ensure_future(
+                    self.extract_data_async(image_bytes, file_name))
+                in_flight[task] = file_name
+
+        fill()
+        try:
+            while in_flight:
+                done, _ = await asyncio.wait(
+                    in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    file_name = in_flight.pop(task)
+                    yield file_name, task.result()
+                fill()
+        finally:
+            for task in in_flight:
+                task.cancel()
+
+    # --- Bulk (batch prediction) mode ---
+
+    def write_bulk_requests(self, images, load_image, path, preprocess=None):
+        """
+        Writes a JSONL batch request file, one request per image.
+        Images are read one at a time, so memory use stays constant.
+
+        Args:
+            images: Iterable of image dicts ({'id', 'name'}).
+            load_image: Callable returning an image dict's bytes.
+            path: Output .jsonl path.
+            preprocess: Optional callable returning (bytes, mime_type).
+
+        Returns (count, failed): the number of requests written, and
+        (index, fileName, error) for each image that could not be read or
+        preprocessed; those are left out and the rest are still written.
+        Each request key is "<index>:<fileName>" so results can be mapped
+        back without a separate manifest.
+        """
+        count = 0
+        failed = []
+        with open(path, "w", encoding="utf-8") as f:
+            for index, img in enumerate(images):
+                try:
+                    image_bytes = load_image(img)
+                    mime_type = None
+                    if preprocess:
+                        image_bytes, mime_type = preprocess(image_bytes)
+                except Exception as e:
+                    print(f"Could not read {img['name']}: {e}")
+                    failed.append((index, img['name'], e))
+                    continue
+                request = {
+                    "contents": [{
+                        "role": "user",
+                        "parts": [
+                            {"inline_data": {
+                                "mime_type": mime_type or detect_mime_type(image_bytes),
+                                "data": base64.b64encode(image_bytes).decode("ascii")
+                            }},
+                            {"text": "Extract data from this business card."}
+                        ]
+                    }],
+                    "system_instruction": {"parts": [{"text": self.system_instruction}]},
+                    "generation_config": {
+                        "response_mime_type": "application/json",
+                        "response_schema": self.schema
+                    }
+                }
+                f.write(json.dumps({"key": f"{index}:{img['name']}",
+                                    "request": request}) + "\n")
+                count += 1
+        print(f"Wrote {count} batch requests to {path}"
+              + (f", skipped {len(failed)} unreadable images." if failed else "."))
+        return count, failed
+
+    def submit_bulk_job(self, request_path, display_name="business-cards"):
+        """Uploads a request file and starts a batch job. Returns the job."""
+        uploaded = self.client.files.upload(
+            file=request_path,
+            config=types.UploadFileConfig(
+                display_name=display_name, mime_type="jsonl")
+        )
+        job = self.client.batches.create(
+            model=self.model_name,
+            src=uploaded.name,
+            config={"display_name": display_name}
+        )
+        print(f"Submitted batch job: {job.name}")
+        return job
+
+    def wait_for_bulk_job(self, job_name, poll_interval=60, timeout=None):
+        """
+        Polls a batch job until it finishes. Returns the finished job.
+        Raises RuntimeError if it failed, was cancelled or expired, and
+        TimeoutError if `timeout` seconds pass first.
+        """
+        started = time.monotonic()
+        while True:
+            job = self.client.batches.get(name=job_name)
+            state = getattr(job.state, "name", job.state)
+            if state in BULK_DONE_STATES:
+                break
+            if timeout is not None and time.monotonic() - started > timeout:
+                raise TimeoutError(f"Batch job {job_name} still {state}")
+            print(f"Batch job {job_name}: {state}")
+            time.sleep(poll_interval)
+
+        if state not in BULK_OK_STATES:
+            raise RuntimeError(f"Batch job {job_name} ended as {state}: {job.error}")
+        return job
+
+    @staticmethod
+    def _bulk_response_text(response):
+        """Returns the text of a batch result line's response."""
+        parts = response["candidates"][0]["content"]["parts"]
+        return "".join(part.get("text", "") for part in parts)
+
+    def bulk_results(self, job, failed=()):
+        """
+        Parses a finished batch job into HEADER-ordered rows.
+        Returns a list of (file_name, row) in request order; row is None
+        for cards that failed or returned invalid JSON, and for the
+        `failed` images from write_bulk_requests.
+        """
+        results = {index: (file_name, None) for index, file_name, _ in failed}
+        # File-based jobs always write their results to a file
+        content = self.client.files.download(file=job.dest.file_name)
+        lines = [json.loads(line) for line in
+                 content.decode("utf-8").splitlines() if line.strip()]
+
+        for line in lines:
+            index, _, file_name = line["key"].partition(":")
+            row = None
+            if not line.get("error"):
+                self.metrics.add_usage(
+                    (line.get("response") or {}).get("usageMetadata"))
+                try:
+                    data = json.loads(
+                        self._bulk_response_text(line.get("response")))
+                    data["fileName"] = file_name
+                    row = row_from_data(data)
+                except (json.JSONDecodeError, KeyError, IndexError, TypeError):
+                    print(f"Error decoding batch result for {file_name}")
             else:
-                print(f"Error processing {file_name}: {e}")
-                return None
+                print(f"Batch error for {file_name}: {line['error']}")
+            results[int(index)] = (file_name, row)
+
+        return [results[i] for i in sorted(results)]
+
+    def extract_bulk(self, images, load_image, request_path, poll_interval=60,
+                     timeout=None, preprocess=None):
+        """
+        Runs a whole image list as one offline batch job: writes the
+        request file, submits it, waits and parses the results.
+        Returns a list of (file_name, row) as in bulk_results; images
+        that could not be read have row None.
+        """
+        count, failed = self.write_bulk_requests(
+            images, load_image, request_path, preprocess=preprocess)
+        if not count:
+            return [(file_name, None) for _, file_name, _ in failed]
+        job = self.submit_bulk_job(request_path)
+        job = self.wait_for_bulk_job(job.name, poll_interval, timeout)
+        return self.bulk_results(job, failed)
@@ -0,0 +1,161 @@
+import threading
+import time
+import uuid
+from collections import deque
+
+from src.pipeline import (STATUS_DUPLICATE, STATUS_EMPTY, STATUS_OK,
+                          STATUS_QUOTA)
+
+RUNNING = "running"
+STOPPING = "stopping"
+DONE = "done"
+STOPPED = "stopped"
+FAILED = "failed"
+
+
+def describe(result):
+    """One log line for a PipelineResult."""
+    file_name = result.file_name
+    if result.status == STATUS_OK:
+        line = f"✅ {file_name}" + (" (cached)" if result.cached else "")
+        if result.write_error:
+            # Row stays buffered and is retried on next flush
+            line += f" ⚠️ write deferred: {str(result.write_error)[:50]}"
+        return line
+    if result.status == STATUS_DUPLICATE:
+        return f"🔁 {file_name} - Duplicate of {result.duplicate_of}"
+    if result.status == STATUS_EMPTY:
+        return f"⚠️ {file_name} - No data extracted"
+    if result.status == STATUS_QUOTA:
+        return f"⛔ {file_name} - Quota exceeded"
+    return f"❌ {file_name}: {str(result.error)[:50]}"
+
+
+class BackgroundJob:
+    """
+    Runs an ExtractionJob on a daemon thread, so it keeps going when the
+    page that started it reruns, is refreshed or is closed. The log is a
+    ring buffer of the last `log_lines` lines; snapshot() returns a small
+    status dict that is cheap to poll.
+    """
+
+    def __init__(self, job, label="", log_lines=200):
+        self.id = uuid.uuid4().hex[:8]
+        self.job = job
+        self.label = label
+        self.logs = deque(maxlen=log_lines)
+        self.state = RUNNING
+        self.error = None
+        self.started = time.time()
+        self.finished = None
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(
+            target=self._run, name=f"extraction-{self.id}", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def _run(self):
+        try:
+            # After stop(), the job starts nothing new but still yields
+            # (and writes) the cards in flight
+            for result in self.job.run():
+                self.logs.append(describe(result))
+            self.state = STOPPED if self.stop_event.is_set() else DONE
+        except Exception as e:
+            self.error = e
+            self.state = FAILED
+            self.logs.append(f"❌ Job failed: {e}")
+        finally:
+            self.finished = time.time()
+
+    def stop(self):
+        """Asks the job to stop after the cards already in flight."""
+        if self.state == RUNNING:
+            self.state = STOPPING
+            self.stop_event.set()
+            self.job.stop()
+
+    @property
+    def running(self):
+        return self.state in (RUNNING, STOPPING)
+
+    def snapshot(self):
+        """Progress, counters and stats for display."""
+        job = self.job
+        known_total = job.known_total
+        snapshot = {
+            "id": self.id,
+            "label": self.label,
+            "state": self.state,
+            "error": str(self.error) if self.error else None,
+            "elapsed": (self.finished or time.time()) - self.started,
+            "completed": job.completed,
+            "processed": job.processed,
+            "errors": job.errors,
+            "duplicates": job.duplicates,
+            "skipped": job.skipped,
+            "total_label": job.total_label,
+            "progress": job.completed / max(known_total, job.completed, 1),
+            "quota_exceeded": job.quota_exceeded,
+            "unsaved_path": job.unsaved_path,
+            "write_error": str(job.write_error) if job.write_error else None,
+            "logs": list(self.logs),
+            "tokens": dict(job.metrics.tokens),
+            "stages": job.metrics.stage_rows(),
+            "tiers": job.metrics.tier_rows(),
+        }
+        if job.cache:
+            snapshot["cache"] = {"hits": job.cache.hits, "misses": job.cache.misses}
+        if job.preprocess:
+            snapshot["bytes_saved"] = job.preprocess.bytes_saved
+        if job.rate_control:
+            snapshot["rate"] = job.rate_control.stats()
+        if job.key_pool:
+            snapshot["keys"] = job.key_pool.stats()
+        if hasattr(job.writer, "rows_updated"):
+            writer = job.writer
+            snapshot["sync"] = {"appended": writer.rows_appended,
+                                "updated": writer.rows_updated,
+                                "unchanged": writer.rows_unchanged}
+        if job.failures:
+            snapshot["failures"] = job.failures.counts()
+        return snapshot
+
+
+class JobRegistry:
+    """
+    Process-wide set of background jobs, so a job can be found again
+    from any session or after a page refresh. Only the most recent
+    `keep_finished` finished jobs are kept, with their logs and writers
+    (for downloads).
+    """
+
+    def __init__(self, keep_finished=5):
+        self.keep_finished = keep_finished
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def start(self, job, label="", log_lines=200):
+        """Starts an ExtractionJob in the background; returns the BackgroundJob."""
+        background = BackgroundJob(job, label, log_lines)
+        with self.lock:
+            self.jobs[background.id] = background
+            self._prune()
+        return background.start()
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        """All jobs, newest first."""
+        with self.lock:
+            return sorted(self.jobs.values(), key=lambda j: j.started, reverse=True)
+
+    def _prune(self):
+        finished = sorted((j for j in self.jobs.values() if not j.running),
+                          key=lambda j: j.started, reverse=True)
+        for old in finished[self.keep_finished:]:
+            del self.jobs[old.id]
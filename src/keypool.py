@@ -0,0 +1,216 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from src.clients import gemini_client
+from src.gemini import QuotaExceeded
+
+# Gemini daily quotas reset at midnight Pacific time
+QUOTA_TIMEZONE = ZoneInfo("America/Los_Angeles")
+
+ACTIVE = "active"
+COOLING = "cooling"
+EXHAUSTED = "exhausted"
+
+
+def parse_api_keys(value):
+    """Splits a comma/newline separated string (or list) into unique keys."""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.replace("\n", ",").split(",")
+    keys = []
+    for key in (k.strip() for k in value):
+        if key and key not in keys:
+            keys.append(key)
+    return keys
+
+
+def key_id(key):
+    """Short, non-secret identifier for a key (safe to log and persist)."""
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:8]
+
+
+def quota_day():
+    return datetime.now(QUOTA_TIMEZONE).strftime("%Y-%m-%d")
+
+
+class KeyState:
+    """Usage and health of one API key."""
+
+    def __init__(self, key):
+        self.key = key
+        self.id = key_id(key)
+        self.minute_calls = deque()  # Monotonic timestamps of recent calls
+        self.day = quota_day()
+        self.day_calls = 0
+        self.status = ACTIVE
+        self.retry_at = 0.0  # When a cooling/exhausted key may be probed again
+        self.errors = 0
+
+    def to_dict(self):
+        return {"day": self.day, "day_calls": self.day_calls,
+                "status": self.status, "errors": self.errors}
+
+
+class KeyPool:
+    """
+    Spreads Gemini requests across several API keys.
+
+    Each call goes to the key with the most remaining budget (per-minute
+    first, then per-day). A key that returns a 429 cools down for the
+    server's retry delay; one whose daily quota is exhausted is parked
+    until the quota day changes, with an hourly probe in case the daily
+    limit was misdetected. Per-day usage is saved to `state_path` so
+    budgets survive restarts. Raw keys are never written to disk.
+
+    Args:
+        keys: List of API keys.
+        rpm: Requests per minute allowed per key.
+        rpd: Requests per day allowed per key.
+        state_path: JSON file for persisted usage (None = in memory only).
+    """
+
+    COOLDOWN = 60.0          # Default pause after a per-minute 429
+    EXHAUSTED_PROBE = 3600.0  # Re-probe an exhausted key after this long
+    SAVE_INTERVAL = 5.0
+
+    def __init__(self, keys, rpm=15, rpd=1000, state_path=None):
+        if not keys:
+            raise ValueError("KeyPool needs at least one API key")
+        self.rpm = rpm
+        self.rpd = rpd
+        self.state_path = state_path
+        self.states = [KeyState(key) for key in keys]
+        self.cond = threading.Condition()
+        self.last_save = 0.0
+        self._load()
+
+    def __len__(self):
+        return len(self.states)
+
+    def _load(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path) as f:
+                saved = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Ignoring unreadable key usage file: {e}")
+            return
+        today = quota_day()
+        for state in self.states:
+            entry = saved.get(state.id)
+            if entry and entry.get("day") == today:
+                state.day_calls = entry.get("day_calls", 0)
+                state.errors = entry.get("errors", 0)
+                if entry.get("status") == EXHAUSTED:
+                    state.status = EXHAUSTED
+                    state.retry_at = time.monotonic() + self.EXHAUSTED_PROBE
+
+    def save(self):
+        """Writes per-key usage to the state file."""
+        if not self.state_path:
+            return
+        with self.cond:
+            data = {state.id: state.to_dict() for state in self.states}
+            self.last_save = time.monotonic()
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def client(self, key):
+        """Returns the shared genai.Client for a key."""
+        return gemini_client(key)
+
+    def _refresh(self, state, now):
+        """Rolls the day over, expires old minute calls and cooldowns."""
+        today = quota_day()
+        if state.day != today:
+            state.day = today
+            state.day_calls = 0
+            if state.status == EXHAUSTED:
+                state.status = ACTIVE
+        while state.minute_calls and now - state.minute_calls[0] >= 60:
+            state.minute_calls.popleft()
+        if state.status != ACTIVE and now >= state.retry_at:
+            # Cooldown over: probe the key again
+            state.status = ACTIVE
+
+    def _budget(self, state):
+        return (self.rpm - len(state.minute_calls), self.rpd - state.day_calls)
+
+    def acquire(self):
+        """
+        Reserves one request on the key with the most remaining budget and
+        returns that key. Blocks while every usable key is at its
+        per-minute limit. Raises QuotaExceeded(daily=True) when all keys
+        are exhausted for the day.
+        """
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                best = None
+                wake_at = None
+                for state in self.states:
+                    self._refresh(state, now)
+                    if state.status != ACTIVE:
+                        if state.status == COOLING:
+                            wake_at = min(wake_at or state.retry_at, state.retry_at)
+                        continue
+                    per_minute, per_day = self._budget(state)
+                    if per_day <= 0:
+                        continue
+                    if per_minute <= 0:
+                        free_at = state.minute_calls[0] + 60
+                        wake_at = min(wake_at or free_at, free_at)
+                        continue
+                    if best is None or self._budget(state) > self._budget(best):
+                        best = state
+
+                if best is not None:
+                    best.minute_calls.append(now)
+                    best.day_calls += 1
+                    save = now - self.last_save >= self.SAVE_INTERVAL
+                    break
+                if wake_at is None:
+                    raise QuotaExceeded("All API keys exhausted for today", daily=True)
+                self.cond.wait(timeout=max(0.05, wake_at - now))
+
+        if save:
+            self.save()
+        return best.key
+
+    def report_quota_error(self, key, error):
+        """Marks a key cooling down (per-minute 429) or exhausted (daily)."""
+        with self.cond:
+            state = next(s for s in self.states if s.key == key)
+            state.errors += 1
+            now = time.monotonic()
+            if error.daily:
+                state.status = EXHAUSTED
+                state.retry_at = now + self.EXHAUSTED_PROBE
+                print(f"API key {state.id}: daily quota exhausted")
+            else:
+                state.status = COOLING
+                state.retry_at = now + (error.retry_after or self.COOLDOWN)
+                print(f"API key {state.id}: rate limited, cooling down")
+            self.cond.notify_all()
+        self.save()
+
+    def stats(self):
+        """Per-key usage, for display."""
+        with self.cond:
+            now = time.monotonic()
+            for state in self.states:
+                self._refresh(state, now)
+            return [{"id": s.id, "status": s.status, "day_calls": s.day_calls,
+                     "minute_calls": len(s.minute_calls), "errors": s.errors}
+                    for s in self.states]
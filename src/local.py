@@ -2,24 +2,64 @@ import os
 import io
 from PIL import Image
 
-def list_local_images(folder_path):
+SUPPORTED_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+def is_image_file(name):
+    return name.lower().endswith(SUPPORTED_EXTENSIONS)
+
+def image_entry(path, name, stat):
+    """Image dict for a local file, with the stat fields used by LocalIndex."""
+    return {
+        'id': path,
+        'name': name,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns
+    }
+
+def relative_name(folder_path, path):
+    """fileName for a file: its path below the folder, '/'-separated."""
+    return os.path.relpath(path, folder_path).replace(os.sep, '/')
+
+def scan_images(folder_path, recursive=False):
     """
-    Lists all image files in a local folder.
-    Returns a list of dicts: {'id': file_path, 'name': file_name}
+    Yields image dicts for the image files in a local folder (and, with
+    `recursive`, its subfolders), using os.scandir so file sizes and
+    mtimes come from the directory listing. Files in subfolders are named
+    by their relative path (e.g. 'scans/card.jpg'); top-level files keep
+    their plain name. Hidden files and folders are skipped.
+    """
+    stack = [folder_path]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                entries = sorted(entries, key=lambda e: e.name)
+        except OSError as e:
+            print(f"Cannot read {directory}: {e}")
+            continue
+        subdirs = []
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+            elif is_image_file(entry.name) and entry.is_file():
+                yield image_entry(entry.path,
+                                  relative_name(folder_path, entry.path),
+                                  entry.stat())
+        if recursive:
+            stack.extend(reversed(subdirs))
+
+def list_local_images(folder_path, recursive=False):
+    """
+    Lists all image files in a local folder and, with `recursive`, its
+    subfolders.
+    Returns a list of dicts: {'id': file_path, 'name': file_name, ...}
     """
-    supported_extensions = ('.jpg', '.jpeg', '.png', '.webp')
-    images = []
-    
     if not os.path.exists(folder_path):
         raise FileNotFoundError(f"Folder not found: {folder_path}")
-    
-    for filename in os.listdir(folder_path):
-        if filename.lower().endswith(supported_extensions):
-            images.append({
-                'id': os.path.join(folder_path, filename),
-                'name': filename
-            })
-    
+
+    images = list(scan_images(folder_path, recursive))
     print(f"Found {len(images)} image files in local folder.")
     return images
 
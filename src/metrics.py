@@ -0,0 +1,285 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+# Pipeline stages, in the order a card passes through them
+STAGES = ["list", "load", "preprocess", "model", "parse", "write"]
+
+# Upper bounds (seconds) of the stage latency buckets
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0, 60.0)
+
+# Upper bounds of the tokens-per-request buckets
+TOKEN_BUCKETS = (250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+# usage_metadata attribute -> token type
+TOKEN_FIELDS = {
+    "prompt_token_count": "prompt",
+    "candidates_token_count": "output",
+    "cached_content_token_count": "cached",
+    "thoughts_token_count": "thoughts",
+    "total_token_count": "total",
+}
+
+PROMETHEUS_PREFIX = "card_extractor"
+
+
+def format_bound(bound):
+    return "+Inf" if bound == float("inf") else f"{bound:g}"
+
+
+class Histogram:
+    """Fixed-bucket histogram, Prometheus style (le = upper bound)."""
+
+    def __init__(self, buckets):
+        self.bounds = tuple(buckets) + (float("inf"),)
+        self.counts = [0] * len(self.bounds)  # Per bucket, not cumulative
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """
+        Estimates a quantile by linear interpolation inside its bucket
+        (like Prometheus' histogram_quantile). Capped at the largest
+        observed value.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for bound, count in zip(self.bounds, self.counts):
+            if count and seen + count >= rank:
+                upper = min(bound, self.max)
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+            lower = bound
+        return self.max
+
+    def cumulative(self):
+        """Returns [(upper bound, cumulative count)]."""
+        total = 0
+        result = []
+        for bound, count in zip(self.bounds, self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def bucket_counts(self, unit=""):
+        """Returns [(bucket label, count)], not cumulative (for charts)."""
+        labels = [f"≤{format_bound(b)}{unit}" for b in self.bounds[:-1]]
+        labels.append(f">{format_bound(self.bounds[-2])}{unit}")
+        return list(zip(labels, self.counts))
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 4),
+            "mean": round(self.sum / self.count, 4) if self.count else 0.0,
+            "p50": round(self.quantile(0.5), 4),
+            "p95": round(self.quantile(0.95), 4),
+            "max": round(self.max, 4),
+            "buckets": {format_bound(b): c for b, c in self.cumulative()},
+        }
+
+
+class Metrics:
+    """
+    Thread-safe run metrics: per-stage timings, Gemini token usage,
+    card outcomes and, with a model cascade, per-model results. Export
+    with to_json() / to_prometheus() or write().
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {stage: Histogram(SECONDS_BUCKETS) for stage in STAGES}
+        self.tokens = {name: 0 for name in TOKEN_FIELDS.values()}
+        self.request_tokens = Histogram(TOKEN_BUCKETS)
+        self.cards = {}
+        self.tiers = {}  # model -> {"cards", "valid", "seconds": Histogram}
+        self.started = time.time()
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            if stage not in self.stages:
+                self.stages[stage] = Histogram(SECONDS_BUCKETS)
+            self.stages[stage].observe(seconds)
+
+    @contextmanager
+    def time(self, stage):
+        """Context manager timing the block as one `stage` observation."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def timed(self, stage, fn):
+        """Wraps fn so every call is timed as `stage`."""
+        def wrapper(*args, **kwargs):
+            with self.time(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    def timed_iter(self, stage, iterable):
+        """Yields from iterable, timing each step (e.g. paged listings)."""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.observe(stage, time.perf_counter() - start)
+                return
+            self.observe(stage, time.perf_counter() - start)
+            yield item
+
+    def add_usage(self, usage):
+        """
+        Adds a Gemini response's usage_metadata. Also accepts the
+        camelCase dict found in batch job results; None is ignored.
+        """
+        if usage is None:
+            return
+        counts = {}
+        for field, name in TOKEN_FIELDS.items():
+            if isinstance(usage, dict):
+                head, *rest = field.split("_")
+                field = head + "".join(word.title() for word in rest)
+                counts[name] = usage.get(field) or 0
+            else:
+                counts[name] = getattr(usage, field, None) or 0
+        with self.lock:
+            for name, count in counts.items():
+                self.tokens[name] += count
+            if counts["total"]:
+                self.request_tokens.observe(counts["total"])
+
+    def record_result(self, status):
+        with self.lock:
+            self.cards[status] = self.cards.get(status, 0) + 1
+
+    def record_tier(self, model, seconds, cards=1, valid=0):
+        """
+        Records one request to a cascade tier: its latency, the cards it
+        returned and how many of them passed validation.
+        """
+        with self.lock:
+            tier = self.tiers.get(model)
+            if tier is None:
+                tier = self.tiers[model] = {
+                    "cards": 0, "valid": 0, "seconds": Histogram(SECONDS_BUCKETS)}
+            tier["cards"] += cards
+            tier["valid"] += valid
+            tier["seconds"].observe(seconds)
+
+    def tier_rows(self):
+        """One dict per cascade tier, in the order they were first used."""
+        with self.lock:
+            return [{"model": model, "requests": t["seconds"].count,
+                     "cards": t["cards"], "valid": t["valid"],
+                     "p50 (s)": round(t["seconds"].quantile(0.5), 3),
+                     "p95 (s)": round(t["seconds"].quantile(0.95), 3)}
+                    for model, t in self.tiers.items()]
+
+    def stage_rows(self):
+        """One dict per stage that has observations, for tables."""
+        with self.lock:
+            return [{"stage": stage, "count": h.count,
+                     "p50 (s)": round(h.quantile(0.5), 3),
+                     "p95 (s)": round(h.quantile(0.95), 3),
+                     "total (s)": round(h.sum, 1)}
+                    for stage, h in self.stages.items() if h.count]
+
+    def stage_histograms(self):
+        """{stage: {bucket label: count}} for stages with observations."""
+        with self.lock:
+            return {stage: dict(h.bucket_counts("s"))
+                    for stage, h in self.stages.items() if h.count}
+
+    def summary(self):
+        """JSON-serialisable snapshot of all metrics."""
+        with self.lock:
+            return {
+                "elapsed_seconds": round(time.time() - self.started, 3),
+                "cards": dict(self.cards),
+                "stages": {stage: h.summary() for stage, h in self.stages.items()},
+                "tokens": dict(self.tokens),
+                "request_tokens": self.request_tokens.summary(),
+                "tiers": {model: {"cards": t["cards"], "valid": t["valid"],
+                                  "seconds": t["seconds"].summary()}
+                          for model, t in self.tiers.items()},
+            }
+
+    def to_json(self):
+        return json.dumps(self.summary(), indent=2)
+
+    def to_prometheus(self):
+        """Metrics in the Prometheus text exposition format."""
+        p = PROMETHEUS_PREFIX
+        lines = []
+        with self.lock:
+            lines.append(f"# HELP {p}_stage_seconds Time spent per pipeline stage.")
+            lines.append(f"# TYPE {p}_stage_seconds histogram")
+            for stage, hist in self.stages.items():
+                for bound, count in hist.cumulative():
+                    lines.append(f'{p}_stage_seconds_bucket{{stage="{stage}",'
+                                 f'le="{format_bound(bound)}"}} {count}')
+                lines.append(f'{p}_stage_seconds_sum{{stage="{stage}"}} {hist.sum:.6f}')
+                lines.append(f'{p}_stage_seconds_count{{stage="{stage}"}} {hist.count}')
+
+            lines.append(f"# HELP {p}_tokens_total Gemini tokens used, by type.")
+            lines.append(f"# TYPE {p}_tokens_total counter")
+            for name, count in self.tokens.items():
+                lines.append(f'{p}_tokens_total{{type="{name}"}} {count}')
+
+            lines.append(f"# HELP {p}_request_tokens Total tokens per Gemini request.")
+            lines.append(f"# TYPE {p}_request_tokens histogram")
+            for bound, count in self.request_tokens.cumulative():
+                lines.append(f'{p}_request_tokens_bucket{{le="{format_bound(bound)}"}} {count}')
+            lines.append(f"{p}_request_tokens_sum {self.request_tokens.sum:.0f}")
+            lines.append(f"{p}_request_tokens_count {self.request_tokens.count}")
+
+            lines.append(f"# HELP {p}_cards_total Cards processed, by outcome.")
+            lines.append(f"# TYPE {p}_cards_total counter")
+            for status, count in sorted(self.cards.items()):
+                lines.append(f'{p}_cards_total{{status="{status}"}} {count}')
+
+            if self.tiers:
+                lines.append(f"# HELP {p}_tier_cards_total Cards sent to each "
+                             f"cascade model, by validation result.")
+                lines.append(f"# TYPE {p}_tier_cards_total counter")
+                for model, tier in self.tiers.items():
+                    lines.append(f'{p}_tier_cards_total{{model="{model}",'
+                                 f'valid="true"}} {tier["valid"]}')
+                    lines.append(f'{p}_tier_cards_total{{model="{model}",'
+                                 f'valid="false"}} {tier["cards"] - tier["valid"]}')
+                lines.append(f"# HELP {p}_tier_seconds Request latency per "
+                             f"cascade model.")
+                lines.append(f"# TYPE {p}_tier_seconds histogram")
+                for model, tier in self.tiers.items():
+                    hist = tier["seconds"]
+                    for bound, count in hist.cumulative():
+                        lines.append(f'{p}_tier_seconds_bucket{{model="{model}",'
+                                     f'le="{format_bound(bound)}"}} {count}')
+                    lines.append(f'{p}_tier_seconds_sum{{model="{model}"}} {hist.sum:.6f}')
+                    lines.append(f'{p}_tier_seconds_count{{model="{model}"}} {hist.count}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Writes JSON for .json paths, else Prometheus text (.prom)."""
+        text = self.to_json() if path.lower().endswith(".json") else self.to_prometheus()
+        with open(path, "w") as f:
+            f.write(text)
+        return path
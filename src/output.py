@@ -0,0 +1,285 @@
+import csv
+import hashlib
+import json
+import os
+from src.resume import load_csv_file_names
+from src.sheets import HEADER
+
+MIME_TYPES = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+PARQUET_BATCH_ROWS = 10000
+
+
+class CSVWriter:
+    """
+    Streams rows to a CSV file as they complete. Every row is flushed to
+    disk, so partial results survive a crash.
+    When the file already exists, rows are appended after its header.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, "a", newline="", encoding="utf-8")
+        # Quote ALL fields to prevent commas from breaking columns
+        self.writer = csv.writer(self.file, quoting=csv.QUOTE_ALL)
+        if is_new:
+            self.writer.writerow(HEADER)
+        self.rows_written = 0
+
+    def add(self, row):
+        self.writer.writerow(row)
+        self.file.flush()
+        self.rows_written += 1
+
+    def close(self):
+        self.file.close()
+
+
+class JSONLWriter:
+    """Streams rows to a JSON Lines file, one object per row."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "a", encoding="utf-8")
+        self.rows_written = 0
+
+    def add(self, row):
+        self.file.write(json.dumps(dict(zip(HEADER, row)), ensure_ascii=False) + "\n")
+        self.file.flush()
+        self.rows_written += 1
+
+    def close(self):
+        self.file.close()
+
+
+def iter_jsonl_rows(path):
+    """
+    Yields rows (in HEADER order) from a JSON Lines file, one line at a
+    time. Skips a truncated last line left by a crash.
+    """
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                data = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            yield [data.get(field, "") for field in HEADER]
+
+
+class SpoolWriter(JSONLWriter):
+    """
+    Appends rows to an on-disk JSON Lines spool as they complete, so a
+    run's memory stays flat however many cards it has, and the rows
+    written so far survive a crash. export() streams the spool into a
+    CSV, JSONL or Parquet file at the end.
+    """
+
+    def __init__(self, path, reset=False):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if reset and os.path.exists(path):
+            os.remove(path)
+        super().__init__(path)
+
+    @staticmethod
+    def for_source(spool_dir, source, reset=False):
+        """The spool for a source folder, so a re-run can resume into it."""
+        key = hashlib.sha1(os.path.abspath(source).encode("utf-8")).hexdigest()[:16]
+        return SpoolWriter(os.path.join(spool_dir, f"{key}.jsonl"), reset=reset)
+
+    def iter_rows(self):
+        """Yields every spooled row, including those from earlier runs."""
+        if not self.file.closed:
+            self.file.flush()
+        return iter_jsonl_rows(self.path)
+
+    def export(self, path=None, fmt=None):
+        """
+        Writes the spooled rows to `path` (default: next to the spool,
+        never the spool itself) and returns the path.
+        """
+        if path is None:
+            path = os.path.splitext(self.path)[0] + f"-export.{fmt or 'csv'}"
+        return export_rows(self.iter_rows(), path, fmt)
+
+
+class ParquetWriter(SpoolWriter):
+    """
+    Parquet files cannot be appended to row by row, so rows are spooled
+    to `<path>.spool.jsonl` as they complete and converted to Parquet on
+    close. The spool is kept: it holds every row, so a resumed run adds
+    to it and the Parquet file is rewritten complete.
+    """
+
+    def __init__(self, path):
+        self.output_path = path
+        super().__init__(path + ".spool.jsonl")
+
+    def close(self):
+        super().close()
+        self.export(self.output_path, "parquet")
+
+
+class UpsertWriter:
+    """
+    Wraps a CSV, JSONL, Parquet or spool writer so that a row for a
+    fileName already in the output replaces the old row instead of
+    adding a second one (for images that changed since they were
+    extracted). Rows are still appended as they complete, so they
+    survive a crash; on close, if any name was written again, the file
+    is rewritten once keeping the newest row per fileName.
+
+    Args:
+        writer: The writer to wrap; other attributes are passed through.
+        existing_names: fileName values already in the output.
+    """
+
+    def __init__(self, writer, existing_names):
+        self.writer = writer
+        self.names = set(existing_names)
+        self.rows_replaced = 0
+
+    def __getattr__(self, name):
+        return getattr(self.writer, name)
+
+    def add(self, row):
+        self.writer.add(row)
+        if row[0] in self.names:
+            self.rows_replaced += 1
+        else:
+            self.names.add(row[0])
+
+    def close(self):
+        self.writer.close()
+        if not self.rows_replaced:
+            return
+        # Parquet rows live in a JSONL spool
+        fmt = "csv" if isinstance(self.writer, CSVWriter) else "jsonl"
+        compact_output(self.writer.path, fmt)
+        if isinstance(self.writer, ParquetWriter):
+            self.writer.export(self.writer.output_path, "parquet")
+        print(f"Replaced {self.rows_replaced} rows of changed images.")
+
+
+WRITERS = {
+    "csv": CSVWriter,
+    "jsonl": JSONLWriter,
+    "parquet": ParquetWriter,
+}
+
+
+def parquet_available():
+    """True if pyarrow (optional, needed for Parquet) is installed."""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def output_format(path, fmt=None):
+    """Returns the output format, inferred from the file extension if not given."""
+    fmt = (fmt or os.path.splitext(path)[1].lstrip(".")).lower()
+    if fmt not in WRITERS:
+        raise ValueError(
+            f"Unsupported output format: {fmt!r} (use csv, jsonl or parquet)")
+    if fmt == "parquet" and not parquet_available():
+        raise ValueError("Parquet output needs pyarrow: pip install pyarrow")
+    return fmt
+
+
+def open_writer(path, fmt=None):
+    """Opens a streaming writer for `path` (csv, jsonl or parquet)."""
+    return WRITERS[output_format(path, fmt)](path)
+
+
+def write_parquet(rows, path, batch_rows=PARQUET_BATCH_ROWS):
+    """Writes rows to a Parquet file in row groups of `batch_rows`."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(field, pa.string()) for field in HEADER])
+
+    def table(batch):
+        columns = list(zip(*batch)) if batch else [[] for _ in HEADER]
+        return pa.Table.from_arrays(
+            [pa.array(["" if v is None else str(v) for v in column], pa.string())
+             for column in columns],
+            schema=schema)
+
+    with pq.ParquetWriter(path, schema) as writer:
+        batch = []
+        written = False
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_rows:
+                writer.write_table(table(batch))
+                written = True
+                batch = []
+        if batch or not written:
+            writer.write_table(table(batch))
+
+
+def export_rows(rows, path, fmt=None):
+    """Streams rows (in HEADER order) to a CSV, JSONL or Parquet file."""
+    fmt = output_format(path, fmt)
+    if fmt == "parquet":
+        write_parquet(rows, path)
+        return path
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            # Quote ALL fields to prevent commas from breaking columns
+            writer = csv.writer(f, quoting=csv.QUOTE_ALL)
+            writer.writerow(HEADER)
+            writer.writerows(rows)
+        else:
+            for row in rows:
+                f.write(json.dumps(dict(zip(HEADER, row)), ensure_ascii=False) + "\n")
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_output_file_names(path, fmt=None):
+    """Returns the fileName values already in an output file (for resume)."""
+    fmt = output_format(path, fmt)
+    if fmt == "parquet" and os.path.exists(path + ".spool.jsonl"):
+        # The spool has every row, even if the run died before converting
+        return {row[0] for row in iter_jsonl_rows(path + ".spool.jsonl")}
+    if not os.path.exists(path):
+        return set()
+    if fmt == "csv":
+        return load_csv_file_names(path)
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        return set(pq.read_table(path, columns=["fileName"]).column(0).to_pylist())
+    return {row[0] for row in iter_jsonl_rows(path)}
+
+
+def iter_output_rows(path, fmt=None):
+    """Yields the rows (in HEADER order) of a CSV or JSONL output file."""
+    if output_format(path, fmt) != "csv":
+        yield from iter_jsonl_rows(path)
+        return
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        next(reader, None)  # HEADER
+        yield from (row for row in reader if row)
+
+
+def compact_output(path, fmt=None):
+    """
+    Rewrites a CSV or JSONL output keeping only the newest (last) row per
+    fileName. The file is read twice rather than held in memory.
+    """
+    last = {}
+    for number, row in enumerate(iter_output_rows(path, fmt)):
+        last[row[0]] = number
+    rows = (row for number, row in enumerate(iter_output_rows(path, fmt))
+            if last[row[0]] == number)
+    return export_rows(rows, path, fmt)
@@ -0,0 +1,423 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from src.metrics import Metrics
+from src.sheets import row_from_data
+
+STATUS_OK = "ok"
+STATUS_EMPTY = "empty"
+STATUS_ERROR = "error"
+STATUS_QUOTA = "quota"
+STATUS_DUPLICATE = "duplicate"
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket allowing `rpm` requests per minute.
+    `burst` is the number of requests that may be sent back to back
+    before the steady rate applies.
+    """
+
+    def __init__(self, rpm, burst=1):
+        self.rate = rpm / 60.0 if rpm else None
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def set_rate(self, rpm):
+        """Changes the allowed requests per minute."""
+        with self.lock:
+            self.rate = rpm / 60.0 if rpm else None
+
+    def acquire(self):
+        """Blocks until a request may be sent."""
+        if self.rate is None:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity,
+                                  self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def call(self, fn, *args, **kwargs):
+        """Waits for a token, then calls fn."""
+        self.acquire()
+        return fn(*args, **kwargs)
+
+
+class CountingIterator:
+    """Wraps an iterable and counts the items drawn from it so far."""
+
+    def __init__(self, iterable):
+        self.iterable = iter(iterable)
+        self.count = 0
+        self.exhausted = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            item = next(self.iterable)
+        except StopIteration:
+            self.exhausted = True
+            raise
+        self.count += 1
+        return item
+
+
+def prefetch(items, load, ahead=8):
+    """
+    Loads items in background threads, keeping up to `ahead` loads in
+    flight ahead of the consumer. Items are drawn from `items` lazily.
+
+    Yields (item, data, error) in input order; exactly one of data/error
+    is set.
+    """
+    items = iter(items)
+    window = deque()
+    pool = ThreadPoolExecutor(max_workers=ahead)
+
+    def fill():
+        while len(window) < ahead:
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            window.append((item, pool.submit(load, item)))
+
+    try:
+        fill()
+        while window:
+            item, future = window.popleft()
+            fill()
+            try:
+                data, error = future.result(), None
+            except Exception as e:
+                data, error = None, e
+            yield item, data, error
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+class PipelineResult:
+    """Outcome of processing a single image."""
+
+    def __init__(self, index, image, status, row=None, error=None,
+                 cached=False, duplicate_of=None):
+        self.index = index
+        self.image = image
+        self.status = status
+        self.row = row
+        self.error = error
+        self.cached = cached
+        self.duplicate_of = duplicate_of  # Index, then file name, of the original
+        self.write_error = None
+
+    @property
+    def file_name(self):
+        return self.image['name']
+
+
+class ExtractionPipeline:
+    """
+    Runs Gemini extraction over a list of images with a bounded worker pool.
+
+    Args:
+        extractor: A GeminiExtractor (anything with extract_data,
+            escalation_problems and escalate).
+        load_image: Callable taking an image dict and returning its bytes.
+        workers: Number of images processed concurrently.
+        rpm: Requests per minute allowed to the model (None = unlimited).
+        cache: Optional ExtractionCache; hits skip the model call entirely.
+        prefetch: If > 0, images are loaded by a separate download stage
+            that stays this many images ahead of the extraction workers.
+        preprocess: Optional ImagePreprocessor applied before the model
+            call (after the cache lookup).
+        batch_size: Cards packed into one model request (1 = one card per
+            request). Uses extractor.extract_batch when > 1.
+        rate_control: Optional AdaptiveRateController. Replaces the fixed
+            `rpm` limit and retries 429s instead of stopping the run.
+        dedupe: Optional NearDuplicateIndex. Near-identical images reuse the
+            first copy's row (STATUS_DUPLICATE) instead of calling the model.
+        metrics: Metrics receiving load and preprocess timings. Defaults to
+            the extractor's, so model timings and token usage land in the
+            same place.
+    """
+
+    def __init__(self, extractor, load_image, workers=4, rpm=15, cache=None,
+                 prefetch=0, preprocess=None, batch_size=1, rate_control=None,
+                 dedupe=None, metrics=None):
+        self.extractor = extractor
+        self.cache = cache
+        self.prefetch = prefetch
+        self.preprocess = preprocess
+        self.batch_size = max(1, batch_size)
+        self.dedupe = dedupe
+        self.metrics = metrics or getattr(extractor, "metrics", None) or Metrics()
+        self.load_image = self.metrics.timed("load", load_image)
+        self.workers = max(1, workers)
+        self.rate = rate_control or RateLimiter(rpm)
+        self.quota_hit = threading.Event()
+
+    def fingerprint(self):
+        """Extractor fingerprint plus preprocessing settings."""
+        fingerprint = self.extractor.fingerprint()
+        if self.preprocess:
+            fingerprint += f":{self.preprocess.signature}"
+        return fingerprint
+
+    def _prepare(self, index, image, image_bytes, load_error):
+        """
+        Loads, cache-checks and preprocesses one image.
+        Returns a finished PipelineResult, or a tuple
+        (index, image, image_bytes, mime_type, cache_key) still to extract.
+        """
+        if self.quota_hit.is_set():
+            return PipelineResult(index, image, STATUS_QUOTA)
+        if load_error is not None:
+            return PipelineResult(index, image, STATUS_ERROR, error=load_error)
+        try:
+            if image_bytes is None:
+                image_bytes = self.load_image(image)
+
+            key = None
+            if self.cache:
+                key = self.cache.make_key(image_bytes, self.fingerprint())
+                data = self.cache.get(key)
+                if data:
+                    data["fileName"] = image['name']
+                    return PipelineResult(index, image, STATUS_OK,
+                                          row=row_from_data(data), cached=True)
+
+            mime_type = None
+            if self.preprocess:
+                with self.metrics.time("preprocess"):
+                    image_bytes, mime_type = self.preprocess(image_bytes)
+        except Exception as e:
+            return PipelineResult(index, image, STATUS_ERROR, error=e)
+
+        return index, image, image_bytes, mime_type, key
+
+    def _finish(self, index, image, data, key):
+        """Caches data and wraps it in a PipelineResult."""
+        if not data:
+            return PipelineResult(index, image, STATUS_EMPTY)
+        if self.cache:
+            self.cache.put(key, data)
+        return PipelineResult(index, image, STATUS_OK, row=row_from_data(data))
+
+    def _escalate(self, prepared, data):
+        """
+        Re-runs a result that fails the extractor's validation on its
+        escalation model, as a rate-limited call of its own, so a retried
+        429 repeats only the escalation. On a quota error the first result
+        is kept and the run stops as usual.
+        """
+        _, image, image_bytes, mime_type, _ = prepared
+        problems = self.extractor.escalation_problems(data)
+        if not problems or self.quota_hit.is_set():
+            return data
+        try:
+            return self.rate.call(
+                self.extractor.escalate,
+                image_bytes, image['name'], mime_type, data, problems)
+        except ResourceWarning:
+            self.quota_hit.set()
+        except Exception as e:
+            print(f"Escalation failed for {image['name']}: {e}")
+        return data
+
+    def _extract_single(self, prepared):
+        """Extracts one prepared image with its own model call."""
+        index, image, image_bytes, mime_type, key = prepared
+        if self.quota_hit.is_set():
+            return PipelineResult(index, image, STATUS_QUOTA)
+        try:
+            data = self.rate.call(
+                self.extractor.extract_data,
+                image_bytes, image['name'], mime_type=mime_type, escalate=False)
+        except ResourceWarning as e:
+            self.quota_hit.set()
+            return PipelineResult(index, image, STATUS_QUOTA, error=e)
+        except Exception as e:
+            return PipelineResult(index, image, STATUS_ERROR, error=e)
+        data = self._escalate(prepared, data)
+        if not data:
+            # The extractor logs and swallows errors; keep them on the result
+            last_error = getattr(self.extractor, "last_error", None)
+            error = last_error() if last_error else None
+            if error is not None:
+                return PipelineResult(index, image, STATUS_ERROR, error=error)
+        return self._finish(index, image, data, key)
+
+    def _extract_batch(self, prepared):
+        """
+        Extracts several prepared images with one model call. Cards the
+        batched response does not cover fall back to single calls.
+        """
+        try:
+            batch = self.rate.call(
+                self.extractor.extract_batch,
+                [(p[2], p[1]['name'], p[3]) for p in prepared], escalate=False)
+        except ResourceWarning as e:
+            self.quota_hit.set()
+            return [PipelineResult(p[0], p[1], STATUS_QUOTA, error=e)
+                    for p in prepared]
+        except Exception as e:
+            print(f"Batch request failed, retrying cards one by one: {e}")
+            batch = {}
+
+        results = []
+        for p in prepared:
+            index, image, _, _, key = p
+            data = batch.get(image['name'])
+            if data:
+                data = self._escalate(p, data)
+                data["fileName"] = image['name']
+                results.append(self._finish(index, image, data, key))
+            else:
+                results.append(self._extract_single(p))
+        return results
+
+    def process_group(self, entries):
+        """
+        Processes a group of (index, image, image_bytes, load_error)
+        entries. With batch_size > 1, uncached images in the group share
+        one model call. Never raises; returns results in input order.
+        """
+        results = []
+        prepared = []
+        for entry in entries:
+            outcome = self._prepare(*entry)
+            if isinstance(outcome, PipelineResult):
+                results.append(outcome)
+            else:
+                prepared.append(outcome)
+
+        names = [p[1]['name'] for p in prepared]
+        if len(prepared) > 1 and len(set(names)) == len(names):
+            results.extend(self._extract_batch(prepared))
+        else:
+            results.extend(self._extract_single(p) for p in prepared)
+
+        return sorted(results, key=lambda r: r.index)
+
+    def process(self, index, image, image_bytes=None, load_error=None):
+        """
+        Loads (unless already prefetched) and extracts one image.
+        Never raises.
+        """
+        return self.process_group([(index, image, image_bytes, load_error)])[0]
+
+    def _load_and_hash(self, image):
+        """Loader used with dedupe: returns (image_bytes, perceptual hash)."""
+        image_bytes = self.load_image(image)
+        try:
+            return image_bytes, self.dedupe.hash(image_bytes)
+        except Exception as e:
+            # Unreadable by Pillow: skip dedupe, let the model try
+            print(f"Could not hash {image['name']}: {e}")
+            return image_bytes, None
+
+    def _resolve_duplicate(self, result):
+        """
+        Fills a duplicate's row from its (already finished) original. A
+        duplicate of an original stopped by the quota is skipped too, so
+        the next run extracts both.
+        """
+        if self.dedupe.is_quota_skipped(result.duplicate_of):
+            result.duplicate_of = self.dedupe.original(result.duplicate_of)[0]
+            result.status = STATUS_QUOTA
+            return
+        original_name, row = self.dedupe.original(result.duplicate_of)
+        result.duplicate_of = original_name
+        if row is None:
+            result.status = STATUS_ERROR
+            result.error = f"Duplicate of {original_name}, which failed"
+            return
+        result.row = [result.file_name] + row[1:]
+
+    def run(self, images, stop_event=None):
+        """
+        Yields a PipelineResult for every image, in input order.
+        Stops after the first quota error, or once `stop_event` is set:
+        images already started finish and are yielded, images not yet
+        started are not.
+        """
+        self.quota_hit.clear()
+        pending = deque()
+        if self.dedupe:
+            # Hashing happens in the load stage; matching happens here in
+            # input order, so an original is always seen before its copies
+            loaded = prefetch(images, self._load_and_hash,
+                              ahead=max(self.prefetch, self.workers * 2))
+        elif self.prefetch:
+            loaded = prefetch(images, self.load_image, ahead=self.prefetch)
+        else:
+            loaded = ((image, None, None) for image in images)
+        items = iter(enumerate(loaded))
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                def fill():
+                    # Keep a bounded window of groups in flight
+                    group = []
+                    while (len(pending) < self.workers * 2
+                           and not self.quota_hit.is_set()
+                           and not (stop_event and stop_event.is_set())):
+                        try:
+                            index, (image, image_bytes, error) = next(items)
+                        except StopIteration:
+                            break
+                        if self.dedupe and image_bytes is not None:
+                            image_bytes, phash = image_bytes
+                            original = None
+                            if phash is not None:
+                                original = self.dedupe.match(phash, index, image['name'])
+                            if original is not None:
+                                if group:
+                                    pending.append(pool.submit(self.process_group, group))
+                                    group = []
+                                pending.append(PipelineResult(
+                                    index, image, STATUS_DUPLICATE,
+                                    duplicate_of=original))
+                                continue
+                        group.append((index, image, image_bytes, error))
+                        if len(group) >= self.batch_size:
+                            pending.append(pool.submit(self.process_group, group))
+                            group = []
+                    if group:
+                        pending.append(pool.submit(self.process_group, group))
+
+                fill()
+                while pending:
+                    entry = pending.popleft()
+                    if isinstance(entry, PipelineResult):
+                        results = [entry]
+                    else:
+                        results = entry.result()
+                    for result in results:
+                        if self.dedupe:
+                            if result.status == STATUS_DUPLICATE:
+                                self._resolve_duplicate(result)
+                            elif result.status == STATUS_OK:
+                                self.dedupe.set_row(result.index, result.row)
+                            elif result.status == STATUS_QUOTA:
+                                self.dedupe.set_quota_skipped(result.index)
+                        if result.status == STATUS_QUOTA and result.error is None:
+                            # Skipped because another worker hit the quota
+                            continue
+                        yield result
+                    fill()
+        finally:
+            loaded.close()
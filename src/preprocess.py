@@ -0,0 +1,108 @@
+import io
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageOps
+
+MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+}
+
+
+def detect_mime_type(image_bytes):
+    """
+    Detects the MIME type from the file signature.
+    Falls back to image/jpeg for unknown data.
+    """
+    if image_bytes[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    if image_bytes[:4] == b"RIFF" and image_bytes[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
+
+
+def preprocess_image(image_bytes, max_edge=1600, fmt="JPEG", quality=85):
+    """
+    Applies EXIF orientation, downscales so the longest edge is at most
+    `max_edge` pixels and re-encodes to `fmt` (JPEG or WEBP).
+
+    Returns (image_bytes, mime_type). If re-encoding would not make the
+    image smaller and no rotation/resize was needed, the original bytes
+    are returned unchanged.
+    """
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        # EXIF tag 0x0112 is the orientation; 1 means already upright
+        changed = img.getexif().get(0x0112, 1) != 1
+        transposed = ImageOps.exif_transpose(img)
+
+        if max(transposed.size) > max_edge:
+            transposed.thumbnail((max_edge, max_edge), Image.LANCZOS)
+            changed = True
+
+        if transposed.mode not in ("RGB", "L"):
+            transposed = transposed.convert("RGB")
+
+        out = io.BytesIO()
+        transposed.save(out, format=fmt, quality=quality, optimize=True)
+
+    data = out.getvalue()
+    if not changed and len(data) >= len(image_bytes):
+        return image_bytes, detect_mime_type(image_bytes)
+    return data, MIME_TYPES[fmt]
+
+
+class ImagePreprocessor:
+    """
+    Runs preprocess_image in a process pool so image decoding does not
+    hold the GIL of the extraction threads. Callable from many threads.
+
+    Tracks bytes_in / bytes_out for reporting bytes saved per run.
+    """
+
+    def __init__(self, max_edge=1600, fmt="JPEG", quality=85, processes=None):
+        self.max_edge = max_edge
+        self.fmt = fmt.upper()
+        self.quality = quality
+        self.processes = processes
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.lock = threading.Lock()
+        self.pool = None
+
+    @property
+    def signature(self):
+        """Settings string, used to key cached results."""
+        return f"{self.fmt}-{self.max_edge}-q{self.quality}"
+
+    @property
+    def bytes_saved(self):
+        return self.bytes_in - self.bytes_out
+
+    def __call__(self, image_bytes):
+        """Returns (image_bytes, mime_type) for the preprocessed image."""
+        with self.lock:
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(max_workers=self.processes)
+            pool = self.pool
+
+        try:
+            data, mime_type = pool.submit(
+                preprocess_image, image_bytes,
+                self.max_edge, self.fmt, self.quality
+            ).result()
+        except Exception as e:
+            # Undecodable images are sent as-is and left to the model
+            print(f"Preprocessing failed, sending original image: {e}")
+            data, mime_type = image_bytes, detect_mime_type(image_bytes)
+
+        with self.lock:
+            self.bytes_in += len(image_bytes)
+            self.bytes_out += len(data)
+        return data, mime_type
+
+    def close(self):
+        with self.lock:
+            if self.pool is not None:
+                self.pool.shutdown()
+                self.pool = None
@@ -0,0 +1,133 @@
+import random
+import threading
+import time
+
+from src.gemini import QuotaExceeded
+from src.pipeline import RateLimiter
+
+
+class AdaptiveRateController:
+    """
+    AIMD rate and concurrency control for model calls.
+
+    Successful calls slowly raise the request rate (additive increase);
+    a 429 halves both rate and concurrency (multiplicative decrease),
+    pauses all callers for the server's retry delay (or a jittered
+    exponential backoff) and retries. Only a daily quota, or running out
+    of retries, stops the run.
+
+    Args:
+        rpm: Starting requests per minute.
+        min_rpm / max_rpm: Bounds for the adapted rate (max_rpm defaults
+            to `rpm`, so the rate only recovers to where it started).
+        concurrency: Starting number of concurrent calls.
+        max_concurrency: Upper bound for concurrent calls.
+        max_retries: Retries per call before giving up.
+        base_delay: First backoff delay in seconds (doubles per retry).
+        max_delay: Cap for a single backoff delay.
+    """
+
+    INCREASE_RPM = 0.5      # Added per successful call
+    DECREASE_FACTOR = 0.5   # Applied on every 429
+    SUCCESSES_PER_SLOT = 10  # Consecutive successes before +1 concurrency
+
+    def __init__(self, rpm=15, min_rpm=1, max_rpm=None, concurrency=4,
+                 max_concurrency=None, max_retries=6, base_delay=2.0,
+                 max_delay=120.0):
+        self.rpm = float(rpm)
+        self.min_rpm = min_rpm
+        self.max_rpm = max(max_rpm or rpm, rpm)
+        self.concurrency = concurrency
+        self.max_concurrency = max_concurrency or concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.limiter = RateLimiter(self.rpm)
+        self.cond = threading.Condition()
+        self.active = 0
+        self.paused_until = 0.0
+        self.streak = 0
+
+        # Stats
+        self.retries = 0
+        self.throttle_seconds = 0.0  # Wall time spent paused after 429s
+
+    def _enter(self):
+        """Waits for a concurrency slot and any global 429 pause."""
+        with self.cond:
+            while True:
+                wait = self.paused_until - time.monotonic()
+                if wait <= 0 and self.active < self.concurrency:
+                    self.active += 1
+                    return
+                self.cond.wait(timeout=max(wait, 0.05) if wait > 0 else None)
+
+    def _exit(self):
+        with self.cond:
+            self.active -= 1
+            self.cond.notify_all()
+
+    def _on_success(self):
+        with self.cond:
+            self.rpm = min(self.max_rpm, self.rpm + self.INCREASE_RPM)
+            self.limiter.set_rate(self.rpm)
+            self.streak += 1
+            if (self.streak >= self.SUCCESSES_PER_SLOT
+                    and self.concurrency < self.max_concurrency):
+                self.concurrency += 1
+                self.streak = 0
+                self.cond.notify_all()
+
+    def _on_throttle(self, error, attempt):
+        """Backs off after a 429. Returns the delay in seconds."""
+        backoff = min(self.max_delay, self.base_delay * (2 ** attempt))
+        delay = max(error.retry_after or 0, backoff)
+        delay *= random.uniform(1.0, 1.5)  # Jitter spreads out the retries
+
+        with self.cond:
+            self.rpm = max(self.min_rpm, self.rpm * self.DECREASE_FACTOR)
+            self.limiter.set_rate(self.rpm)
+            self.concurrency = max(1, int(self.concurrency * self.DECREASE_FACTOR))
+            self.streak = 0
+            # Count only the part of the pause not already scheduled
+            now = time.monotonic()
+            resume_at = now + delay
+            self.throttle_seconds += max(0.0, resume_at - max(self.paused_until, now))
+            self.paused_until = max(self.paused_until, resume_at)
+            self.retries += 1
+        print(f"Rate limited: retrying in {delay:.1f}s at {self.rpm:.0f} RPM, "
+              f"concurrency {self.concurrency}")
+        return delay
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Calls fn under the current rate and concurrency limits, retrying
+        on QuotaExceeded. Re-raises when the daily quota is exhausted or
+        retries run out.
+        """
+        attempt = 0
+        while True:
+            self._enter()
+            try:
+                self.limiter.acquire()
+                result = fn(*args, **kwargs)
+            except QuotaExceeded as e:
+                if e.daily or attempt >= self.max_retries:
+                    raise
+                self._on_throttle(e, attempt)
+                attempt += 1
+                continue
+            finally:
+                self._exit()
+            self._on_success()
+            return result
+
+    def stats(self):
+        """Returns retry count, time spent throttled and the current limits."""
+        return {
+            "retries": self.retries,
+            "throttle_seconds": self.throttle_seconds,
+            "rpm": self.rpm,
+            "concurrency": self.concurrency,
+        }
@@ -0,0 +1,77 @@
+import csv
+import hashlib
+import os
+import threading
+
+
+def load_sheet_file_names(sheet):
+    """
+    Returns the set of fileName values already in a worksheet.
+    Reads only the first column, in a single API call.
+    """
+    values = sheet.col_values(1)
+    return set(values[1:]) if values else set()
+
+
+def load_csv_file_names(path):
+    """Returns the set of fileName values in a previously exported CSV."""
+    if not path or not os.path.exists(path):
+        return set()
+    with open(path, newline="", encoding="utf-8") as f:
+        return {row["fileName"] for row in csv.DictReader(f) if row.get("fileName")}
+
+
+class Checkpoint:
+    """
+    Append-only manifest of file names whose rows have been saved.
+    One name per line, so it stays valid even if a run is killed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.done = {line.rstrip("\n") for line in f if line.strip()}
+
+    @staticmethod
+    def for_source(checkpoint_dir, source, target):
+        """
+        Returns the checkpoint for a (source, target) pair, e.g. a Drive
+        folder ID and a sheet title.
+        """
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        key = hashlib.sha1(f"{source}|{target}".encode("utf-8")).hexdigest()[:16]
+        return Checkpoint(os.path.join(checkpoint_dir, f"{key}.txt"))
+
+    def mark(self, file_names):
+        """Records file names as saved."""
+        with self.lock:
+            new = [name for name in file_names if name not in self.done]
+            if not new:
+                return
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.writelines(f"{name}\n" for name in new)
+            self.done.update(new)
+
+    def reset(self):
+        """Forgets all saved names."""
+        with self.lock:
+            self.done = set()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+def filter_pending(images, done_names):
+    """
+    Drops images whose name is in `done_names`.
+    Returns (pending_images, skipped_count).
+    """
+    pending = [img for img in images if img['name'] not in done_names]
+    return pending, len(images) - len(pending)
+
+
+def iter_pending(images, done_names):
+    """Lazy version of filter_pending for streamed listings."""
+    return (img for img in images if img['name'] not in done_names)
@@ -0,0 +1,705 @@
+import itertools
+import os
+import socket
+import threading
+import time
+import uuid
+
+from src import clients
+from src.auth import credentials_fingerprint
+from src.cache import ExtractionCache
+from src.config import Config
+from src.dedupe import NearDuplicateIndex
+from src.failures import FailureLedger
+from src.gemini import GeminiExtractor
+from src.keypool import KeyPool, parse_api_keys
+from src.local import list_local_images, read_local_image
+from src.metrics import Metrics
+from src.output import (SpoolWriter, UpsertWriter, load_output_file_names,
+                        open_writer)
+from src.pipeline import (CountingIterator, ExtractionPipeline,
+                          STATUS_DUPLICATE, STATUS_EMPTY, STATUS_OK,
+                          STATUS_QUOTA)
+from src.preprocess import ImagePreprocessor
+from src.ratecontrol import AdaptiveRateController
+from src.resume import (Checkpoint, filter_pending, iter_pending,
+                        load_csv_file_names, load_sheet_file_names)
+from src.sheets import HEADER, BufferedSheetWriter, SheetSyncWriter
+from src.workqueue import WorkQueue
+
+UNSAVED_ROWS_PATH = "unsaved_rows.csv"
+
+
+def open_sheet(credentials_dict, sheet_title):
+    """
+    Opens the first worksheet of a sheet and ensures the header row.
+    The client and spreadsheet are cached across runs.
+    """
+    sheet = clients.spreadsheet(credentials_dict, sheet_title).sheet1
+
+    # Ensure headers
+    first_row = sheet.row_values(1)
+    if first_row != HEADER:
+        sheet.insert_row(HEADER, 1)
+    return sheet
+
+
+def image_loader(drive_folder_id=None, credentials_dict=None):
+    """Returns the callable loading an image dict's bytes for a source."""
+    if drive_folder_id:
+        return clients.drive_downloader(credentials_dict)
+    return lambda img: read_local_image(img['id'])
+
+
+def open_source(local_folder=None, drive_folder_id=None, credentials_dict=None,
+                recursive=Config.LOCAL_RECURSIVE):
+    """
+    Returns (images, load_image, total) for a local folder or a Drive
+    folder. Drive folders are streamed page by page, so total is None.
+    Drive uses the service account from `credentials_dict` or
+    SERVICE_ACCOUNT_FILE. With `recursive`, local subfolders are included.
+    """
+    load_image = image_loader(drive_folder_id, credentials_dict)
+    if drive_folder_id:
+        return load_image.iter_folder_images(drive_folder_id), load_image, None
+
+    images = list_local_images(local_folder, recursive)
+    return images, load_image, len(images)
+
+
+class ExtractionJob:
+    """
+    One extraction run (source -> pipeline -> writer), independent of any
+    UI. Iterate run() to drive it; the counters on the instance reflect
+    progress and can be read between results. `on_result` is called with
+    each result once its row is handed to the writer; `on_success` after
+    a run that listed and processed everything and saved all rows.
+    stop() ends the run early: no new images are started, and those in
+    flight finish and are written.
+    Failed and recovered images are recorded in `failures` (a
+    FailureLedger), if given; without one, any failed image also holds
+    back `on_success`.
+    """
+
+    def __init__(self, pipeline, images, writer, total=None, skipped=0,
+                 on_result=None, on_success=None, failures=None):
+        self.pipeline = pipeline
+        self.listing = CountingIterator(pipeline.metrics.timed_iter("list", images))
+        self.writer = writer
+        self.total = total
+        self.skipped = skipped
+        self.on_result = on_result
+        self.on_success = on_success
+        self.failures = failures
+        self.processed = 0
+        self.errors = 0
+        self.duplicates = 0
+        self.completed = 0
+        self.quota_exceeded = False
+        self.write_error = None
+        self.unsaved_path = None
+        self.stop_event = threading.Event()
+
+    @property
+    def metrics(self):
+        return self.pipeline.metrics
+
+    @property
+    def cache(self):
+        return self.pipeline.cache
+
+    @property
+    def preprocess(self):
+        return self.pipeline.preprocess
+
+    @property
+    def key_pool(self):
+        return self.pipeline.extractor.key_pool
+
+    @property
+    def rate_control(self):
+        """The AdaptiveRateController, or None for a fixed rate."""
+        rate = self.pipeline.rate
+        return rate if isinstance(rate, AdaptiveRateController) else None
+
+    @property
+    def known_total(self):
+        """Total images if known, else the number listed so far."""
+        if self.total is not None:
+            return self.total
+        return self.listing.count
+
+    @property
+    def total_label(self):
+        """Total for display; '+' while a streamed listing is still running."""
+        more = self.total is None and not self.listing.exhausted
+        return f"{self.known_total}" + ("+" if more else "")
+
+    def stop(self):
+        """Starts no new images; those in flight finish and are written."""
+        self.stop_event.set()
+
+    def run(self):
+        """
+        Yields a PipelineResult per image, in input order, after writing
+        successful rows. Rows that could not be written stay with the
+        writer (see close()).
+        """
+        try:
+            yield from self._process(self.listing)
+        finally:
+            self.close()
+        # Failures are in the ledger, so they need not hold back the
+        # next run's starting point
+        if (self.on_success and self.listing.exhausted
+                and (self.failures or not self.errors)
+                and not self.quota_exceeded and not self.write_error):
+            self.on_success()
+
+    def _process(self, images):
+        """Runs images through the pipeline, writing and counting results."""
+        for result in self.pipeline.run(images, self.stop_event):
+            self.completed += 1
+            self.metrics.record_result(result.status)
+            if result.status in (STATUS_OK, STATUS_DUPLICATE):
+                try:
+                    with self.metrics.time("write"):
+                        self.writer.add(result.row)
+                except Exception as e:
+                    # Buffered writers keep the row and retry on next flush
+                    result.write_error = e
+                self.processed += 1
+                if result.status == STATUS_DUPLICATE:
+                    self.duplicates += 1
+            else:
+                self.errors += 1
+                if result.status == STATUS_QUOTA:
+                    self.quota_exceeded = True
+            if self.on_result:
+                self.on_result(result)
+            if self.failures:
+                self.failures.record(result)
+            yield result
+
+    def _flush(self):
+        """Flushes a buffered writer, so rows are not held while idle."""
+        if hasattr(self.writer, "flush"):
+            try:
+                with self.metrics.time("write"):
+                    self.writer.flush()
+            except Exception as e:
+                self.write_error = e
+
+    def close(self):
+        """
+        Releases resources and does the writer's final flush. If that
+        fails, pending rows are saved to UNSAVED_ROWS_PATH when the writer
+        supports it.
+        """
+        if self.preprocess:
+            self.preprocess.close()
+        if self.key_pool:
+            self.key_pool.save()
+        if self.failures:
+            self.failures.close()
+        try:
+            with self.metrics.time("write"):
+                self.writer.close()
+        except Exception as e:
+            self.write_error = e
+            if hasattr(self.writer, "dump_pending"):
+                self.unsaved_path = self.writer.dump_pending(UNSAVED_ROWS_PATH)
+
+
+def index_results(watcher):
+    """on_result callback recording extracted images in a FolderWatcher's index."""
+    def on_result(result):
+        if result.status in (STATUS_OK, STATUS_DUPLICATE):
+            watcher.mark_done(result.image)
+    return on_result
+
+
+class WatchJob(ExtractionJob):
+    """
+    Extracts images as they land in a local folder until stop() is
+    called: first the new or changed images found by the initial scan,
+    then each file within seconds of it being written. Extracted images
+    are recorded in the watcher's index, so a restart picks up where the
+    last run stopped.
+    """
+
+    def __init__(self, pipeline, watcher, writer, images=(), skipped=0,
+                 failures=None):
+        super().__init__(pipeline, [], writer, skipped=skipped,
+                         on_result=index_results(watcher), failures=failures)
+        self.watcher = watcher
+        self.initial = list(images)
+        self.seen = 0
+
+    @property
+    def known_total(self):
+        return self.seen
+
+    @property
+    def total_label(self):
+        return f"{self.seen}" + ("" if self.stop_event.is_set() else "+")
+
+    def run(self):
+        print(f"Watching {self.watcher.folder_path} ({self.watcher.mode})")
+        images = self.initial
+        try:
+            while True:
+                if images:
+                    self.seen += len(images)
+                    yield from self._process(images)
+                    self._flush()
+                if self.stop_event.is_set() or self.quota_exceeded:
+                    return
+                with self.metrics.time("list"):
+                    images = self.watcher.wait(stop_event=self.stop_event)
+        finally:
+            self.close()
+            self.watcher.close()
+
+
+class RetryJob(ExtractionJob):
+    """
+    Re-processes only the images in a FailureLedger, without listing the
+    source: those due now, then each one again once its backoff delay has
+    passed, until none are left waiting (recovered or dead) or stop() is
+    called.
+    """
+
+    def __init__(self, pipeline, failures, writer):
+        super().__init__(pipeline, [], writer, failures=failures)
+        self.seen = 0
+
+    @property
+    def known_total(self):
+        return self.seen
+
+    @property
+    def total_label(self):
+        waiting = self.failures.counts()["retrying"]
+        return f"{self.seen}" + (f" (+{waiting} waiting)" if waiting else "")
+
+    def run(self):
+        try:
+            while not (self.stop_event.is_set() or self.quota_exceeded):
+                images = self.failures.due()
+                if images:
+                    self.seen += len(images)
+                    yield from self._process(images)
+                    self._flush()
+                    continue
+                next_retry = self.failures.next_retry()
+                if next_retry is None:
+                    return
+                wait = max(0.0, next_retry - time.time())
+                print(f"Next failed images are due in {wait:.0f}s")
+                self.stop_event.wait(wait)
+        finally:
+            self.close()
+
+
+def create_extractor(api_key, metrics=None, context_cache=Config.CONTEXT_CACHE,
+                     cascade=Config.CASCADE):
+    """
+    Returns a GeminiExtractor for one key, or one backed by a KeyPool
+    when `api_key` holds several comma-separated keys. With
+    `context_cache`, the system instruction is kept in Gemini cached
+    content (one entry per key, shared between runs). With `cascade`,
+    cards failing validation are re-run on ESCALATION_MODEL.
+    """
+    options = {
+        "metrics": metrics,
+        "context_cache": clients.context_cache() if context_cache else None,
+        "escalation_model": Config.ESCALATION_MODEL if cascade else None,
+    }
+    keys = parse_api_keys(api_key)
+    if len(keys) > 1:
+        pool = KeyPool(keys, rpm=Config.KEY_RPM, rpd=Config.KEY_RPD,
+                       state_path=Config.KEY_USAGE_FILE)
+        return GeminiExtractor(key_pool=pool, **options)
+    return GeminiExtractor(api_key=keys[0] if keys else None, **options)
+
+
+def build_job(api_key, local_folder=None, drive_folder_id=None,
+              credentials_dict=None, sheet_title=None, output_path=None,
+              output_format=None, existing_csv=None,
+              workers=Config.MAX_WORKERS, rpm=None,
+              batch_size=Config.BATCH_SIZE, use_cache=True, downscale=True,
+              resume=True, adaptive=True, dedupe=False, sync=False,
+              incremental=False, watch=False,
+              context_cache=Config.CONTEXT_CACHE, cascade=Config.CASCADE,
+              retry_failures=False, recursive=Config.LOCAL_RECURSIVE):
+    """
+    Builds an ExtractionJob from plain settings. `api_key` may hold
+    several comma-separated keys, which are then used as a pool.
+
+    Source: `local_folder` (with `recursive`, including its subfolders)
+    or `drive_folder_id` (Drive uses the service account from
+    `credentials_dict` or SERVICE_ACCOUNT_FILE).
+    Output: `output_path` (CSV/JSONL streamed to disk), else `sheet_title`
+    (Google Sheet, batched writes), else a spool file under SPOOL_DIR
+    that can be exported to CSV/JSONL/Parquet when the run ends.
+    With `resume`, images already in the output (or `existing_csv`) are
+    skipped before any download or model call. With `adaptive`, 429s are
+    retried with backoff instead of stopping the run. With `dedupe`,
+    near-identical photos reuse the first copy's row without a model call.
+    With `sync` (sheet output only), every image is processed again and
+    rows are upserted by fileName: unchanged rows cost no write, changed
+    ones are updated in place and only new ones are appended. Combine it
+    with the cache so unchanged images cost no quota. With `incremental`,
+    only images added or modified since the last run to the same output
+    are listed: via the Drive Changes feed, or for local folders via an
+    index of extracted files' size, mtime and hash. With `watch` (local
+    only) the job keeps running and extracts new images as they land,
+    until stopped; see WatchJob. With `context_cache`, the system
+    instruction is sent as Gemini cached content instead of with every
+    request (see ContextCache). With `cascade`, cards whose result fails
+    validation (src/validation.py) are extracted again with
+    ESCALATION_MODEL.
+
+    Failed images are recorded in a FailureLedger kept per source and
+    output. With `retry_failures`, the source is not listed: only the
+    images in the ledger are processed again, with backoff, until each
+    one has succeeded or failed FAILURE_MAX_ATTEMPTS times (see RetryJob).
+    """
+    metrics = Metrics()
+    gemini = create_extractor(api_key, metrics, context_cache, cascade)
+
+    target = output_path or sheet_title or "spool"
+    scope = f"{os.path.abspath(local_folder) if local_folder else drive_folder_id}|{target}"
+    failures = FailureLedger(
+        Config.FAILURE_LEDGER_PATH, scope,
+        max_attempts=Config.FAILURE_MAX_ATTEMPTS,
+        base_delay=Config.FAILURE_RETRY_SECONDS,
+        max_delay=Config.FAILURE_RETRY_MAX_SECONDS)
+
+    # Images that changed since they were extracted replace their row
+    replace_rows = incremental or watch or retry_failures
+    if retry_failures:
+        images, total = [], None
+        load_image = image_loader(drive_folder_id, credentials_dict)
+        incremental = watch = False
+    elif local_folder and (incremental or watch):
+        # Listed by the FolderWatcher scan below
+        images, total = [], None
+    else:
+        with metrics.time("list"):
+            images, load_image, total = open_source(
+                local_folder, drive_folder_id, credentials_dict, recursive)
+
+    changes = None
+    if incremental and drive_folder_id:
+        # The feed position is per output, so each target gets every change
+        from src.drive import FolderChanges
+        changes = load_image.folder_changes(
+            drive_folder_id,
+            FolderChanges.state_path_for(
+                Config.DRIVE_SYNC_DIR, drive_folder_id, target,
+                credentials_fingerprint(credentials_dict)))
+        images = changes
+
+    watcher = None
+    if local_folder and (incremental or watch):
+        from src.watch import FolderWatcher, LocalIndex
+        watcher = FolderWatcher(
+            local_folder, LocalIndex(Config.LOCAL_INDEX_PATH, scope),
+            recursive=recursive,
+            poll_seconds=Config.WATCH_POLL_SECONDS,
+            sweep_files=Config.WATCH_SWEEP_FILES,
+            # One-off scans need no inotify watches
+            use_inotify=None if watch else False)
+        load_image = watcher.load_image
+
+    # Retry runs only take images from the ledger: no need to read the output
+    skip_done = resume and not retry_failures
+    done_names = set()
+    if output_path:
+        writer = open_writer(output_path, output_format)
+        if skip_done or replace_rows:
+            done_names = load_output_file_names(output_path, output_format)
+        if replace_rows:
+            writer = UpsertWriter(writer, done_names)
+        if not skip_done:
+            done_names = set()
+    elif sheet_title:
+        sheet = open_sheet(credentials_dict, sheet_title)
+        # The checkpoint records names only once they are in the sheet
+        checkpoint = Checkpoint.for_source(
+            Config.CHECKPOINT_DIR, drive_folder_id or local_folder, sheet_title)
+        # Rows of changed images are updated in place
+        writer_class = SheetSyncWriter if sync or replace_rows else BufferedSheetWriter
+        writer = writer_class(
+            sheet, on_flush=lambda rows: checkpoint.mark(r[0] for r in rows))
+        if skip_done and not sync:
+            done_names = load_sheet_file_names(sheet) | checkpoint.done
+    else:
+        # One spool per source folder, so a re-run resumes into it
+        writer = SpoolWriter.for_source(
+            Config.SPOOL_DIR, local_folder or drive_folder_id,
+            reset=not (resume or retry_failures))
+        if skip_done or replace_rows:
+            done_names = {row[0] for row in writer.iter_rows()}
+        if replace_rows:
+            writer = UpsertWriter(writer, done_names)
+        if not skip_done:
+            done_names = set()
+
+    if skip_done and existing_csv:
+        done_names |= load_csv_file_names(existing_csv)
+
+    skipped = 0
+    if watcher:
+        with metrics.time("list"):
+            images = []
+            for image in watcher.scan():
+                if image['name'] in done_names and not watcher.index.get(image['id']):
+                    # Extracted before the index existed: record it now
+                    watcher.mark_done(image)
+                    skipped += 1
+                else:
+                    images.append(image)
+        total = len(images)
+    elif changes:
+        images = changes.pending(done_names)
+    elif done_names:
+        if total is not None:
+            images, skipped = filter_pending(images, done_names)
+            total = len(images)
+        else:
+            images = iter_pending(images, done_names)
+
+    pipeline = build_pipeline(
+        gemini, load_image, metrics,
+        workers=workers, rpm=rpm, batch_size=batch_size, use_cache=use_cache,
+        downscale=downscale, adaptive=adaptive, dedupe=dedupe,
+        # Keep Drive downloads ahead of the model calls
+        prefetch=workers * 2 if drive_folder_id else 0
+    )
+    if retry_failures:
+        return RetryJob(pipeline, failures, writer)
+    if watch and watcher:
+        return WatchJob(pipeline, watcher, writer, images, skipped=skipped,
+                        failures=failures)
+    return ExtractionJob(pipeline, images, writer, total=total, skipped=skipped,
+                         on_result=index_results(watcher) if watcher else None,
+                         on_success=changes.commit if changes else None,
+                         failures=failures)
+
+
+def build_pipeline(gemini, load_image, metrics, workers=Config.MAX_WORKERS,
+                   rpm=None, batch_size=Config.BATCH_SIZE,
+                   use_cache=True, downscale=True, adaptive=True, dedupe=False,
+                   prefetch=0):
+    """
+    ExtractionPipeline with the cache, preprocessing and rate control from
+    Config. `rpm` is the overall request limit; it defaults to
+    REQUESTS_PER_MINUTE for a single key, and to KEY_RPM per key with a
+    key pool. A pool never goes above its keys' total, and the pool
+    spreads calls so no key goes over its own budget.
+    """
+    if gemini.key_pool:
+        pool_rpm = len(gemini.key_pool) * gemini.key_pool.rpm
+        rpm = min(rpm, pool_rpm) if rpm else pool_rpm
+    elif not rpm:
+        rpm = Config.REQUESTS_PER_MINUTE
+
+    cache = None
+    if use_cache:
+        cache = ExtractionCache(
+            Config.CACHE_DIR,
+            max_entries=Config.CACHE_MAX_ENTRIES,
+            max_bytes=Config.CACHE_MAX_MB * 1024 * 1024,
+            max_age=Config.CACHE_MAX_AGE_DAYS * 86400
+        )
+
+    preprocessor = None
+    if downscale:
+        preprocessor = ImagePreprocessor(
+            max_edge=Config.PREPROCESS_MAX_EDGE,
+            fmt=Config.PREPROCESS_FORMAT,
+            quality=Config.PREPROCESS_QUALITY
+        )
+
+    rate_control = None
+    if adaptive:
+        rate_control = AdaptiveRateController(
+            rpm=rpm,
+            max_rpm=Config.MAX_REQUESTS_PER_MINUTE,
+            concurrency=workers,
+            max_retries=Config.MAX_RETRIES
+        )
+
+    return ExtractionPipeline(
+        gemini, load_image,
+        workers=workers,
+        rpm=rpm,
+        cache=cache,
+        prefetch=prefetch,
+        preprocess=preprocessor,
+        batch_size=batch_size,
+        rate_control=rate_control,
+        dedupe=NearDuplicateIndex(Config.DEDUPE_RADIUS) if dedupe else None,
+        metrics=metrics
+    )
+
+
+def open_queue(queue_path):
+    """WorkQueue at `queue_path` with the lease settings from Config."""
+    return WorkQueue(queue_path, lease_seconds=Config.QUEUE_LEASE_SECONDS,
+                     max_attempts=Config.QUEUE_MAX_ATTEMPTS,
+                     busy_timeout=Config.QUEUE_BUSY_TIMEOUT)
+
+
+def fill_queue(queue_path, local_folder=None, drive_folder_id=None,
+               credentials_dict=None, chunk_size=500,
+               recursive=Config.LOCAL_RECURSIVE):
+    """
+    Lists a local (with `recursive`, including subfolders) or Drive
+    folder into a work queue. Images already queued are left as they
+    are, so filling again only adds new files.
+    Returns (queue, number of images added).
+    """
+    queue = open_queue(queue_path)
+    queue.set_source(local_folder, drive_folder_id)
+    images, _, _ = open_source(local_folder, drive_folder_id, credentials_dict,
+                               recursive)
+    images = iter(images)
+    added = 0
+    while True:
+        chunk = list(itertools.islice(images, chunk_size))
+        if not chunk:
+            return queue, added
+        added += queue.add(chunk)
+
+
+class QueueWorker:
+    """
+    Processes images leased from a WorkQueue until none are left, and
+    records each outcome in the queue. Leases are renewed in the
+    background while the worker runs; images it still holds when it
+    stops (quota, stop() or an exception) are released to the pool. If
+    the process dies, its leases expire and other workers pick the
+    images up.
+    """
+
+    def __init__(self, queue, pipeline, worker_id=None, claim_size=None,
+                 poll_seconds=5.0):
+        self.queue = queue
+        self.pipeline = pipeline
+        self.worker_id = worker_id or (
+            f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:4]}")
+        self.claim_size = claim_size or pipeline.workers * pipeline.batch_size
+        self.poll_seconds = poll_seconds
+        self.processed = 0
+        self.errors = 0
+        self.completed = 0
+        self.quota_exceeded = False
+        self.lost_leases = 0  # Results dropped because the lease had expired
+        self.stop_event = threading.Event()
+        self._stop_heartbeat = threading.Event()
+
+    @property
+    def metrics(self):
+        return self.pipeline.metrics
+
+    @property
+    def key_pool(self):
+        return self.pipeline.extractor.key_pool
+
+    def stop(self):
+        """Stops claiming; images already claimed are still finished."""
+        self.stop_event.set()
+
+    def claims(self):
+        """Yields leased images until nothing is left to claim."""
+        while not self.stop_event.is_set():
+            images = self.queue.claim(self.worker_id, self.claim_size)
+            if not images:
+                return
+            yield from images
+
+    def _others_working(self):
+        return any(worker != self.worker_id for worker in self.queue.workers())
+
+    def _heartbeat(self):
+        interval = max(1.0, self.queue.lease_seconds / 3)
+        while not self._stop_heartbeat.wait(interval):
+            try:
+                self.queue.renew(self.worker_id)
+            except Exception as e:
+                print(f"Could not renew leases: {e}")
+
+    def run(self):
+        """Yields a PipelineResult per image after recording it in the queue."""
+        heartbeat = threading.Thread(target=self._heartbeat, daemon=True,
+                                     name=f"lease-{self.worker_id}")
+        heartbeat.start()
+        try:
+            while True:
+                yield from self._run_round()
+                # Nothing claimable now, but images leased by other
+                # workers come back if those workers die
+                if (self.quota_exceeded or self.stop_event.is_set()
+                        or not self._others_working()):
+                    break
+                self.stop_event.wait(self.poll_seconds)
+        finally:
+            self._stop_heartbeat.set()
+            self.queue.release(self.worker_id)
+            if self.pipeline.preprocess:
+                self.pipeline.preprocess.close()
+            if self.key_pool:
+                self.key_pool.save()
+
+    def _run_round(self):
+        """Processes claims until the queue has nothing claimable."""
+        for result in self.pipeline.run(self.claims()):
+            self.completed += 1
+            self.metrics.record_result(result.status)
+            image_id, lease = result.image['id'], result.image['lease']
+            if result.status in (STATUS_OK, STATUS_DUPLICATE):
+                recorded = self.queue.complete(image_id, lease, result.row)
+                self.processed += 1
+            elif result.status == STATUS_QUOTA:
+                self.quota_exceeded = True
+                recorded = self.queue.release(self.worker_id, image_id)
+            elif result.status == STATUS_EMPTY:
+                # Same image, same answer: not worth another try
+                recorded = self.queue.fail(image_id, lease, "No data extracted",
+                                           retry=False)
+                self.errors += 1
+            else:
+                recorded = self.queue.fail(image_id, lease, result.error)
+                self.errors += 1
+            if not recorded:
+                self.lost_leases += 1
+                print(f"Lease on {result.file_name} was lost (expired or "
+                      f"taken over); its result was not recorded.")
+            yield result
+
+
+def build_worker(queue_path, api_key, credentials_dict=None,
+                 workers=Config.MAX_WORKERS, rpm=None,
+                 batch_size=Config.BATCH_SIZE, use_cache=True, downscale=True,
+                 adaptive=True, worker_id=None,
+                 context_cache=Config.CONTEXT_CACHE, cascade=Config.CASCADE):
+    """
+    Builds a QueueWorker for a queue filled with fill_queue(). `rpm`
+    applies to this worker only; give each worker its own keys or split
+    the quota between them.
+    """
+    queue = open_queue(queue_path)
+    local_folder, drive_folder_id = queue.source()
+    metrics = Metrics()
+    pipeline = build_pipeline(
+        create_extractor(api_key, metrics, context_cache, cascade),
+        image_loader(drive_folder_id, credentials_dict), metrics,
+        workers=workers, rpm=rpm, batch_size=batch_size, use_cache=use_cache,
+        downscale=downscale, adaptive=adaptive,
+        prefetch=workers * 2 if drive_folder_id else 0
+    )
+    return QueueWorker(queue, pipeline, worker_id=worker_id)
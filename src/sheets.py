@@ -1,4 +1,9 @@
-import gspread
+import csv
+import hashlib
+import json
+import re
+import threading
+import time
 from src.auth import get_service_account_creds
 from src.config import Config
 
@@ -7,13 +12,42 @@ HEADER = [
     "contactPhone", "websiteURL", "physicalAddress"
 ]
 
+# Row number of the first appended row, from e.g. "'Sheet1'!A10:H12"
+UPDATED_RANGE_ROW = re.compile(r"![A-Z]+(\d+)")
+
+def row_from_data(data):
+    """
+    Converts an extracted data dict into a list of values in HEADER order.
+    """
+    return [data.get(field, "") for field in HEADER]
+
+def normalize_row(row):
+    """Row values as the sheet returns them: strings, HEADER length."""
+    values = ["" if v is None else str(v) for v in row[:len(HEADER)]]
+    return values + [""] * (len(HEADER) - len(values))
+
+def row_hash(row):
+    """Content hash of a row, comparable between sheet and new data."""
+    payload = json.dumps(normalize_row(row), ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+def column_letter(n):
+    """1 -> A, 27 -> AA."""
+    letters = ""
+    while n:
+        n, rem = divmod(n - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
 class SheetManager:
     def __init__(self):
+        import gspread
         self.creds = get_service_account_creds()
         self.client = gspread.authorize(self.creds)
         self.sheet = self._get_or_create_sheet()
 
     def _get_or_create_sheet(self):
+        import gspread
         try:
             # Try to open the sheet by title
             sheet = self.client.open(Config.SHEET_TITLE).sheet1
@@ -42,3 +76,195 @@ class SheetManager:
         except Exception as e:
             print(f"Error appending row: {e}")
             raise
+
+    def append_rows(self, rows):
+        """
+        Appends several rows in a single API call.
+        rows: list of lists matching the HEADER order.
+        """
+        try:
+            self.sheet.append_rows(rows)
+            print(f"Appended {len(rows)} rows.")
+        except Exception as e:
+            print(f"Error appending rows: {e}")
+            raise
+
+class BufferedSheetWriter:
+    """
+    Collects rows and writes them to a worksheet with one append_rows call
+    per batch, instead of one API call per card.
+
+    A flush happens when `max_rows` rows or `max_bytes` of cell text are
+    buffered, or `max_interval` seconds have passed since the last flush.
+    Rows are only dropped from the buffer after a successful write, so a
+    failed flush (e.g. a quota error) leaves them in `pending`.
+
+    Args:
+        sheet: A gspread worksheet (anything with append_rows).
+        on_flush: Optional callback receiving each batch of written rows.
+    """
+
+    def __init__(self, sheet, max_rows=50, max_bytes=256 * 1024, max_interval=10.0,
+                 on_flush=None):
+        self.sheet = sheet
+        self.on_flush = on_flush
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_interval = max_interval
+        self.pending = []
+        self.pending_bytes = 0
+        self.rows_written = 0
+        self.flushes = 0
+        self.last_flush = time.monotonic()
+        self.lock = threading.RLock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def add(self, row):
+        """Buffers one row and flushes if a threshold is reached."""
+        with self.lock:
+            self.pending.append(row)
+            self.pending_bytes += sum(len(str(v)) for v in row)
+        self.maybe_flush()
+
+    def maybe_flush(self):
+        """Flushes if any size or time threshold has been reached."""
+        with self.lock:
+            due = (
+                len(self.pending) >= self.max_rows
+                or self.pending_bytes >= self.max_bytes
+                or (self.pending
+                    and time.monotonic() - self.last_flush >= self.max_interval)
+            )
+            if due:
+                self.flush()
+
+    def flush(self):
+        """Writes all buffered rows in one call."""
+        with self.lock:
+            if not self.pending:
+                return
+            rows = list(self.pending)
+            self.sheet.append_rows(rows)
+            del self.pending[:len(rows)]
+            self.pending_bytes = sum(len(str(v)) for r in self.pending for v in r)
+            self.rows_written += len(rows)
+            self.flushes += 1
+            self.last_flush = time.monotonic()
+            if self.on_flush:
+                self.on_flush(rows)
+
+    def close(self):
+        """Final flush. Raises if the rows could not be written."""
+        self.flush()
+
+    def dump_pending(self, path):
+        """
+        Saves rows that could not be written to a local CSV file so they
+        can be imported manually. Returns the path, or None if empty.
+        """
+        with self.lock:
+            if not self.pending:
+                return None
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f, quoting=csv.QUOTE_ALL)
+                writer.writerow(HEADER)
+                writer.writerows(self.pending)
+            return path
+
+class SheetSyncWriter(BufferedSheetWriter):
+    """
+    BufferedSheetWriter that upserts by fileName instead of appending.
+
+    The sheet is read once (one API call) into an index of
+    fileName -> (row number, content hash). Each flush then skips rows
+    whose content is unchanged, rewrites changed rows with a single
+    batch_update of their ranges and appends new rows with a single
+    append_rows, so a re-run of a mostly unchanged folder costs a few
+    calls. If a fileName appears on several sheet rows, the first one is
+    updated.
+
+    Args:
+        sheet: A gspread worksheet whose first row is HEADER.
+    """
+
+    def __init__(self, sheet, **kwargs):
+        super().__init__(sheet, **kwargs)
+        self.index = {}
+        self.last_row = 0
+        self.rows_updated = 0
+        self.rows_appended = 0
+        self.rows_unchanged = 0
+        self._load_index()
+
+    def _load_index(self):
+        values = self.sheet.get_all_values()
+        self.last_row = len(values)
+        for number, row in enumerate(values[1:], start=2):  # Row 1 is HEADER
+            if row and row[0] and row[0] not in self.index:
+                self.index[row[0]] = (number, row_hash(row))
+
+    def _row_range(self, number):
+        return f"A{number}:{column_letter(len(HEADER))}{number}"
+
+    def flush(self):
+        """Writes buffered rows: changed ones in place, new ones appended."""
+        with self.lock:
+            if not self.pending:
+                return
+            rows = list(self.pending)
+
+            # Last row per fileName wins within a batch
+            latest = {}
+            for row in rows:
+                latest[row[0]] = normalize_row(row)
+
+            updates, appends, unchanged = [], [], 0
+            for name, row in latest.items():
+                entry = self.index.get(name)
+                if entry is None:
+                    appends.append(row)
+                elif entry[1] == row_hash(row):
+                    unchanged += 1
+                else:
+                    updates.append((entry[0], row))
+
+            if updates:
+                self.sheet.batch_update(
+                    [{"range": self._row_range(number), "values": [row]}
+                     for number, row in updates])
+                for number, row in updates:
+                    self.index[row[0]] = (number, row_hash(row))
+            if appends:
+                response = self.sheet.append_rows(appends)
+                first = self._first_appended_row(response)
+                for offset, row in enumerate(appends):
+                    self.index[row[0]] = (first + offset, row_hash(row))
+                self.last_row = max(self.last_row, first + len(appends) - 1)
+
+            del self.pending[:len(rows)]
+            self.pending_bytes = sum(len(str(v)) for r in self.pending for v in r)
+            self.rows_updated += len(updates)
+            self.rows_appended += len(appends)
+            self.rows_unchanged += unchanged
+            self.rows_written += len(updates) + len(appends)
+            if updates or appends:
+                self.flushes += 1
+            self.last_flush = time.monotonic()
+            if self.on_flush:
+                self.on_flush(rows)
+
+    def _first_appended_row(self, response):
+        """Row number of the first appended row, from the API response."""
+        try:
+            match = UPDATED_RANGE_ROW.search(response["updates"]["updatedRange"])
+            if match:
+                return int(match.group(1))
+        except (KeyError, TypeError):
+            pass
+        # No usable response: rows go right after the last known row
+        return self.last_row + 1
@@ -0,0 +1,79 @@
+"""
+Sanity checks for extracted card data, used to decide which cards are
+worth re-running on a stronger model.
+
+The checks are deliberately loose: they catch empty or garbled results
+(no name at all, no way to contact the person, an "email" without an @,
+a phone number with three digits), not every unusual but valid card.
+"""
+import re
+
+# At least one field of each group must be filled in
+REQUIRED_GROUPS = (
+    ("fullName", "companyName"),
+    ("primaryEmail", "contactPhone", "websiteURL"),
+)
+
+EMAIL_PATTERN = re.compile(r"^[^@\s,;]+@[^@\s,;]+\.[^@\s,;.]{2,}$")
+URL_PATTERN = re.compile(
+    r"^(https?://)?(www\.)?([a-z0-9-]+\.)+[a-z]{2,}(:\d+)?([/?#]\S*)?$",
+    re.IGNORECASE)
+# Digits, spaces and the usual separators, optionally with an extension
+PHONE_EXTENSION = re.compile(r"\s*(ext\.?|x)\s*\d+$", re.IGNORECASE)
+PHONE_PATTERN = re.compile(r"^\+?[\d\s().\-]+$")
+PHONE_SEPARATORS = re.compile(r"[,;/]")
+PHONE_DIGITS = (6, 15)
+
+
+def _text(data, field):
+    value = data.get(field)
+    return value.strip() if isinstance(value, str) else ""
+
+
+def is_valid_email(value):
+    return bool(EMAIL_PATTERN.match(value))
+
+
+def is_valid_url(value):
+    return bool(URL_PATTERN.match(value))
+
+
+def is_valid_phone(value):
+    """True if every number in a comma-separated list looks like a phone number."""
+    for number in PHONE_SEPARATORS.split(value):
+        number = PHONE_EXTENSION.sub("", number.strip())
+        if not PHONE_PATTERN.match(number):
+            return False
+        digits = sum(c.isdigit() for c in number)
+        if not PHONE_DIGITS[0] <= digits <= PHONE_DIGITS[1]:
+            return False
+    return True
+
+
+def card_problems(data):
+    """
+    Returns a list of problems with an extraction result (empty when it
+    looks fine). None, or anything that is not a dict, is one problem.
+    """
+    if not isinstance(data, dict):
+        return ["no result"]
+
+    problems = []
+    for group in REQUIRED_GROUPS:
+        if not any(_text(data, field) for field in group):
+            problems.append(f"missing {' / '.join(group)}")
+
+    email = _text(data, "primaryEmail")
+    if email and not is_valid_email(email):
+        problems.append(f"bad email: {email}")
+    url = _text(data, "websiteURL")
+    if url and not is_valid_url(url):
+        problems.append(f"bad website: {url}")
+    phone = _text(data, "contactPhone")
+    if phone and not is_valid_phone(phone):
+        problems.append(f"bad phone: {phone}")
+    return problems
+
+
+def is_valid_card(data):
+    return not card_problems(data)
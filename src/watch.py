@@ -0,0 +1,370 @@
+"""
+Incremental scanning and watch mode for local folders.
+
+LocalIndex remembers (path, size, mtime, hash) of every image already
+extracted. FolderWatcher uses it to find only new or changed images,
+either in one pass (scan) or continuously (wait), with inotify where the
+optional `inotify_simple` package is installed (Linux) and directory
+polling elsewhere.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from src.cache import hash_bytes
+from src.local import (image_entry, is_image_file, read_local_image,
+                       relative_name, scan_images)
+
+
+def inotify_available():
+    try:
+        import inotify_simple  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """SHA-256 of a file's content, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class LocalIndex:
+    """
+    Persistent (path, size, mtime, hash) record of extracted local images
+    (SQLite). Entries are kept per `scope` (e.g. the output file), so the
+    same folder can be extracted to several outputs independently.
+    """
+
+    def __init__(self, path, scope=""):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.scope = scope
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                scope TEXT NOT NULL,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                hash TEXT,
+                updated REAL NOT NULL,
+                PRIMARY KEY (scope, path)
+            )
+        """)
+        self.conn.commit()
+        with self.lock:
+            self.entries = {
+                path: (size, mtime_ns, digest)
+                for path, size, mtime_ns, digest in self.conn.execute(
+                    "SELECT path, size, mtime_ns, hash FROM files WHERE scope = ?",
+                    (scope,))
+            }
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, path):
+        """Returns (size, mtime_ns, hash) for a path, or None."""
+        return self.entries.get(path)
+
+    def mark(self, path, size, mtime_ns, digest=None):
+        """Records a file as extracted at this size, mtime and hash."""
+        with self.lock:
+            self.entries[path] = (size, mtime_ns, digest)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                (self.scope, path, size, mtime_ns, digest, time.time()))
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class FolderWatcher:
+    """
+    Finds new or changed images in a local folder tree.
+
+    scan() walks the whole tree once and returns images not in the index,
+    or whose size/mtime changed and whose content hash differs. wait()
+    then blocks until more images land and returns just those: with
+    inotify it reacts to files being closed after writing (including
+    files overwritten in place) or moved in; otherwise it polls,
+    re-listing only folders whose mtime changed. Overwriting a file does
+    not change its folder's mtime, so each poll also stats the next
+    `sweep_files` known images in turn: an overwrite is found within
+    (images / sweep_files) polls.
+    Images are reported once until their size or mtime changes again.
+    mark_done() records an extracted image in the index.
+
+    Args:
+        folder_path: Folder to watch.
+        index: LocalIndex of already extracted images.
+        recursive: Include subfolders.
+        poll_seconds: Polling interval without inotify.
+        settle_seconds: Files modified more recently than this are left
+            for the next poll (they may still be being written).
+        use_inotify: Force inotify on or off (default: when available).
+        sweep_files: Known images stat'ed per poll to catch overwrites
+            (0 turns the sweep off).
+    """
+
+    def __init__(self, folder_path, index, recursive=False, poll_seconds=2.0,
+                 settle_seconds=1.0, use_inotify=None, sweep_files=200):
+        if not os.path.isdir(folder_path):
+            raise FileNotFoundError(f"Folder not found: {folder_path}")
+        self.folder_path = folder_path
+        self.index = index
+        self.recursive = recursive
+        self.poll_seconds = poll_seconds
+        self.settle_seconds = settle_seconds
+        self.sweep_files = sweep_files
+        if use_inotify is None:
+            use_inotify = inotify_available()
+        self.inotify = None
+        self.watches = {}
+        if use_inotify:
+            from inotify_simple import INotify
+            self.inotify = INotify()
+        self.reported = {}  # path -> (size, mtime_ns) handed out, not yet marked
+        # Polling: directory -> (mtime_ns, subdirectories, image paths)
+        self.dirs = {}
+        self.sweep = []  # Image paths left to stat in the current sweep
+        self.unsettled = set()
+
+    @property
+    def mode(self):
+        return "inotify" if self.inotify else "polling"
+
+    def load_image(self, image):
+        """Reads an image, keeping its content hash for mark_done()."""
+        data = read_local_image(image['id'])
+        image['hash'] = hash_bytes(data)
+        return data
+
+    def mark_done(self, image):
+        self.index.mark(image['id'], image['size'], image['mtime_ns'],
+                        image.get('hash'))
+        self.reported.pop(image['id'], None)
+
+    def _is_new(self, image):
+        """True if an image was never extracted or its content changed."""
+        path = image['id']
+        stat = (image['size'], image['mtime_ns'])
+        if self.reported.get(path) == stat:
+            return False
+        known = self.index.get(path)
+        if known is None:
+            return True
+        if known[:2] == stat:
+            return False
+        if known[2] and known[2] == hash_file(path):
+            # Touched or copied over with the same content
+            self.index.mark(path, stat[0], stat[1], known[2])
+            return False
+        return True
+
+    def _report(self, images):
+        new = []
+        for image in images:
+            try:
+                is_new = self._is_new(image)
+            except OSError:
+                continue  # Deleted while we looked at it
+            if is_new:
+                self.reported[image['id']] = (image['size'], image['mtime_ns'])
+                new.append(image)
+        return new
+
+    def scan(self):
+        """
+        Walks the whole tree; returns the new or changed images. Also
+        starts watching (inotify) or records folder mtimes (polling).
+        """
+        if self.inotify:
+            self._watch_tree(self.folder_path)
+            return self._report(scan_images(self.folder_path, self.recursive))
+        images = self._poll_dirs(self.folder_path, force=True)
+        return self._report(self._fix_names(sorted(images, key=lambda i: i['id'])))
+
+    def wait(self, timeout=None, stop_event=None):
+        """
+        Blocks until new or changed images appear (or `timeout` seconds
+        pass, or `stop_event` is set); returns them, possibly empty.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not (stop_event and stop_event.is_set()):
+            step = self.poll_seconds
+            if deadline is not None:
+                step = min(step, max(0.0, deadline - time.monotonic()))
+            if self.inotify:
+                images = self._read_events(step)
+            else:
+                if stop_event:
+                    stop_event.wait(step)
+                else:
+                    time.sleep(step)
+                images = self._poll()
+            if images:
+                return images
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+        return []
+
+    # --- inotify ---
+
+    def _watch_tree(self, directory):
+        from inotify_simple import flags
+        mask = (flags.CLOSE_WRITE | flags.MOVED_TO | flags.CREATE
+                | flags.DELETE_SELF)
+        stack = [directory]
+        while stack:
+            current = stack.pop()
+            try:
+                self.watches[self.inotify.add_watch(current, mask)] = current
+                with os.scandir(current) as entries:
+                    subdirs = [e.path for e in entries
+                               if e.is_dir(follow_symlinks=False)
+                               and not e.name.startswith('.')]
+            except OSError:
+                continue
+            if self.recursive:
+                stack.extend(subdirs)
+
+    def _read_events(self, timeout):
+        from inotify_simple import flags
+        paths = set()
+        new_dirs = []
+        for event in self.inotify.read(timeout=int(timeout * 1000)):
+            directory = self.watches.get(event.wd)
+            if directory is None:
+                continue
+            if event.mask & flags.DELETE_SELF:
+                self.watches.pop(event.wd, None)
+                continue
+            if not event.name or event.name.startswith('.'):
+                continue
+            path = os.path.join(directory, event.name)
+            if event.mask & flags.ISDIR:
+                if self.recursive and event.mask & (flags.CREATE | flags.MOVED_TO):
+                    new_dirs.append(path)
+            elif event.mask & (flags.CLOSE_WRITE | flags.MOVED_TO):
+                if is_image_file(event.name):
+                    paths.add(path)
+
+        images = [self._entry(path) for path in sorted(paths)]
+        for directory in new_dirs:
+            # Files may land before the watch is in place: list them too
+            self._watch_tree(directory)
+            images.extend(scan_images(directory, self.recursive))
+        return self._report(self._fix_names(i for i in images if i))
+
+    # --- polling ---
+
+    def _poll_dirs(self, directory, force=False):
+        """
+        Re-lists folders whose mtime changed (adding or renaming a file
+        changes it); unchanged folders cost a single stat. Keeps each
+        folder's image paths. Returns the images of the re-listed folders.
+        """
+        images = []
+        seen = set()
+        stack = [directory]
+        while stack:
+            current = stack.pop()
+            seen.add(current)
+            try:
+                mtime_ns = os.stat(current).st_mtime_ns
+            except OSError:
+                self.dirs.pop(current, None)
+                continue
+            known = self.dirs.get(current)
+            if force or known is None or known[0] != mtime_ns:
+                subdirs, files = [], []
+                try:
+                    with os.scandir(current) as entries:
+                        for e in entries:
+                            if e.name.startswith('.'):
+                                continue
+                            if e.is_dir(follow_symlinks=False):
+                                subdirs.append(e.path)
+                            elif is_image_file(e.name) and e.is_file():
+                                images.append(image_entry(e.path, None, e.stat()))
+                                files.append(e.path)
+                except OSError:
+                    continue
+                self.dirs[current] = (mtime_ns, subdirs, files)
+            else:
+                subdirs = known[1]
+            if self.recursive:
+                stack.extend(subdirs)
+        # Forget folders that were removed
+        for gone in self.dirs.keys() - seen:
+            del self.dirs[gone]
+        return images
+
+    def _sweep(self):
+        """
+        Stats the next `sweep_files` known images, starting over once all
+        have been checked. Unchanged ones are dropped by _report.
+        """
+        if not self.sweep_files:
+            return []
+        if not self.sweep:
+            self.sweep = [path for _, _, files in self.dirs.values()
+                          for path in files]
+            self.sweep.reverse()
+        images = []
+        for _ in range(min(self.sweep_files, len(self.sweep))):
+            image = self._entry(self.sweep.pop())
+            if image:
+                images.append(image)
+        return images
+
+    def _poll(self):
+        candidates = {}
+        for image in self._sweep() + self._poll_dirs(self.folder_path):
+            candidates[image['id']] = image
+        for path in self.unsettled:
+            image = self._entry(path)
+            if image:
+                candidates[path] = image
+        self.unsettled = set()
+
+        settled = []
+        now_ns = time.time_ns()
+        for path, image in sorted(candidates.items()):
+            if now_ns - image['mtime_ns'] < self.settle_seconds * 1e9:
+                self.unsettled.add(path)
+            else:
+                settled.append(image)
+        return self._report(self._fix_names(settled))
+
+    # --- helpers ---
+
+    def _entry(self, path):
+        try:
+            return image_entry(path, None, os.stat(path))
+        except OSError:
+            return None
+
+    def _fix_names(self, images):
+        for image in images:
+            image['name'] = relative_name(self.folder_path, image['id'])
+            yield image
+
+    def close(self):
+        if self.inotify:
+            self.inotify.close()
+            self.inotify = None
@@ -0,0 +1,257 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+STATES = [PENDING, LEASED, DONE, FAILED]
+
+
+class WorkQueue:
+    """
+    SQLite work queue shared by worker processes, on one host or on
+    several hosts that see the file on shared storage (NFS, SMB). Each
+    image is pending, leased, done or failed.
+
+    The file uses SQLite's rollback journal rather than WAL, whose
+    shared-memory index only works within one host; it relies on the
+    share's file locking instead. Claims and failures take the write
+    lock up front (BEGIN IMMEDIATE), and a worker that finds the file
+    locked waits up to `busy_timeout` seconds.
+
+    Workers claim pending images with a lease that expires after
+    `lease_seconds` unless renewed, so images held by a worker that
+    crashed go back to the pool. Lease times come from each worker's
+    clock, so the hosts' clocks must agree to well within that. Each
+    claim gets a lease token; results are only recorded while the
+    caller's lease still holds the image, so a worker whose lease
+    expired cannot overwrite the new holder's work. An image is failed
+    once it has been tried `max_attempts` times. Rows of done images are
+    stored in the queue, so progress and results are read from it rather
+    than from any one worker.
+
+    Args:
+        path: Queue database file (created if missing).
+        lease_seconds: How long a claim lasts without renewal.
+        max_attempts: Tries per image before it is marked failed.
+        busy_timeout: Seconds to wait for another worker's lock.
+    """
+
+    def __init__(self, path, lease_seconds=300, max_attempts=3,
+                 busy_timeout=60.0):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        # Autocommit; claims open their own write transaction
+        self.conn = sqlite3.connect(path, timeout=busy_timeout,
+                                    isolation_level=None,
+                                    check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=DELETE")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS items (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                id TEXT NOT NULL UNIQUE,
+                name TEXT NOT NULL,
+                state TEXT NOT NULL,
+                worker TEXT,
+                lease TEXT,
+                lease_until REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                row TEXT,
+                error TEXT,
+                updated REAL NOT NULL
+            )
+        """)
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS items_state ON items (state, lease_until)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def set_source(self, local_folder=None, drive_folder_id=None):
+        """Records where the queued images come from, for the workers."""
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('source', ?)",
+                (json.dumps({"local_folder": local_folder,
+                             "drive_folder_id": drive_folder_id}),))
+
+    def source(self):
+        """Returns (local_folder, drive_folder_id) set by set_source()."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value FROM meta WHERE key = 'source'").fetchone()
+        if row is None:
+            raise ValueError(f"Queue {self.path} has no source; fill it first")
+        source = json.loads(row[0])
+        return source["local_folder"], source["drive_folder_id"]
+
+    def add(self, images):
+        """Queues image dicts not already in the queue; returns how many were added."""
+        now = time.time()
+        with self.lock:
+            before = self.conn.total_changes
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO items (id, name, state, updated) "
+                "VALUES (?, ?, ?, ?)",
+                ((img['id'], img['name'], PENDING, now) for img in images))
+            self.conn.execute("COMMIT")
+            return self.conn.total_changes - before
+
+    def claim(self, worker, limit=1):
+        """
+        Leases up to `limit` images to `worker`, oldest first, including
+        images whose lease has expired. Returns a list of image dicts
+        with the claim's token under 'lease', for complete() and fail().
+        """
+        lease = uuid.uuid4().hex
+        now = time.time()
+        with self.lock:
+            # IMMEDIATE takes the write lock up front, so two processes
+            # can never lease the same image
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute(
+                    "UPDATE items SET state = ?, worker = NULL, lease = NULL, "
+                    "updated = ?, error = 'Lease expired too many times' "
+                    "WHERE state = ? AND lease_until < ? AND attempts >= ?",
+                    (FAILED, now, LEASED, now, self.max_attempts))
+                rows = self.conn.execute(
+                    "SELECT id, name FROM items WHERE state = ? "
+                    "OR (state = ? AND lease_until < ?) ORDER BY seq LIMIT ?",
+                    (PENDING, LEASED, now, limit)).fetchall()
+                self.conn.executemany(
+                    "UPDATE items SET state = ?, worker = ?, lease = ?, "
+                    "lease_until = ?, attempts = attempts + 1, updated = ? "
+                    "WHERE id = ?",
+                    [(LEASED, worker, lease, now + self.lease_seconds, now, row[0])
+                     for row in rows])
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return [{'id': image_id, 'name': name, 'lease': lease}
+                for image_id, name in rows]
+
+    def renew(self, worker):
+        """Extends all of a worker's leases; returns how many it holds."""
+        now = time.time()
+        with self.lock:
+            return self.conn.execute(
+                "UPDATE items SET lease_until = ? WHERE state = ? AND worker = ?",
+                (now + self.lease_seconds, LEASED, worker)).rowcount
+
+    def complete(self, image_id, lease, row):
+        """
+        Marks an image done and stores its row, if `lease` (from claim())
+        still holds it. Returns False when the lease was lost (expired and
+        taken over, or the image was failed meanwhile); nothing is stored.
+        """
+        with self.lock:
+            return self.conn.execute(
+                "UPDATE items SET state = ?, row = ?, error = NULL, "
+                "worker = NULL, lease = NULL, lease_until = NULL, updated = ? "
+                "WHERE id = ? AND state = ? AND lease = ?",
+                (DONE, json.dumps(row, ensure_ascii=False), time.time(),
+                 image_id, LEASED, lease)).rowcount == 1
+
+    def fail(self, image_id, lease, error, retry=True):
+        """
+        Records a failed try under `lease`. The image goes back to pending
+        while it has attempts left (and `retry` is set), else it is marked
+        failed. Returns the new state, or None if the lease was lost.
+        """
+        with self.lock:
+            # The check and the update must see the same lease
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(
+                    "SELECT attempts FROM items WHERE id = ? AND state = ? "
+                    "AND lease = ?", (image_id, LEASED, lease)).fetchone()
+                state = None
+                if row is not None:
+                    state = (PENDING if retry and row[0] < self.max_attempts
+                             else FAILED)
+                    self.conn.execute(
+                        "UPDATE items SET state = ?, worker = NULL, lease = NULL, "
+                        "lease_until = NULL, error = ?, updated = ? WHERE id = ?",
+                        (state, str(error)[:500], time.time(), image_id))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return state
+
+    def release(self, worker, image_id=None):
+        """
+        Returns a worker's leased images (or just `image_id`) to pending
+        without counting the try, e.g. on a quota stop or shutdown.
+        """
+        query = ("UPDATE items SET state = ?, worker = NULL, lease = NULL, "
+                 "lease_until = NULL, attempts = MAX(attempts - 1, 0), updated = ? "
+                 "WHERE state = ? AND worker = ?")
+        params = [PENDING, time.time(), LEASED, worker]
+        if image_id is not None:
+            query += " AND id = ?"
+            params.append(image_id)
+        with self.lock:
+            return self.conn.execute(query, params).rowcount
+
+    def retry_failed(self):
+        """Puts failed images back to pending with fresh attempts."""
+        with self.lock:
+            return self.conn.execute(
+                "UPDATE items SET state = ?, attempts = 0, updated = ? WHERE state = ?",
+                (PENDING, time.time(), FAILED)).rowcount
+
+    def counts(self):
+        """Returns {state: number of images}, with all states present."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT state, COUNT(*) FROM items GROUP BY state").fetchall()
+        counts = {state: 0 for state in STATES}
+        counts.update(rows)
+        return counts
+
+    def workers(self):
+        """Returns {worker: images currently leased} for live leases."""
+        with self.lock:
+            return dict(self.conn.execute(
+                "SELECT worker, COUNT(*) FROM items WHERE state = ? "
+                "AND lease_until >= ? GROUP BY worker",
+                (LEASED, time.time())).fetchall())
+
+    def failures(self, limit=None):
+        """Returns [(file name, attempts, error)] of failed images."""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT name, attempts, error FROM items WHERE state = ? "
+                "ORDER BY seq LIMIT ?", (FAILED, limit or -1)).fetchall()
+
+    def iter_rows(self, batch=1000):
+        """Yields the rows of done images in queue order."""
+        last = 0
+        while True:
+            with self.lock:
+                rows = self.conn.execute(
+                    "SELECT seq, row FROM items WHERE state = ? AND seq > ? "
+                    "ORDER BY seq LIMIT ?", (DONE, last, batch)).fetchall()
+            if not rows:
+                return
+            for seq, row in rows:
+                yield json.loads(row)
+            last = rows[-1][0]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -1,10 +1,11 @@
-"""Quick test to check if Gemini API key has quota remaining."""
+"""Quick test to check if Gemini API keys have quota remaining."""
 from google import genai
 from src.config import Config
+from src.keypool import key_id, parse_api_keys
 
-def test_quota():
+def test_quota(api_key=None):
     try:
-        client = genai.Client(api_key=Config.GEMINI_API_KEY)
+        client = genai.Client(api_key=api_key or Config.GEMINI_API_KEY)
         
         # Minimal text request (uses very few tokens)
         response = client.models.generate_content(
@@ -29,5 +30,17 @@ def test_quota():
         
         return False
 
+def test_all_keys():
+    """Probes every key in GEMINI_API_KEYS (or the single GEMINI_API_KEY)."""
+    keys = parse_api_keys(Config.GEMINI_API_KEYS)
+    results = {}
+    for key in keys:
+        print(f"\n--- Key {key_id(key)} ---")
+        results[key_id(key)] = test_quota(key)
+    if len(keys) > 1:
+        working = sum(results.values())
+        print(f"\n{working}/{len(keys)} keys have quota remaining.")
+    return results
+
 if __name__ == "__main__":
-    test_quota()
+    test_all_keys()
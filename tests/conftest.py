@@ -0,0 +1,51 @@
+"""
+Shared fixtures. Tests run offline against the fakes in src/fakes.py;
+every test gets its own cache, ledger and state directory.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src import gemini  # noqa: E402
+from src.config import Config  # noqa: E402
+from src.fakes import FakeGenaiClient  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def state_dir(tmp_path, monkeypatch):
+    """Points every Config path at a fresh directory."""
+    state = tmp_path / "state"
+    paths = {
+        "CACHE_DIR": state,
+        "CHECKPOINT_DIR": state / "checkpoints",
+        "DRIVE_SYNC_DIR": state / "drive_sync",
+        "LOCAL_INDEX_PATH": state / "local_index.sqlite3",
+        "FAILURE_LEDGER_PATH": state / "failures.sqlite3",
+        "SPOOL_DIR": state / "spool",
+        "QUEUE_PATH": state / "queue.sqlite3",
+        "KEY_USAGE_FILE": state / "key_usage.json",
+    }
+    for name, path in paths.items():
+        monkeypatch.setattr(Config, name, str(path))
+    return state
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    """FakeGenaiClient handed out for every API key."""
+    client = FakeGenaiClient()
+    monkeypatch.setattr(gemini, "gemini_client", lambda api_key: client)
+    return client
+
+
+@pytest.fixture
+def card_folder(tmp_path):
+    """Local folder with card0.jpg ... card4.jpg (distinct fake contents)."""
+    folder = tmp_path / "cards"
+    folder.mkdir()
+    for i in range(5):
+        (folder / f"card{i}.jpg").write_bytes(f"card image {i}".encode() * 20)
+    return folder
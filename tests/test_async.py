@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from src.fakes import FakeGenaiClient
+from src.gemini import GeminiExtractor
+
+
+def collect(gemini, images, concurrency):
+    async def run():
+        return [item async for item in gemini.extract_many(images, concurrency)]
+    return asyncio.run(run())
+
+
+def card_images(count):
+    return ((f"card {i}".encode() * 20, f"card{i}.jpg") for i in range(count))
+
+
+def test_extract_many_returns_every_card():
+    client = FakeGenaiClient(latency=0.001, jitter=0.01, seed=3)
+
+    results = collect(GeminiExtractor(client=client), card_images(30), 8)
+
+    assert sorted(name for name, _ in results) == sorted(
+        f"card{i}.jpg" for i in range(30))
+    assert all(data and data["fullName"] for _, data in results)
+    assert client.models.calls == 30
+
+
+def test_extract_many_keeps_at_most_concurrency_requests_in_flight():
+    client = FakeGenaiClient(latency=0.01)
+    models = client.aio.models
+    real_generate = models.generate_content
+    in_flight = {"now": 0, "max": 0}
+
+    async def generate_content(**kwargs):
+        in_flight["now"] += 1
+        in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        try:
+            return await real_generate(**kwargs)
+        finally:
+            in_flight["now"] -= 1
+
+    models.generate_content = generate_content
+
+    collect(GeminiExtractor(client=client), card_images(20), 4)
+
+    assert in_flight["max"] == 4
+
+
+def test_quota_error_stops_the_run():
+    client = FakeGenaiClient(error_rate=1.0)
+
+    with pytest.raises(ResourceWarning):
+        collect(GeminiExtractor(client=client), card_images(10), 4)
+
+    assert client.models.calls <= 4
@@ -0,0 +1,43 @@
+import json
+
+from src.fakes import FakeGenaiClient, fake_card_data
+from src.gemini import GeminiExtractor
+
+
+def test_bulk_job_skips_unreadable_images(tmp_path):
+    client = FakeGenaiClient(batch_polls=2)
+    gemini = GeminiExtractor(client=client)
+    images = [{'id': str(i), 'name': f"card{i}.jpg"} for i in range(4)]
+
+    def load_image(image):
+        if image['id'] == "1":
+            raise OSError("unreadable")
+        return f"image {image['id']}".encode() * 20
+
+    request_path = str(tmp_path / "cards.requests.jsonl")
+    results = gemini.extract_bulk(images, load_image, request_path,
+                                  poll_interval=0)
+
+    with open(request_path, encoding="utf-8") as f:
+        keys = [json.loads(line)["key"] for line in f]
+    assert keys == ["0:card0.jpg", "2:card2.jpg", "3:card3.jpg"]
+    assert [name for name, _ in results] == [img['name'] for img in images]
+    assert results[1][1] is None
+    for image, (name, row) in zip(images, results):
+        if row is not None:
+            assert row[1] == fake_card_data(load_image(image))["fullName"]
+    assert gemini.metrics.tokens["total"] > 0
+
+
+def test_bulk_job_with_no_readable_images_is_not_submitted(tmp_path):
+    client = FakeGenaiClient()
+    gemini = GeminiExtractor(client=client)
+
+    def load_image(image):
+        raise OSError("unreadable")
+
+    results = gemini.extract_bulk([{'id': "0", 'name': "card0.jpg"}], load_image,
+                                  str(tmp_path / "requests.jsonl"))
+
+    assert results == [("card0.jpg", None)]
+    assert client.batches.jobs == {}
@@ -0,0 +1,44 @@
+from src.cache import ExtractionCache
+from src.runner import build_job
+
+
+def test_entries_are_keyed_by_image_and_fingerprint(tmp_path):
+    cache = ExtractionCache(str(tmp_path))
+    key = cache.make_key(b"card", "model-a")
+    cache.put(key, {"fullName": "Ada Lovelace"})
+
+    assert cache.get(key) == {"fullName": "Ada Lovelace"}
+    # A new model or prompt never returns the old result
+    assert cache.get(cache.make_key(b"card", "model-b")) is None
+    assert cache.get(cache.make_key(b"other card", "model-a")) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+    cache.close()
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ExtractionCache(str(tmp_path), max_entries=2)
+    for name in ("a", "b", "c"):
+        cache.put(name, {"fileName": name})
+        # Reading "a" keeps it recent
+        cache.get("a")
+
+    cache.evict()
+
+    assert cache.get("b") is None
+    assert cache.get("a") and cache.get("c")
+    cache.close()
+
+
+def test_rerun_is_served_from_the_cache(card_folder, tmp_path, fake_client):
+    options = dict(local_folder=str(card_folder), downscale=False, rpm=60000,
+                   resume=False)
+    first = list(build_job("key", output_path=str(tmp_path / "a.csv"),
+                           **options).run())
+    calls = fake_client.models.calls
+
+    job = build_job("key", output_path=str(tmp_path / "b.csv"), **options)
+    results = list(job.run())
+
+    assert fake_client.models.calls == calls
+    assert all(r.cached for r in results)
+    assert [r.row for r in results] == [r.row for r in first]
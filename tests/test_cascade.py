@@ -0,0 +1,118 @@
+from src.fakes import FakeGenaiClient, is_hard_card
+from src.gemini import GeminiExtractor
+from src.pipeline import STATUS_OK, ExtractionPipeline, RateLimiter
+from src.ratecontrol import AdaptiveRateController
+from src.sheets import HEADER
+from src.validation import is_valid_card
+
+STRONG_MODEL = "gemini-2.5-flash"
+HARD_RATE = 0.5
+
+
+class RecordingLimiter(RateLimiter):
+    """Unlimited RateLimiter remembering which calls went through it."""
+
+    def __init__(self):
+        super().__init__(None)
+        self.calls = []
+
+    def call(self, fn, *args, **kwargs):
+        self.calls.append(fn.__name__)
+        return super().call(fn, *args, **kwargs)
+
+
+def load_image(image):
+    return f"image {image['id']}".encode() * 20
+
+
+def make_images(count):
+    return [{'id': str(i), 'name': f"card{i}.jpg"} for i in range(count)]
+
+
+def count_hard(images):
+    return sum(is_hard_card(load_image(img), HARD_RATE) for img in images)
+
+
+def quota_error_for(client, failing_model, times):
+    """Makes the next `times` requests to `failing_model` fail with a 429."""
+    models = client.models
+    real_generate = models.generate_content
+    calls = {"failed": 0}
+
+    def generate_content(model=None, contents=None, config=None):
+        if model == failing_model and calls["failed"] < times:
+            calls["failed"] += 1
+            raise models._quota_error()
+        return real_generate(model=model, contents=contents, config=config)
+
+    models.generate_content = generate_content
+    return calls
+
+
+def make_pipeline(client, rate_control=None, **options):
+    gemini = GeminiExtractor(client=client, escalation_model=STRONG_MODEL)
+    return ExtractionPipeline(gemini, load_image, rate_control=rate_control,
+                              rpm=None, **options)
+
+
+def test_escalations_are_separate_rate_limited_calls():
+    images = make_images(20)
+    limiter = RecordingLimiter()
+    pipeline = make_pipeline(FakeGenaiClient(hard_rate=HARD_RATE), limiter,
+                             workers=4)
+
+    results = list(pipeline.run(images))
+
+    hard = count_hard(images)
+    assert hard
+    assert limiter.calls.count("extract_data") == 20
+    assert limiter.calls.count("escalate") == hard
+    assert all(r.status == STATUS_OK for r in results)
+    assert all(is_valid_card(dict(zip(HEADER, r.row))) for r in results)
+
+
+def test_batched_cards_escalate_through_the_limiter():
+    images = make_images(12)
+    limiter = RecordingLimiter()
+    client = FakeGenaiClient(hard_rate=HARD_RATE)
+    pipeline = make_pipeline(client, limiter, workers=2, batch_size=4)
+
+    list(pipeline.run(images))
+
+    assert limiter.calls.count("extract_batch") == 3
+    assert limiter.calls.count("escalate") == count_hard(images)
+    assert client.models.calls_by_model[STRONG_MODEL] == count_hard(images)
+
+
+def test_retried_429_repeats_only_the_escalation():
+    images = [img for img in make_images(20)
+              if is_hard_card(load_image(img), HARD_RATE)][:1]
+    client = FakeGenaiClient(hard_rate=HARD_RATE, retry_after=0.01)
+    failures = quota_error_for(client, STRONG_MODEL, times=1)
+    rate_control = AdaptiveRateController(rpm=60000, base_delay=0.01,
+                                          max_delay=0.05)
+    pipeline = make_pipeline(client, rate_control, workers=1)
+
+    results = list(pipeline.run(images))
+
+    assert failures["failed"] == 1
+    assert rate_control.retries == 1
+    assert client.models.calls_by_model == {"gemini-2.5-flash-lite": 1,
+                                            STRONG_MODEL: 1}
+    assert results[0].status == STATUS_OK
+    assert results[0].row[4]  # primaryEmail from the escalated result
+
+
+def test_quota_error_on_escalation_keeps_first_result():
+    images = [img for img in make_images(20)
+              if is_hard_card(load_image(img), HARD_RATE)][:1]
+    client = FakeGenaiClient(hard_rate=HARD_RATE)
+    quota_error_for(client, STRONG_MODEL, times=1)
+    pipeline = make_pipeline(client, workers=1)
+
+    results = list(pipeline.run(images))
+
+    assert results[0].status == STATUS_OK
+    assert results[0].row[1]  # fullName from the first tier
+    assert results[0].row[4] == ""  # no email: not escalated
+    assert pipeline.quota_hit.is_set()
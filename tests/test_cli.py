@@ -0,0 +1,37 @@
+import json
+
+import cli
+from src.output import load_output_file_names
+
+
+def run_cli(card_folder, output, *args):
+    return cli.main(["--local", str(card_folder), "--output", str(output),
+                     "--api-key", "key", "--rpm", "60000", "--no-downscale",
+                     "--no-cache", "--quiet", *args])
+
+
+def test_cli_writes_the_output_and_metrics(card_folder, tmp_path, fake_client,
+                                           capsys):
+    output = tmp_path / "cards.jsonl"
+    metrics = tmp_path / "metrics.json"
+
+    assert run_cli(card_folder, output, "--metrics", str(metrics)) == 0
+
+    assert load_output_file_names(str(output)) == {
+        f"card{i}.jpg" for i in range(5)}
+    assert "Done: 5/5 extracted, 0 errors." in capsys.readouterr().out
+    with open(metrics, encoding="utf-8") as f:
+        assert json.load(f)
+
+
+def test_cli_exits_2_when_the_quota_stops_the_run(card_folder, tmp_path,
+                                                 fake_client):
+    fake_client.models.error_rate = 1.0
+
+    assert run_cli(card_folder, tmp_path / "cards.csv", "--no-adaptive") == 2
+
+
+def test_bulk_rejects_incremental(card_folder, tmp_path, capsys):
+    assert run_cli(card_folder, tmp_path / "cards.csv", "--bulk",
+                   "--incremental") == 1
+    assert "--bulk cannot be combined" in capsys.readouterr().err
@@ -0,0 +1,123 @@
+import threading
+
+from src import clients
+from src.config import Config
+from src.contextcache import ContextCache, estimate_tokens
+from src.fakes import FakeGenaiClient
+from src.gemini import GeminiExtractor
+from src.runner import build_job
+
+MODEL = "gemini-2.5-flash-lite"
+INSTRUCTION = "Extract the card. " * 100
+
+
+def test_entry_is_created_once_and_reused():
+    client = FakeGenaiClient()
+    cache = ContextCache(ttl_seconds=3600)
+
+    names = {cache.name_for(client, MODEL, INSTRUCTION, "fp") for _ in range(5)}
+
+    assert len(names) == 1 and None not in names
+    assert client.caches.created == 1
+    assert cache.stats()["created"] == 1
+
+
+def test_entry_is_extended_near_expiry():
+    client = FakeGenaiClient()
+    cache = ContextCache(ttl_seconds=10, refresh_margin=5)
+    name = cache.name_for(client, MODEL, INSTRUCTION, "fp")
+    key = (id(client), "fp")
+    cache.entries[key] = (name, cache.entries[key][1] - 8)
+
+    assert cache.name_for(client, MODEL, INSTRUCTION, "fp") == name
+    assert client.caches.updated == 1
+    assert client.caches.created == 1
+
+
+def test_small_instruction_is_not_cached():
+    client = FakeGenaiClient()
+    cache = ContextCache(min_tokens=1024)
+
+    assert estimate_tokens(INSTRUCTION) < 1024
+    assert cache.name_for(client, MODEL, INSTRUCTION, "fp") is None
+    assert client.caches.created == 0
+    assert "below" in cache.disabled
+
+
+def test_stock_instruction_clears_the_default_minimum():
+    gemini = GeminiExtractor(client=FakeGenaiClient(),
+                             context_cache=ContextCache())
+
+    assert estimate_tokens(gemini.system_instruction) < 1024
+    assert estimate_tokens(gemini.instruction()) >= Config.CONTEXT_CACHE_MIN_TOKENS
+
+
+def test_stock_run_creates_and_reuses_an_entry(card_folder, tmp_path,
+                                               fake_client, monkeypatch):
+    cache = ContextCache(min_tokens=Config.CONTEXT_CACHE_MIN_TOKENS)
+    monkeypatch.setattr(clients, "context_cache", lambda: cache)
+    fake_client.caches.min_tokens = Config.CONTEXT_CACHE_MIN_TOKENS
+    job = build_job("key", local_folder=str(card_folder),
+                    output_path=str(tmp_path / "cards.csv"), context_cache=True,
+                    workers=1, downscale=False, use_cache=False, rpm=60000)
+
+    assert len(list(job.run())) == 5
+    assert cache.disabled is None
+    assert fake_client.caches.created == 1
+    # Every request after the first refers to the same entry
+    tokens = job.metrics.tokens
+    assert tokens["cached"] == 5 * estimate_tokens(job.pipeline.extractor.instruction())
+
+
+def test_rejected_create_disables_caching():
+    client = FakeGenaiClient(cache_min_tokens=10 ** 6)
+    cache = ContextCache()
+
+    assert cache.name_for(client, MODEL, INSTRUCTION, "fp") is None
+    assert cache.disabled
+    assert cache.name_for(client, MODEL, INSTRUCTION, "fp") is None
+
+
+def test_create_does_not_block_other_requests():
+    client = FakeGenaiClient()
+    started, release = threading.Event(), threading.Event()
+    real_create = client.caches.create
+
+    def slow_create(model=None, config=None):
+        started.set()
+        release.wait(5)
+        return real_create(model=model, config=config)
+
+    client.caches.create = slow_create
+    cache = ContextCache()
+    names = []
+    creator = threading.Thread(target=lambda: names.append(
+        cache.name_for(client, MODEL, INSTRUCTION, "fp")))
+    creator.start()
+    assert started.wait(5)
+
+    # Served inline straight away while the entry is being created,
+    # and other clients' entries are not held up either
+    assert cache.name_for(client, MODEL, INSTRUCTION, "fp") is None
+    other = FakeGenaiClient()
+    assert cache.name_for(other, MODEL, INSTRUCTION, "fp") is not None
+
+    release.set()
+    creator.join(5)
+    assert names[0] is not None
+    assert cache.name_for(client, MODEL, INSTRUCTION, "fp") == names[0]
+
+
+def test_extractor_requests_use_the_cached_instruction():
+    client = FakeGenaiClient()
+    gemini = GeminiExtractor(client=client, context_cache=ContextCache())
+    gemini.system_instruction = INSTRUCTION
+
+    assert gemini.extract_data(b"card" * 50, "card.jpg")
+    assert client.caches.created == 1
+    assert gemini.metrics.tokens["cached"] > 0
+
+    # A rejected entry is recreated and the request repeated
+    client.caches.expire()
+    assert gemini.extract_data(b"card" * 50, "card.jpg")
+    assert client.caches.created == 2
@@ -0,0 +1,66 @@
+import io
+import random
+import time
+
+from PIL import Image
+
+from src.dedupe import NearDuplicateIndex
+from src.fakes import FakeGenaiClient
+from src.gemini import GeminiExtractor
+from src.pipeline import (STATUS_DUPLICATE, STATUS_OK, STATUS_QUOTA,
+                          ExtractionPipeline)
+
+
+def noise_png(seed):
+    """A random grey image, so different seeds get distant hashes."""
+    rng = random.Random(seed)
+    img = Image.new("L", (64, 40))
+    img.putdata([rng.randrange(256) for _ in range(64 * 40)])
+    buffer = io.BytesIO()
+    img.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+PHOTOS = {"a.png": noise_png(1), "a-copy.png": noise_png(1), "b.png": noise_png(2),
+          "x.png": noise_png(3)}
+
+
+def load_photo(image):
+    return PHOTOS[image['name']]
+
+
+def images(*names):
+    return [{'id': name, 'name': name} for name in names]
+
+
+def test_copies_reuse_the_first_result():
+    pipeline = ExtractionPipeline(
+        GeminiExtractor(client=FakeGenaiClient()), load_photo, rpm=None,
+        dedupe=NearDuplicateIndex())
+
+    results = list(pipeline.run(images("a.png", "b.png", "a-copy.png")))
+
+    assert [r.status for r in results] == [STATUS_OK, STATUS_OK, STATUS_DUPLICATE]
+    assert results[2].duplicate_of == "a.png"
+    assert results[2].row == ["a-copy.png"] + results[0].row[1:]
+
+
+def test_copies_of_quota_skipped_originals_are_skipped_too():
+    def slow_preprocess(image_bytes):
+        # x.png reaches the model first and hits the quota
+        if image_bytes != PHOTOS["x.png"]:
+            time.sleep(0.2)
+        return image_bytes, "image/png"
+
+    dedupe = NearDuplicateIndex()
+    pipeline = ExtractionPipeline(
+        GeminiExtractor(client=FakeGenaiClient(latency=0.05, error_rate=1.0)),
+        load_photo,
+        workers=2, rpm=None, preprocess=slow_preprocess, dedupe=dedupe)
+
+    results = list(pipeline.run(images("x.png", "a.png", "a-copy.png")))
+
+    # Only the image that hit the quota is reported; a.png and its copy
+    # were never extracted, so the next run picks both up
+    assert [(r.file_name, r.status) for r in results] == [("x.png", STATUS_QUOTA)]
+    assert dedupe.duplicates == 1
@@ -0,0 +1,111 @@
+import csv
+
+import pytest
+from googleapiclient.errors import HttpError
+
+from src import clients
+from src.drive import DriveDownloader, FolderChanges
+from src.fakes import FakeDriveService, fake_card_data
+from src.runner import build_job
+
+FOLDER = "fake-folder"
+
+
+def card(name, version=1):
+    return f"{name} v{version}".encode() * 20
+
+
+@pytest.fixture
+def drive(monkeypatch):
+    drive = FakeDriveService({f"card{i}.jpg": card(f"card{i}.jpg") for i in range(3)},
+                             folder_id=FOLDER)
+    downloader = DriveDownloader(None)
+    # The fake is thread-safe, so every borrower may get the same one
+    for _ in range(16):
+        downloader.release(drive)
+    monkeypatch.setattr(clients, "drive_downloader", lambda credentials_dict=None: downloader)
+    return drive
+
+
+def run_incremental(output):
+    job = build_job("key", drive_folder_id=FOLDER, output_path=output,
+                    incremental=True, downscale=False, use_cache=False, rpm=60000)
+    return job, list(job.run())
+
+
+def read_rows(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return {row[0]: row for row in list(csv.reader(f))[1:]}
+
+
+def test_changed_file_replaces_its_row(drive, tmp_path, fake_client):
+    output = str(tmp_path / "cards.csv")
+    _, results = run_incremental(output)
+    assert len(results) == 3
+
+    drive.put_file("card1.jpg", card("card1.jpg", 2))
+    _, results = run_incremental(output)
+
+    assert [r.file_name for r in results] == ["card1.jpg"]
+    rows = read_rows(output)
+    assert sorted(rows) == ["card0.jpg", "card1.jpg", "card2.jpg"]
+    assert rows["card1.jpg"][1] == fake_card_data(card("card1.jpg", 2))["fullName"]
+    with open(output, encoding="utf-8") as f:
+        assert len(f.readlines()) == 4  # HEADER and one row per image
+
+
+def test_position_advances_past_failed_images(drive, tmp_path, fake_client,
+                                              monkeypatch):
+    output = str(tmp_path / "cards.csv")
+    run_incremental(output)
+
+    drive.put_file("card3.jpg", b"broken")
+    drive.put_file("card4.jpg", card("card4.jpg"))
+    real_call = DriveDownloader.__call__
+
+    def flaky_download(self, image):
+        if image['name'] == "card3.jpg":
+            raise OSError("download failed")
+        return real_call(self, image)
+
+    monkeypatch.setattr(DriveDownloader, "__call__", flaky_download)
+    job, results = run_incremental(output)
+    assert job.errors == 1
+    assert [e["fileName"] for e in job.failures.entries()] == ["card3.jpg"]
+
+    # The failure is left to the ledger: the next run starts after it
+    _, results = run_incremental(output)
+    assert results == []
+
+
+def test_rejected_token_falls_back_to_full_listing(drive, tmp_path):
+    downloader = clients.drive_downloader()
+    state_path = str(tmp_path / "state.json")
+    changes = FolderChanges(downloader, FOLDER, state_path)
+    assert len(list(changes)) == 3
+    changes.commit()
+
+    drive.put_file("card3.jpg", card("card3.jpg"))
+    drive.expire_changes()
+    changes = FolderChanges(downloader, FOLDER, state_path)
+
+    assert [img['name'] for img in changes] == [f"card{i}.jpg" for i in range(4)]
+    assert changes.full_listing
+
+
+def test_error_after_first_change_is_raised(drive, tmp_path):
+    downloader = clients.drive_downloader()
+    state_path = str(tmp_path / "state.json")
+    changes = FolderChanges(downloader, FOLDER, state_path)
+    list(changes)
+    changes.commit()
+
+    drive.page_size = 1
+    drive.put_file("card3.jpg", card("card3.jpg"))
+    drive.put_file("card4.jpg", card("card4.jpg"))
+    listing = iter(FolderChanges(downloader, FOLDER, state_path))
+
+    assert next(listing)['name'] == "card3.jpg"
+    drive.expire_changes()
+    with pytest.raises(HttpError):
+        next(listing)
@@ -0,0 +1,105 @@
+import time
+
+from src.config import Config
+from src.failures import DEAD, RETRYING, FailureLedger
+from src.output import load_output_file_names
+from src.pipeline import STATUS_ERROR, STATUS_OK, STATUS_QUOTA, PipelineResult
+from src.runner import build_job
+
+
+def result(name, status, error=None):
+    image = {'id': name, 'name': name}
+    return PipelineResult(0, image, status, error=error)
+
+
+def test_failures_back_off_then_die(tmp_path):
+    ledger = FailureLedger(str(tmp_path / "failures.sqlite3"), "scope",
+                           max_attempts=3, base_delay=10, max_delay=15)
+    ledger.record(result("a.jpg", STATUS_ERROR, ValueError("bad image")))
+    start = time.time()
+
+    assert ledger.due() == []
+    assert 9 < ledger.next_retry() - start <= 10.5
+    assert [img['name'] for img in ledger.due(start + 10)] == ["a.jpg"]
+
+    ledger.record(result("a.jpg", STATUS_ERROR, ValueError("bad image")))
+    # Doubled to 20s, then capped
+    assert [ledger.delay(n) for n in (1, 2, 3)] == [10, 15, 15]
+    assert 14 < ledger.next_retry() - start <= 15.5
+    ledger.record(result("a.jpg", STATUS_ERROR, ValueError("still bad")))
+
+    assert ledger.counts() == {RETRYING: 0, DEAD: 1}
+    assert ledger.due(start + 3600) == []
+    assert ledger.next_retry() is None
+    [entry] = ledger.entries()
+    assert (entry["errorClass"], entry["attempts"], entry["lastError"]) == (
+        "ValueError", 3, "still bad")
+    ledger.close()
+
+
+def test_success_clears_and_quota_is_ignored(tmp_path):
+    ledger = FailureLedger(str(tmp_path / "failures.sqlite3"), "scope")
+    ledger.record(result("a.jpg", STATUS_ERROR, ValueError("bad image")))
+    ledger.record(result("b.jpg", STATUS_QUOTA))
+
+    assert ledger.counts()[RETRYING] == 1
+    ledger.record(result("a.jpg", STATUS_OK))
+    assert ledger.entries() == []
+    # Other scopes keep their own entries
+    other = FailureLedger(str(tmp_path / "failures.sqlite3"), "other")
+    other.record(result("a.jpg", STATUS_ERROR, ValueError("bad image")))
+    assert ledger.entries() == [] and len(other.entries()) == 1
+    ledger.close()
+    other.close()
+
+
+def test_export_writes_dead_images(tmp_path):
+    ledger = FailureLedger(str(tmp_path / "failures.sqlite3"), "scope",
+                           max_attempts=1)
+    ledger.record(result("a.jpg", STATUS_ERROR, ValueError("bad image")))
+
+    path = str(tmp_path / "dead.csv")
+    assert ledger.export(path) == 1
+    with open(path, encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    assert lines[0].startswith('"fileName","fileId","errorClass"')
+    assert lines[1].startswith('"a.jpg","a.jpg","ValueError","1","bad image"')
+    ledger.close()
+    # Still exportable after close, without keeping a connection open
+    assert ledger.export(path) == 1
+    assert ledger.conn is None
+
+
+def test_retry_run_reprocesses_only_failed_images(card_folder, tmp_path,
+                                                  fake_client, monkeypatch):
+    monkeypatch.setattr(Config, "FAILURE_RETRY_SECONDS", 0.0)
+    models = fake_client.models
+    real_generate = models.generate_content
+    failed = []
+
+    def generate_content(model=None, contents=None, config=None):
+        if len(failed) < 2:
+            failed.append(1)
+            raise Exception("500 INTERNAL: backend error")
+        return real_generate(model=model, contents=contents, config=config)
+
+    models.generate_content = generate_content
+    output = str(tmp_path / "cards.csv")
+    options = dict(local_folder=str(card_folder), output_path=output, workers=1,
+                   downscale=False, use_cache=False, rpm=60000)
+    job = build_job("key", **options)
+    list(job.run())
+    assert len(load_output_file_names(output)) == 3
+    # The job closes its ledger, which can still be read
+    assert job.failures.conn is None
+    assert job.failures.counts() == {RETRYING: 2, DEAD: 0}
+    calls = models.calls
+
+    job = build_job("key", retry_failures=True, **options)
+    results = list(job.run())
+
+    assert len(results) == 2
+    assert all(r.status == STATUS_OK for r in results)
+    assert models.calls == calls + 2
+    assert len(load_output_file_names(output)) == 5
+    assert job.failures.counts() == {RETRYING: 0, DEAD: 0}
@@ -0,0 +1,60 @@
+import time
+
+from src import gemini
+from src.fakes import FakeGenaiClient
+from src.jobs import DONE, STOPPED, BackgroundJob, JobRegistry
+from src.output import load_output_file_names
+from src.runner import build_job
+
+
+def test_stop_writes_the_cards_in_flight(tmp_path, monkeypatch):
+    client = FakeGenaiClient(latency=0.05)
+    monkeypatch.setattr(gemini, "gemini_client", lambda api_key: client)
+    folder = tmp_path / "cards"
+    folder.mkdir()
+    for i in range(40):
+        (folder / f"card{i:02}.jpg").write_bytes(f"card image {i}".encode() * 20)
+    output = str(tmp_path / "cards.csv")
+    job = build_job("key", local_folder=str(folder), output_path=output,
+                    workers=4, batch_size=1, downscale=False, use_cache=False,
+                    rpm=60000)
+    background = BackgroundJob(job).start()
+    while job.completed < 5:
+        time.sleep(0.01)
+
+    background.stop()
+    background.thread.join(10)
+
+    assert background.state == STOPPED
+    assert job.completed < 40
+    # Every card sent to the model was yielded and written
+    assert client.models.calls == job.completed == job.processed
+    assert len(load_output_file_names(output)) == job.processed
+
+
+def test_registry_keeps_finished_jobs_for_a_snapshot(card_folder, tmp_path,
+                                                    fake_client):
+    registry = JobRegistry(keep_finished=1)
+    jobs = []
+    for name in ("a.csv", "b.csv"):
+        job = build_job("key", local_folder=str(card_folder),
+                        output_path=str(tmp_path / name), downscale=False,
+                        use_cache=False, rpm=60000)
+        background = registry.start(job, label=name)
+        background.thread.join(10)
+        jobs.append(background)
+
+    snapshot = registry.get(jobs[1].id).snapshot()
+
+    assert (snapshot["state"], snapshot["label"]) == (DONE, "b.csv")
+    assert (snapshot["completed"], snapshot["processed"]) == (5, 5)
+    assert snapshot["progress"] == 1
+    assert len(snapshot["logs"]) == 5
+    assert snapshot["failures"] == {"retrying": 0, "dead": 0}
+    # The oldest finished job is dropped once another one starts
+    registry.start(build_job("key", local_folder=str(card_folder),
+                             output_path=str(tmp_path / "c.csv"),
+                             downscale=False, use_cache=False,
+                             rpm=60000)).thread.join(10)
+    assert registry.get(jobs[0].id) is None
+    assert len(registry.list()) == 2
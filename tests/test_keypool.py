@@ -0,0 +1,78 @@
+import pytest
+
+from src import keypool
+from src.config import Config
+from src.fakes import FakeGenaiClient
+from src.gemini import GeminiExtractor, QuotaExceeded
+from src.keypool import COOLING, EXHAUSTED, KeyPool
+from src.metrics import Metrics
+from src.runner import build_pipeline
+
+
+def pipeline_rpm(key_pool=None, **options):
+    gemini = GeminiExtractor(client=FakeGenaiClient(), key_pool=key_pool)
+    pipeline = build_pipeline(gemini, lambda image: b"", Metrics(),
+                              use_cache=False, downscale=False, **options)
+    return pipeline.rate.rpm
+
+
+def test_pool_rate_defaults_to_the_keys_total():
+    pool = KeyPool(["k1", "k2", "k3"], rpm=20)
+
+    assert pipeline_rpm(pool) == 60
+    assert pipeline_rpm() == Config.REQUESTS_PER_MINUTE
+
+
+def test_explicit_rpm_caps_the_pool():
+    pool = KeyPool(["k1", "k2", "k3"], rpm=20)
+
+    assert pipeline_rpm(pool, rpm=30) == 30
+    # The keys' own budgets still bound it
+    assert pipeline_rpm(pool, rpm=500) == 60
+    assert pipeline_rpm(rpm=500) == 500
+
+
+def test_calls_rotate_to_the_key_with_most_budget():
+    pool = KeyPool(["k1", "k2", "k3"], rpm=20)
+
+    keys = [pool.acquire() for _ in range(6)]
+
+    assert sorted(keys[:3]) == ["k1", "k2", "k3"]
+    assert sorted(keys[3:]) == ["k1", "k2", "k3"]
+    assert [s["minute_calls"] for s in pool.stats()] == [2, 2, 2]
+
+
+def test_cooling_key_is_skipped():
+    pool = KeyPool(["k1", "k2"], rpm=20)
+
+    pool.report_quota_error("k1", QuotaExceeded("429", retry_after=60))
+
+    assert [pool.acquire() for _ in range(3)] == ["k2"] * 3
+    assert [s["status"] for s in pool.stats()] == [COOLING, "active"]
+
+
+def test_all_keys_exhausted_raises_daily():
+    pool = KeyPool(["k1", "k2"], rpm=20)
+    for key in ("k1", "k2"):
+        pool.report_quota_error(key, QuotaExceeded("daily", daily=True))
+
+    with pytest.raises(QuotaExceeded) as e:
+        pool.acquire()
+
+    assert e.value.daily
+    assert {s["status"] for s in pool.stats()} == {EXHAUSTED}
+
+
+def test_extractor_fails_over_to_the_next_key(monkeypatch):
+    clients = {"k1": FakeGenaiClient(error_rate=1.0), "k2": FakeGenaiClient()}
+    monkeypatch.setattr(keypool, "gemini_client", lambda key: clients[key])
+    pool = KeyPool(["k1", "k2"], rpm=20)
+    gemini = GeminiExtractor(key_pool=pool)
+
+    data = [gemini.extract_data(f"card {i}".encode() * 20, f"card{i}.jpg")
+            for i in range(4)]
+
+    assert all(data)
+    # k1 was tried once, then left to cool down
+    assert clients["k1"].models.calls == 1
+    assert clients["k2"].models.calls == 4
@@ -0,0 +1,90 @@
+import csv
+import json
+
+from src.output import (CSVWriter, SpoolWriter, UpsertWriter, iter_output_rows,
+                        load_output_file_names)
+from src.runner import build_job
+from src.sheets import HEADER
+
+
+def row(name, title=""):
+    return [name, "Ada Lovelace", title] + [""] * (len(HEADER) - 3)
+
+
+def test_spool_exports_csv_and_jsonl(tmp_path):
+    spool = SpoolWriter(str(tmp_path / "spool" / "run.jsonl"))
+    spool.add(row("a.jpg", "Engineer"))
+    spool.add(row("b.jpg", "Analyst, Senior"))
+
+    csv_path = spool.export(str(tmp_path / "cards.csv"))
+    jsonl_path = spool.export(str(tmp_path / "cards.jsonl"))
+    spool.close()
+
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        assert list(csv.reader(f)) == [HEADER, row("a.jpg", "Engineer"),
+                                       row("b.jpg", "Analyst, Senior")]
+    with open(jsonl_path, encoding="utf-8") as f:
+        assert [json.loads(line)["jobTitle"] for line in f] == [
+            "Engineer", "Analyst, Senior"]
+    # The default export goes next to the spool, not over it
+    assert spool.export().endswith("run-export.csv")
+    assert len(list(spool.iter_rows())) == 2
+
+
+def test_spool_resumes_unless_reset(tmp_path):
+    spool_dir = str(tmp_path / "spool")
+    spool = SpoolWriter.for_source(spool_dir, "/cards")
+    spool.add(row("a.jpg"))
+    spool.close()
+
+    spool = SpoolWriter.for_source(spool_dir, "/cards")
+    spool.add(row("b.jpg"))
+    assert [r[0] for r in spool.iter_rows()] == ["a.jpg", "b.jpg"]
+    spool.close()
+
+    assert SpoolWriter.for_source(spool_dir, "/other").path != spool.path
+    spool = SpoolWriter.for_source(spool_dir, "/cards", reset=True)
+    assert list(spool.iter_rows()) == []
+    spool.close()
+
+
+def test_spool_skips_a_truncated_last_line(tmp_path):
+    spool = SpoolWriter(str(tmp_path / "run.jsonl"))
+    spool.add(row("a.jpg"))
+    spool.file.write('{"fileName": "b.jp')
+    spool.close()
+
+    assert [r[0] for r in SpoolWriter(spool.path).iter_rows()] == ["a.jpg"]
+
+
+def test_upsert_keeps_the_newest_row_per_name(tmp_path):
+    path = str(tmp_path / "cards.csv")
+    writer = CSVWriter(path)
+    writer.add(row("a.jpg", "Engineer"))
+    writer.add(row("b.jpg", "Analyst"))
+    writer.close()
+
+    writer = UpsertWriter(CSVWriter(path), load_output_file_names(path))
+    writer.add(row("a.jpg", "CTO"))
+    writer.add(row("c.jpg", "Designer"))
+    writer.close()
+
+    assert writer.rows_replaced == 1
+    assert [(r[0], r[2]) for r in iter_output_rows(path)] == [
+        ("b.jpg", "Analyst"), ("a.jpg", "CTO"), ("c.jpg", "Designer")]
+
+
+def test_run_without_output_spools_and_resumes(card_folder, fake_client):
+    options = dict(local_folder=str(card_folder), downscale=False,
+                   use_cache=False, rpm=60000)
+    job = build_job("key", **options)
+    assert len(list(job.run())) == 5
+    assert len(list(job.writer.iter_rows())) == 5
+
+    (card_folder / "card5.jpg").write_bytes(b"a new card" * 20)
+    job = build_job("key", **options)
+    results = list(job.run())
+
+    assert [r.file_name for r in results] == ["card5.jpg"]
+    names = [r[0] for r in job.writer.iter_rows()]
+    assert sorted(names) == [f"card{i}.jpg" for i in range(6)]
@@ -0,0 +1,57 @@
+from src.fakes import FakeGenaiClient, fake_card_data
+from src.gemini import GeminiExtractor
+from src.pipeline import STATUS_ERROR, STATUS_OK, ExtractionPipeline
+
+
+def make_images(count):
+    return [{'id': str(i), 'name': f"card{i}.jpg"} for i in range(count)]
+
+
+def load_image(image):
+    return f"image {image['id']}".encode() * 20
+
+
+def run(images, **options):
+    # Random latency makes later calls finish before earlier ones
+    client = FakeGenaiClient(latency=0.001, jitter=0.02, seed=7)
+    pipeline = ExtractionPipeline(GeminiExtractor(client=client), load_image,
+                                  rpm=None, **options)
+    return list(pipeline.run(images))
+
+
+def test_results_come_back_in_input_order():
+    images = make_images(40)
+    results = run(images, workers=8)
+
+    assert [r.file_name for r in results] == [img['name'] for img in images]
+    assert all(r.status == STATUS_OK for r in results)
+    for image, result in zip(images, results):
+        expected = fake_card_data(load_image(image))
+        assert result.row[0] == image['name']
+        assert result.row[1] == expected["fullName"]
+
+
+def test_batched_results_come_back_in_input_order():
+    images = make_images(23)
+    results = run(images, workers=4, batch_size=5)
+
+    assert [r.index for r in results] == list(range(23))
+    assert [r.row[0] for r in results] == [img['name'] for img in images]
+
+
+def test_load_errors_keep_their_place():
+    images = make_images(6)
+
+    def flaky_load(image):
+        if image['id'] == "2":
+            raise OSError("unreadable")
+        return load_image(image)
+
+    pipeline = ExtractionPipeline(GeminiExtractor(client=FakeGenaiClient()),
+                                  flaky_load, workers=3, rpm=None)
+    results = list(pipeline.run(images))
+
+    assert [r.index for r in results] == list(range(6))
+    assert results[2].status == STATUS_ERROR
+    assert isinstance(results[2].error, OSError)
+    assert all(r.status == STATUS_OK for i, r in enumerate(results) if i != 2)
@@ -0,0 +1,51 @@
+import io
+
+from PIL import Image
+
+from src.preprocess import ImagePreprocessor, detect_mime_type, preprocess_image
+
+
+def encode(img, fmt, **options):
+    buffer = io.BytesIO()
+    img.save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+
+def test_large_images_are_downscaled_to_jpeg():
+    png = encode(Image.new("RGB", (3200, 2000), "white"), "PNG")
+
+    data, mime_type = preprocess_image(png, max_edge=800)
+
+    assert mime_type == "image/jpeg"
+    with Image.open(io.BytesIO(data)) as img:
+        assert img.size == (800, 500)
+
+
+def test_exif_rotation_is_applied():
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Rotated 90 degrees clockwise
+    jpeg = encode(Image.new("RGB", (40, 20), "white"), "JPEG", exif=exif)
+
+    data, _ = preprocess_image(jpeg, max_edge=800)
+
+    with Image.open(io.BytesIO(data)) as img:
+        assert img.size == (20, 40)
+
+
+def test_small_images_are_sent_unchanged():
+    png = encode(Image.new("L", (30, 20), "white"), "PNG")
+
+    assert preprocess_image(png, max_edge=800) == (png, "image/png")
+    assert detect_mime_type(encode(Image.new("RGB", (4, 4)), "WEBP")) == "image/webp"
+
+
+def test_undecodable_images_pass_through():
+    preprocessor = ImagePreprocessor(max_edge=800, processes=1)
+    png = encode(Image.new("RGB", (1600, 1000), "white"), "PNG")
+    try:
+        assert preprocessor(b"not an image") == (b"not an image", "image/jpeg")
+        data, _ = preprocessor(png)
+    finally:
+        preprocessor.close()
+
+    assert preprocessor.bytes_saved == len(png) - len(data) > 0
@@ -0,0 +1,76 @@
+import pytest
+
+from src.gemini import QuotaExceeded
+from src.ratecontrol import AdaptiveRateController
+
+
+def flaky(failures, error):
+    """A call that raises `error` `failures` times, then returns "ok"."""
+    calls = {"count": 0}
+
+    def fn():
+        calls["count"] += 1
+        if calls["count"] <= failures:
+            raise error
+        return "ok"
+
+    return fn, calls
+
+
+def test_429_halves_rate_and_concurrency_then_retries():
+    control = AdaptiveRateController(rpm=60000, concurrency=8, base_delay=0.01,
+                                     max_delay=0.01)
+    fn, calls = flaky(1, QuotaExceeded("429", retry_after=0.01))
+
+    assert control.call(fn) == "ok"
+
+    assert calls["count"] == 2
+    stats = control.stats()
+    assert stats["retries"] == 1
+    assert stats["concurrency"] == 4
+    # Halved, then one success added back
+    assert stats["rpm"] == 30000 + AdaptiveRateController.INCREASE_RPM
+    assert stats["throttle_seconds"] > 0
+
+
+def test_successes_raise_rate_and_concurrency():
+    control = AdaptiveRateController(rpm=60000, concurrency=2, max_concurrency=3,
+                                     base_delay=0.01, max_delay=0.01)
+    control.call(flaky(1, QuotaExceeded("429"))[0])
+    assert control.stats()["concurrency"] == 1
+
+    for _ in range(AdaptiveRateController.SUCCESSES_PER_SLOT):
+        control.call(lambda: None)
+
+    assert control.stats()["concurrency"] == 2
+    assert control.stats()["rpm"] == 30000 + 11 * AdaptiveRateController.INCREASE_RPM
+
+
+def test_rate_never_recovers_past_the_start():
+    control = AdaptiveRateController(rpm=60000)
+
+    control.call(lambda: None)
+
+    assert control.stats()["rpm"] == 60000
+
+
+def test_daily_quota_is_not_retried():
+    control = AdaptiveRateController(rpm=60000, base_delay=0.01)
+    fn, calls = flaky(5, QuotaExceeded("daily", daily=True))
+
+    with pytest.raises(QuotaExceeded):
+        control.call(fn)
+
+    assert calls["count"] == 1
+    assert control.stats()["retries"] == 0
+
+
+def test_gives_up_after_max_retries():
+    control = AdaptiveRateController(rpm=60000, max_retries=2, base_delay=0.001,
+                                     max_delay=0.001)
+    fn, calls = flaky(10, QuotaExceeded("429"))
+
+    with pytest.raises(QuotaExceeded):
+        control.call(fn)
+
+    assert calls["count"] == 3
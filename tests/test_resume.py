@@ -0,0 +1,49 @@
+import csv
+
+from src.output import load_output_file_names
+from src.resume import filter_pending, iter_pending
+from src.runner import build_job
+
+
+def test_filter_pending_drops_done_names():
+    images = [{'id': str(i), 'name': f"card{i}.jpg"} for i in range(4)]
+
+    pending, skipped = filter_pending(images, {"card1.jpg", "card3.jpg"})
+
+    assert [img['name'] for img in pending] == ["card0.jpg", "card2.jpg"]
+    assert skipped == 2
+    assert list(iter_pending(iter(images), {"card0.jpg"})) == images[1:]
+
+
+def test_rerun_only_extracts_missing_images(card_folder, tmp_path, fake_client):
+    output = str(tmp_path / "cards.csv")
+    options = dict(local_folder=str(card_folder), output_path=output,
+                   downscale=False, use_cache=False, rpm=60000)
+
+    job = build_job("key", **options)
+    assert len(list(job.run())) == 5
+    calls = fake_client.models.calls
+
+    (card_folder / "card5.jpg").write_bytes(b"a new card" * 20)
+    job = build_job("key", **options)
+    results = list(job.run())
+
+    assert job.skipped == 5
+    assert [r.file_name for r in results] == ["card5.jpg"]
+    assert fake_client.models.calls == calls + 1
+    with open(output, newline="", encoding="utf-8") as f:
+        names = [row[0] for row in csv.reader(f)][1:]
+    assert sorted(names) == [f"card{i}.jpg" for i in range(6)]
+    assert load_output_file_names(output) == set(names)
+
+
+def test_no_resume_extracts_everything_again(card_folder, tmp_path, fake_client):
+    output = str(tmp_path / "cards.jsonl")
+    options = dict(local_folder=str(card_folder), output_path=output,
+                   downscale=False, use_cache=False, rpm=60000)
+    list(build_job("key", **options).run())
+
+    job = build_job("key", resume=False, **options)
+
+    assert job.skipped == 0
+    assert len(list(job.run())) == 5
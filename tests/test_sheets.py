@@ -0,0 +1,91 @@
+from types import SimpleNamespace
+
+import pytest
+
+from src import runner
+from src.fakes import FakeWorksheet
+from src.runner import build_job
+from src.sheets import HEADER, BufferedSheetWriter, SheetSyncWriter
+
+
+def row(name, title=""):
+    return [name, "Ada Lovelace", title] + [""] * (len(HEADER) - 3)
+
+
+def test_buffered_writer_appends_in_batches():
+    sheet = FakeWorksheet([HEADER])
+    flushed = []
+    writer = BufferedSheetWriter(sheet, max_rows=3, on_flush=flushed.append)
+
+    for i in range(7):
+        writer.add(row(f"card{i}.jpg"))
+    writer.close()
+
+    assert sheet.writes == 3
+    assert [len(rows) for rows in flushed] == [3, 3, 1]
+    assert [r[0] for r in sheet.rows[1:]] == [f"card{i}.jpg" for i in range(7)]
+
+
+def test_failed_flush_keeps_rows_pending(tmp_path):
+    sheet = FakeWorksheet([HEADER], error_rate=1.0)
+    writer = BufferedSheetWriter(sheet, max_rows=10)
+    writer.add(row("a.jpg"))
+
+    with pytest.raises(Exception, match="429"):
+        writer.close()
+
+    assert writer.pending == [row("a.jpg")]
+    path = writer.dump_pending(str(tmp_path / "unsaved.csv"))
+    with open(path, encoding="utf-8") as f:
+        assert f.read().splitlines()[1].startswith('"a.jpg"')
+
+
+def test_sync_updates_changed_rows_and_appends_new_ones():
+    sheet = FakeWorksheet([HEADER, row("a.jpg", "Engineer"), row("b.jpg", "Analyst")])
+    writer = SheetSyncWriter(sheet)
+
+    writer.add(row("a.jpg", "CTO"))
+    writer.add(row("b.jpg", "Analyst"))
+    writer.add(row("c.jpg", "Designer"))
+    writer.close()
+
+    assert writer.rows_updated == writer.rows_appended == writer.rows_unchanged == 1
+    assert [(r[0], r[2]) for r in sheet.rows[1:]] == [
+        ("a.jpg", "CTO"), ("b.jpg", "Analyst"), ("c.jpg", "Designer")]
+    # One batch_update and one append_rows
+    assert sheet.writes == 2
+
+
+def test_sync_updates_rows_it_appended_earlier():
+    sheet = FakeWorksheet([HEADER])
+    writer = SheetSyncWriter(sheet, max_rows=1)
+
+    writer.add(row("a.jpg", "Engineer"))
+    writer.add(row("b.jpg", "Analyst"))
+    writer.add(row("a.jpg", "CTO"))
+    writer.close()
+
+    assert [(r[0], r[2]) for r in sheet.rows[1:]] == [
+        ("a.jpg", "CTO"), ("b.jpg", "Analyst")]
+    assert writer.rows_updated == 1
+
+
+def test_sheet_run_skips_names_already_in_the_sheet(card_folder, fake_client,
+                                                   monkeypatch):
+    sheet = FakeWorksheet()
+    monkeypatch.setattr(runner.clients, "spreadsheet",
+                        lambda credentials, title: SimpleNamespace(sheet1=sheet))
+    options = dict(local_folder=str(card_folder), sheet_title="Cards",
+                   downscale=False, use_cache=False, rpm=60000)
+    list(build_job("key", **options).run())
+    assert sheet.rows[0] == HEADER and len(sheet.rows) == 6
+    calls = fake_client.models.calls
+
+    (card_folder / "card5.jpg").write_bytes(b"a new card" * 20)
+    job = build_job("key", **options)
+    results = list(job.run())
+
+    assert job.skipped == 5
+    assert [r.file_name for r in results] == ["card5.jpg"]
+    assert fake_client.models.calls == calls + 1
+    assert [r[0] for r in sheet.rows[1:]] == [f"card{i}.jpg" for i in range(6)]
@@ -0,0 +1,95 @@
+import os
+
+from src import runner
+from src.local import list_local_images
+from src.runner import build_job
+from src.watch import FolderWatcher, LocalIndex
+
+
+def test_subfolders_are_opt_in(card_folder):
+    (card_folder / "scans").mkdir()
+    (card_folder / "scans" / "card5.jpg").write_bytes(b"a scanned card" * 20)
+
+    assert len(list_local_images(str(card_folder))) == 5
+    names = {img['name'] for img in list_local_images(str(card_folder), True)}
+    assert "scans/card5.jpg" in names and len(names) == 6
+
+
+def test_incremental_run_lists_the_folder_once(card_folder, tmp_path,
+                                               fake_client, monkeypatch):
+    def no_listing(*args, **kwargs):
+        raise AssertionError("folder listed outside the FolderWatcher scan")
+
+    monkeypatch.setattr(runner, "list_local_images", no_listing)
+    job = build_job("key", local_folder=str(card_folder),
+                    output_path=str(tmp_path / "cards.csv"), incremental=True,
+                    downscale=False, use_cache=False, rpm=60000)
+
+    assert len(list(job.run())) == 5
+
+
+def overwrite(folder, name, data):
+    """Rewrites a file in place, keeping its folder's mtime."""
+    folder_mtime = os.stat(folder).st_mtime_ns
+    (folder / name).write_bytes(data)
+    os.utime(folder, ns=(folder_mtime, folder_mtime))
+
+
+def polling_watcher(folder, tmp_path, **options):
+    watcher = FolderWatcher(
+        str(folder), LocalIndex(str(tmp_path / "index.sqlite3")),
+        settle_seconds=0, use_inotify=False, **options)
+    for image in watcher.scan():
+        watcher.mark_done(image)
+    return watcher
+
+
+def test_polling_finds_files_overwritten_in_place(card_folder, tmp_path):
+    watcher = polling_watcher(card_folder, tmp_path)
+    assert watcher.wait(timeout=0) == []
+
+    overwrite(card_folder, "card2.jpg", b"a reprinted card" * 20)
+
+    assert [img['name'] for img in watcher.wait(timeout=0)] == ["card2.jpg"]
+
+
+def test_sweep_stats_a_few_files_per_poll(card_folder, tmp_path, monkeypatch):
+    watcher = polling_watcher(card_folder, tmp_path, sweep_files=2)
+    overwrite(card_folder, "card4.jpg", b"a reprinted card" * 20)
+    stats = []
+    real_stat = os.stat
+
+    def counting_stat(path, *args, **kwargs):
+        stats.append(str(path))
+        return real_stat(path, *args, **kwargs)
+
+    monkeypatch.setattr(os, "stat", counting_stat)
+    found = []
+    for _ in range(3):
+        stats.clear()
+        found += watcher.wait(timeout=0)
+        # The folder itself, plus at most two of its images
+        assert len(stats) <= 3
+
+    assert [img['name'] for img in found] == ["card4.jpg"]
+
+
+def test_polling_scan_lists_the_tree_once(card_folder, tmp_path, monkeypatch):
+    (card_folder / "scans").mkdir()
+    (card_folder / "scans" / "card5.jpg").write_bytes(b"a scanned card" * 20)
+    listed = []
+    real_scandir = os.scandir
+
+    def counting_scandir(path):
+        listed.append(str(path))
+        return real_scandir(path)
+
+    monkeypatch.setattr(os, "scandir", counting_scandir)
+    watcher = FolderWatcher(
+        str(card_folder), LocalIndex(str(tmp_path / "index.sqlite3")),
+        recursive=True, use_inotify=False)
+
+    names = [img['name'] for img in watcher.scan()]
+
+    assert names == [f"card{i}.jpg" for i in range(5)] + ["scans/card5.jpg"]
+    assert sorted(listed) == [str(card_folder), str(card_folder / "scans")]
@@ -0,0 +1,143 @@
+import multiprocessing
+import sqlite3
+import time
+
+from src.fakes import FakeGenaiClient
+from src.gemini import GeminiExtractor
+from src.pipeline import ExtractionPipeline
+from src.runner import QueueWorker
+from src.workqueue import DONE, FAILED, LEASED, PENDING, WorkQueue
+
+
+def make_queue(tmp_path, count=3, **options):
+    queue = WorkQueue(str(tmp_path / "queue.sqlite3"), **options)
+    queue.add({'id': str(i), 'name': f"card{i}.jpg"} for i in range(count))
+    return queue
+
+
+def drain(path, worker, results):
+    """Worker process: its own connection, as on another host."""
+    queue = WorkQueue(path)
+    while True:
+        images = queue.claim(worker, limit=2)
+        if not images:
+            break
+        for image in images:
+            if queue.complete(image['id'], image['lease'], [image['name'], worker]):
+                results.put((image['id'], worker))
+    queue.close()
+
+
+def test_queue_file_does_not_use_wal(tmp_path):
+    queue = make_queue(tmp_path)
+    conn = sqlite3.connect(queue.path)
+
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+    conn.close()
+
+
+def test_workers_in_separate_processes_share_the_queue(tmp_path):
+    queue = make_queue(tmp_path, count=60)
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    workers = [context.Process(target=drain, args=(queue.path, f"host{i}", results))
+               for i in range(4)]
+    for worker in workers:
+        worker.start()
+    done = [results.get(timeout=60) for _ in range(60)]
+    for worker in workers:
+        worker.join(60)
+
+    # Every image was completed once, under the lease it was claimed with
+    assert sorted(int(image_id) for image_id, _ in done) == list(range(60))
+    assert queue.counts()[DONE] == 60
+    assert {row[0]: row[1] for row in queue.iter_rows()} == {
+        f"card{image_id}.jpg": worker for image_id, worker in done}
+
+
+def test_claims_do_not_overlap(tmp_path):
+    queue = make_queue(tmp_path, count=5)
+
+    first = queue.claim("a", limit=3)
+    second = queue.claim("b", limit=3)
+
+    assert [img['name'] for img in first] == ["card0.jpg", "card1.jpg", "card2.jpg"]
+    assert [img['name'] for img in second] == ["card3.jpg", "card4.jpg"]
+    assert first[0]['lease'] != second[0]['lease']
+    assert queue.workers() == {"a": 3, "b": 2}
+    assert queue.claim("c") == []
+
+
+def test_complete_and_fail_need_the_current_lease(tmp_path):
+    queue = make_queue(tmp_path, count=2)
+    done, failed = queue.claim("a", limit=2)
+
+    assert queue.complete(done['id'], done['lease'], ["card0.jpg", "Person"])
+    assert queue.fail(failed['id'], failed['lease'], "boom") == PENDING
+    # Already recorded: the lease is gone
+    assert not queue.complete(done['id'], done['lease'], ["card0.jpg", "Other"])
+    assert queue.fail(failed['id'], failed['lease'], "boom") is None
+
+    assert queue.counts() == {PENDING: 1, LEASED: 0, DONE: 1, FAILED: 0}
+    assert list(queue.iter_rows()) == [["card0.jpg", "Person"]]
+
+
+def test_expired_lease_cannot_overwrite_new_holder(tmp_path):
+    queue = make_queue(tmp_path, count=1, lease_seconds=0.05)
+    (stale,) = queue.claim("slow")
+    time.sleep(0.1)
+    (fresh,) = queue.claim("fast")
+
+    assert fresh['id'] == stale['id']
+    assert not queue.complete(stale['id'], stale['lease'], ["card0.jpg", "Stale"])
+    assert queue.fail(stale['id'], stale['lease'], "late error") is None
+    assert queue.complete(fresh['id'], fresh['lease'], ["card0.jpg", "Fresh"])
+    assert list(queue.iter_rows()) == [["card0.jpg", "Fresh"]]
+
+
+def test_renew_keeps_a_lease_alive(tmp_path):
+    queue = make_queue(tmp_path, count=1, lease_seconds=0.2)
+    (image,) = queue.claim("a")
+    time.sleep(0.1)
+    assert queue.renew("a") == 1
+    time.sleep(0.15)
+
+    assert queue.claim("b") == []
+    assert queue.complete(image['id'], image['lease'], ["card0.jpg"])
+
+
+def test_attempts_run_out(tmp_path):
+    queue = make_queue(tmp_path, count=1, max_attempts=2)
+
+    for expected in (PENDING, FAILED):
+        (image,) = queue.claim("a")
+        assert queue.fail(image['id'], image['lease'], "boom") == expected
+
+    assert queue.claim("a") == []
+    assert queue.failures() == [("card0.jpg", 2, "boom")]
+    assert queue.retry_failed() == 1
+    assert len(queue.claim("a")) == 1
+
+
+def test_release_returns_images_without_using_a_try(tmp_path):
+    queue = make_queue(tmp_path, count=2, max_attempts=1)
+    queue.claim("a", limit=2)
+
+    assert queue.release("a") == 2
+    images = queue.claim("b", limit=2)
+    assert len(images) == 2
+    assert queue.fail(images[0]['id'], images[0]['lease'], "boom") == FAILED
+
+
+def test_worker_records_every_image(tmp_path):
+    queue = make_queue(tmp_path, count=7)
+    pipeline = ExtractionPipeline(GeminiExtractor(client=FakeGenaiClient()),
+                                  lambda image: image['id'].encode() * 30,
+                                  rpm=None)
+    worker = QueueWorker(queue, pipeline, poll_seconds=0.01)
+
+    assert len(list(worker.run())) == 7
+    assert queue.counts()[DONE] == 7
+    assert worker.lost_leases == 0
+    assert sorted(row[0] for row in queue.iter_rows()) == [
+        f"card{i}.jpg" for i in range(7)]
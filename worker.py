@@ -0,0 +1,201 @@
+"""
+Shared work queue: split one large folder between several worker
+processes, on one machine or on several machines sharing the queue file
+(e.g. on an NFS or SMB share).
+
+Fill the queue once, start as many workers as your keys allow, then
+export the results:
+
+    python worker.py fill --local /data/cards
+    python worker.py work --api-key KEY_ONE        # one per key / machine
+    python worker.py status
+    python worker.py export cards.csv
+
+A worker that crashes leaves its images leased; the lease expires after
+QUEUE_LEASE_SECONDS and another worker takes them over. Use --queue (or
+QUEUE_PATH) to pick the queue file.
+"""
+import argparse
+import json
+import sys
+
+from src.config import Config
+from src.output import export_rows
+from src.pipeline import STATUS_DUPLICATE, STATUS_EMPTY, STATUS_OK, STATUS_QUOTA
+from src.runner import build_worker, fill_queue, open_queue
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Share one folder's extraction between worker processes.")
+    parser.add_argument("--queue", default=Config.QUEUE_PATH,
+                        help="Queue database (default: QUEUE_PATH)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    fill = commands.add_parser("fill", help="Queue a folder's images")
+    source = fill.add_mutually_exclusive_group(required=True)
+    source.add_argument("--local", metavar="FOLDER",
+                        help="Local folder with card images (must be readable "
+                             "at the same path by every worker)")
+    source.add_argument("--drive", metavar="FOLDER_ID",
+                        help="Google Drive folder ID")
+    fill.add_argument("--service-account", metavar="JSON",
+                      help="Service account JSON file (default: SERVICE_ACCOUNT_FILE)")
+    fill.add_argument("--recursive", action="store_true",
+                      default=Config.LOCAL_RECURSIVE,
+                      help="With --local: include images in subfolders "
+                           "(default: LOCAL_RECURSIVE)")
+
+    work = commands.add_parser("work", help="Process queued images")
+    work.add_argument("--api-key", default=Config.GEMINI_API_KEYS,
+                      help="Gemini API key(s) for this worker "
+                           "(default: GEMINI_API_KEYS / GEMINI_API_KEY)")
+    work.add_argument("--service-account", metavar="JSON",
+                      help="Service account JSON file (default: SERVICE_ACCOUNT_FILE)")
+    work.add_argument("--worker-id",
+                      help="Name shown in status (default: host-pid)")
+    work.add_argument("--workers", type=int, default=Config.MAX_WORKERS)
+    work.add_argument("--rpm", type=int,
+                      help="Gemini requests per minute for this worker "
+                           "(default: REQUESTS_PER_MINUTE, or KEY_RPM per key "
+                           "with several keys, which it can lower but not raise)")
+    work.add_argument("--batch-size", type=int, default=Config.BATCH_SIZE,
+                      help="Cards per Gemini request")
+    work.add_argument("--no-cache", action="store_true",
+                      help="Do not reuse cached extraction results")
+    work.add_argument("--no-downscale", action="store_true",
+                      help="Send original images without preprocessing")
+    work.add_argument("--no-adaptive", action="store_true",
+                      help="Stop on the first 429 instead of backing off")
+    work.add_argument("--context-cache", action="store_true",
+                      default=Config.CONTEXT_CACHE,
+                      help="Send the extraction instructions, with a detailed "
+                           "field guide and examples, as Gemini cached content "
+                           "(default: CONTEXT_CACHE)")
+    work.add_argument("--cascade", action="store_true", default=Config.CASCADE,
+                      help="Re-run cards whose result fails validation on "
+                           "ESCALATION_MODEL (default: CASCADE)")
+    work.add_argument("--quiet", action="store_true",
+                      help="Only print the final summary")
+
+    status = commands.add_parser("status", help="Show queue progress")
+    status.add_argument("--failures", type=int, default=10,
+                        help="Failed images to list")
+
+    export = commands.add_parser("export", help="Write done rows to a file")
+    export.add_argument("output", help="Output file (.csv, .jsonl or .parquet)")
+    export.add_argument("--format", choices=["csv", "jsonl", "parquet"],
+                        help="Output format (default: from the extension)")
+
+    commands.add_parser("retry-failed", help="Queue failed images again")
+    return parser.parse_args(argv)
+
+
+def load_credentials_dict(path):
+    if not path:
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def run_fill(args):
+    queue, added = fill_queue(args.queue, args.local, args.drive,
+                              load_credentials_dict(args.service_account),
+                              recursive=args.recursive)
+    counts = queue.counts()
+    print(f"Queued {added} new images ({sum(counts.values())} in {args.queue}).")
+    return 0
+
+
+def run_work(args):
+    if not args.api_key:
+        print("A Gemini API key is required (--api-key or GEMINI_API_KEY)",
+              file=sys.stderr)
+        return 1
+
+    worker = build_worker(
+        args.queue, args.api_key,
+        credentials_dict=load_credentials_dict(args.service_account),
+        workers=args.workers,
+        rpm=args.rpm,
+        batch_size=args.batch_size,
+        use_cache=not args.no_cache,
+        downscale=not args.no_downscale,
+        adaptive=not args.no_adaptive,
+        worker_id=args.worker_id,
+        context_cache=args.context_cache,
+        cascade=args.cascade
+    )
+    print(f"Worker {worker.worker_id} started on {args.queue}")
+    try:
+        for result in worker.run():
+            if args.quiet:
+                continue
+            prefix = f"[{worker.worker_id} #{worker.completed}]"
+            if result.status in (STATUS_OK, STATUS_DUPLICATE):
+                suffix = " (cached)" if result.cached else ""
+                print(f"{prefix} OK {result.file_name}{suffix}")
+            elif result.status == STATUS_EMPTY:
+                print(f"{prefix} EMPTY {result.file_name}")
+            elif result.status == STATUS_QUOTA:
+                print(f"{prefix} QUOTA {result.file_name} - stopping")
+            else:
+                print(f"{prefix} ERROR {result.file_name}: {result.error}")
+    except KeyboardInterrupt:
+        print("Interrupted; unfinished images were released to the queue.")
+
+    counts = worker.queue.counts()
+    print(f"Worker done: {worker.processed} extracted, {worker.errors} errors. "
+          f"Queue: {counts['done']} done, {counts['pending']} pending, "
+          f"{counts['leased']} leased, {counts['failed']} failed.")
+    if worker.lost_leases:
+        print(f"{worker.lost_leases} results were not recorded because their "
+              f"lease had expired; raise QUEUE_LEASE_SECONDS if this repeats.")
+    return 2 if worker.quota_exceeded else 0
+
+
+def run_status(args):
+    queue = open_queue(args.queue)
+    counts = queue.counts()
+    total = sum(counts.values())
+    finished = counts["done"] + counts["failed"]
+    print(f"{finished}/{total} finished ({finished / max(total, 1):.0%}): "
+          + ", ".join(f"{count} {state}" for state, count in counts.items()))
+    for worker, leased in sorted(queue.workers().items()):
+        print(f"  {worker}: {leased} leased")
+    failures = queue.failures(args.failures)
+    if failures:
+        print("Failed:")
+        for name, attempts, error in failures:
+            print(f"  {name} ({attempts} tries): {error}")
+    return 0
+
+
+def run_export(args):
+    queue = open_queue(args.queue)
+    path = export_rows(queue.iter_rows(), args.output, args.format)
+    print(f"Exported {queue.counts()['done']} rows to {path}")
+    return 0
+
+
+def run_retry_failed(args):
+    print(f"Queued {open_queue(args.queue).retry_failed()} failed images again.")
+    return 0
+
+
+COMMANDS = {
+    "fill": run_fill,
+    "work": run_work,
+    "status": run_status,
+    "export": run_export,
+    "retry-failed": run_retry_failed,
+}
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    return COMMANDS[args.command](args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())